@@ -1,12 +1,123 @@
 import logging  # Будем вести лог
-from collections import defaultdict, OrderedDict, deque  # Словари и очередь
+from collections import defaultdict, deque  # Словарь и очередь
+from threading import Thread, Event as ThreadingEvent, Lock  # Поток сверки портфеля
 
 from backtrader import BrokerBase, Order as BTOrder, BuyOrder, SellOrder
 from backtrader.position import Position as BTPosition
 from backtrader.utils.py3 import with_metaclass
 
 from FinLabPy.BackTrader import Store, Data  # Хранилище и данные для BackTrader
-from FinLabPy.Core import Order as FLOrder, Trade as FLTrade, Position as FLPosition   # Заявка, сделка, позиция
+from FinLabPy.Core import Broker as FLBroker, Order as FLOrder, OrderRegistry, Trade as FLTrade, Position as FLPosition   # Брокер, заявка, справочник заявок, сделка, позиция
+from FinLabPy.Schedule.MOEX import futures_boards  # Режимы торгов срочного рынка
+
+
+class PortfolioState:
+    """Состояние портфеля: свободные средства и стоимость. Обновляется по сделкам и позициям из подписки без запросов к брокеру.
+    Сверяется с брокером в отдельном потоке, чтобы учесть комиссии, вариационную маржу, гарантийное обеспечение и сделки, пропущенные подпиской"""
+    reconcile_retry_seconds = 1.0  # Пауза перед повторной сверкой, если во время запросов к брокеру пришли сделки или позиции
+
+    def __init__(self, broker: FLBroker, reconcile_seconds: float = 60):
+        """
+        :param broker: Брокер
+        :param reconcile_seconds: Период сверки с брокером в секундах. 0 - не сверять
+        """
+        self.broker = broker  # Брокер
+        self.reconcile_seconds = reconcile_seconds  # Период сверки с брокером в секундах
+        self.logger = logging.getLogger(f'PortfolioState.{broker.code}')  # Будем вести лог
+        self.lock = Lock()  # Блокировка состояния. События приходят из потоков подписок брокера
+        self.cash = 0.0  # Свободные средства
+        self.positions: dict[str, list[float]] = {}  # Позиции. Ключ - название тикера, значение - [кол-во в штуках, последняя цена]
+        self.other = 0.0  # Стоимость портфеля, не объясненная позициями и свободными средствами (вариационная маржа, НКД, ...). Обновляется при сверке
+        self.drift = 0.0  # Расхождение стоимости портфеля с брокером при последней сверке
+        self.sequence = 0  # Номер последнего события подписки (сделки, позиции). По нему сверка узнает, что состояние изменилось во время запросов к брокеру
+        self.stop_event = ThreadingEvent()  # Событие остановки потока сверки
+        self.thread: Thread | None = None  # Поток сверки
+        self.reconcile()  # Начальное состояние получаем от брокера
+
+    @property
+    def value(self) -> float:
+        """Стоимость портфеля"""
+        with self.lock:
+            return self.cash + sum(quantity * price for quantity, price in self.positions.values()) + self.other
+
+    def start(self) -> None:
+        """Подписка на сделки и позиции, запуск потока сверки"""
+        self.broker.on_trade.subscribe(self.on_trade)  # Сделки меняют свободные средства и позиции
+        self.broker.on_position.subscribe(self.on_position)  # Позиции меняют стоимость портфеля
+        if self.reconcile_seconds and self.thread is None:  # Если сверка нужна, и поток еще не запущен
+            self.stop_event.clear()
+            self.thread = Thread(target=self._reconcile_thread, name=f'PortfolioState{self.broker.code}', daemon=True)  # Поток сверки
+            self.thread.start()
+
+    def stop(self) -> None:
+        """Отмена подписок и остановка потока сверки"""
+        self.broker.on_trade.unsubscribe(self.on_trade)
+        self.broker.on_position.unsubscribe(self.on_position)
+        if self.thread is not None:  # Если поток сверки запущен
+            self.stop_event.set()  # то останавливаем его
+            self.thread.join()
+            self.thread = None
+
+    def reconcile(self) -> bool:
+        """Сверка с брокером. Запросы выполняются вне блокировки, чтобы не задерживать getcash/getvalue.
+        Если во время запросов пришли сделки или позиции, то снимок брокера мог их не учесть. Тогда снимок не применяется
+
+        :return: True - снимок применен, False - состояние изменилось во время запросов, сверку нужно повторить
+        """
+        with self.lock:
+            sequence = self.sequence  # Номер последнего события до запросов к брокеру
+        cash = self.broker.get_cash()  # Свободные средства
+        value = self.broker.get_value()  # Стоимость портфеля
+        positions = {position.dataname: [position.quantity, position.current_price] for position in self.broker.get_positions()}  # Позиции
+        with self.lock:
+            if self.sequence != sequence:  # Если во время запросов пришли события подписки
+                self.logger.debug('Сверка с брокером пропущена: состояние изменилось во время запросов')
+                return False  # то состояние не переписываем, чтобы не потерять их
+            drift = value - (self.cash + sum(quantity * price for quantity, price in self.positions.values()) + self.other)  # Расхождение состояния с брокером
+            self.cash, self.positions = cash, positions
+            self.other = value - cash - sum(quantity * price for quantity, price in positions.values())
+            self.drift = drift
+        self.logger.debug(f'Сверка с брокером: свободные средства {cash:.2f}, стоимость {value:.2f}, расхождение {drift:.2f}')
+        return True
+
+    def on_trade(self, trade: FLTrade) -> None:
+        """Сделка: деньги переходят в позицию по цене сделки. Стоимость портфеля не меняется до изменения цены.
+        По производным инструментам деньги не платятся. Гарантийное обеспечение и вариационную маржу учтет сверка с брокером"""
+        with self.lock:
+            self.sequence += 1
+            if self._is_derivative(trade.dataname):  # Если сделка по фьючерсу или опциону
+                self.other -= trade.quantity * trade.price  # то стоимость контрактов в стоимость портфеля не входит. Меняется только вместе с ценой
+            else:  # Если сделка по бумаге
+                self.cash -= trade.quantity * trade.price  # то покупка уменьшает свободные средства, продажа увеличивает
+            position = self.positions.setdefault(trade.dataname, [0, trade.price])  # Позиция по тикеру
+            position[0] += trade.quantity  # Кол-во в штуках
+            position[1] = trade.price  # Последняя цена - цена сделки
+
+    def on_position(self, position: FLPosition) -> None:
+        """Позиция от брокера: кол-во и последняя цена"""
+        with self.lock:
+            self.sequence += 1
+            if position.quantity == 0:  # Если позиция закрыта
+                self.positions.pop(position.dataname, None)  # то удаляем ее
+            else:  # Если позиция открыта
+                self.positions[position.dataname] = [position.quantity, position.current_price]  # то запоминаем кол-во и последнюю цену
+
+    # Внутренние функции
+
+    @staticmethod
+    def _is_derivative(dataname: str) -> bool:
+        """Производный инструмент (фьючерс, опцион) по режиму торгов из названия тикера"""
+        return dataname.split('.', 1)[0] in futures_boards
+
+    def _reconcile_thread(self) -> None:
+        """Поток сверки с брокером"""
+        seconds = self.reconcile_seconds  # Ожидание до следующей сверки
+        while not self.stop_event.wait(seconds):  # Пока не остановлен, ждем сверки
+            try:
+                seconds = self.reconcile_seconds if self.reconcile() else self.reconcile_retry_seconds  # Если снимок не применен, то скоро повторяем сверку
+            except Exception as ex:  # Ошибка сверки не должна останавливать поток. Сверим в следующий раз
+                self.logger.error(f'Ошибка сверки с брокером: {ex}')
+                seconds = self.reconcile_seconds
 
 
 # noinspection PyArgumentList,PyMethodParameters
@@ -21,17 +132,19 @@ class Broker(with_metaclass(MetaBroker, BrokerBase)):
     """Брокер BackTrader"""
 
     def __init__(self, **kwargs):
-        """Инициализация"""
+        """Инициализация
+
+        :param reconcile_seconds: Период сверки свободных средств и стоимости портфеля с брокером в секундах. По умолчанию, 60. 0 - не сверять
+        """
         super(Broker, self).__init__()
+        reconcile_seconds = kwargs.pop('reconcile_seconds', 60)  # Период сверки портфеля с брокером
         self.store = Store(**kwargs)  # Хранилище BackTrader
         self.logger = logging.getLogger(f'BTBroker.{self.store.broker.code}')  # Будем вести лог
         self.notifs = deque()  # Очередь уведомлений брокера о заявках
-        self.orders = OrderedDict()  # Справочник заявок, отправленных на биржу
-        self.ocos = {}  # Справочник связанных заявок (One Cancel Others)
-        self.pcs = defaultdict(deque)  # Справочник очереди всех родительских/дочерних заявок (Parent - Children)
+        self.orders = OrderRegistry()  # Справочник заявок, отправленных на биржу, по ref и номеру заявки на бирже. Также хранит связанные (One Cancel Others) и родительские/дочерние (Parent - Children) заявки
         self.positions = defaultdict(BTPosition)  # Список позиций
-        self.startingcash = self.cash = self.store.broker.get_cash()  # Стартовые и текущие свободные средства
-        self.value = self.store.broker.get_value()  # Стоимость портфеля
+        self.portfolio = PortfolioState(self.store.broker, reconcile_seconds)  # Свободные средства и стоимость портфеля без запросов к брокеру
+        self.startingcash = self.portfolio.cash  # Стартовые свободные средства
 
         self.store.broker.on_order.subscribe(self._on_order)  # Обработка заявки по подписке
         self.store.broker.on_trade.subscribe(self._on_trade)  # Обработка сделки по подписке
@@ -41,19 +154,20 @@ class Broker(with_metaclass(MetaBroker, BrokerBase)):
     def start(self):
         """Запуск"""
         super(Broker, self).start()
+        self.portfolio.start()  # Обновляем портфель по подписке и сверяем с брокером в фоне
         for position in self.store.broker.get_positions():  # Пробегаемся по всем открытым позициям
             self.positions[position.dataname] = self._position_to_bt_position(position)  # Получаем все открытые позиции. Обновлять будем через совершенные сделки
 
     def getcash(self) -> float:
         """Свободные средства. Запрос вызывается каждый раз при отправке уведомлений из Strategy._notify"""
-        return 0 if self.store.BrokerCls is None else self.cash  # Если брокера нет в хранилище, то 0. Иначе, получаем его свободные средства
+        return 0 if self.store.BrokerCls is None else self.portfolio.cash  # Если брокера нет в хранилище, то 0. Иначе, получаем его свободные средства без запроса к брокеру
 
     def getvalue(self, datas: list[Data] = None) -> float:
         """Стоимость портфеля, выбранных позиций, выбранной позиции. Запрос вызывается каждый раз при отправке уведомлений из Strategy._notify"""
         if self.store.BrokerCls is None:  # Если брокера нет в хранилище
             return 0  # то стоимость 0
         if datas is None:  # Если стоимость всех позиций
-            return self.value  # то получаем стоимость всех позиций брокера
+            return self.portfolio.value  # то получаем стоимость всех позиций брокера без запроса к брокеру
         datanames = [data.p.dataname for data in datas]  # Список тикеров
         return sum([position.price * position.size for key, position in self.positions.items() if key in datanames])  # Стоимость позиций тикеров
 
@@ -94,6 +208,7 @@ class Broker(with_metaclass(MetaBroker, BrokerBase)):
     def stop(self):
         """Остановка брокера"""
         super(Broker, self).stop()
+        self.portfolio.stop()  # Останавливаем обновление портфеля
         # Удаление брокера из хранилища происходит после окончания запуска ТС через cerebro.run()
         # После этого невозможно вызывать ф-ии через cerebro.broker
         # self.store.BrokerCls = None  # Удаляем класс брокера из хранилища
@@ -106,7 +221,7 @@ class Broker(with_metaclass(MetaBroker, BrokerBase)):
         :param order_number: Номер заявки на бирже
         :return: Заявка BackTrader или None
         """
-        return next((order for order in self.orders.values() if order.info['order_number'] == order_number), None)  # Пробегаемся по всем заявкам на бирже. Если нашли совпадение с номером заявки на бирже, то возвращаем заявку BackTrader. Иначе, ничего не найдено
+        return self.orders.get_by_order_id(order_number)  # Заявка BackTrader по индексу номеров заявок на бирже или None
 
     def _create_order(self, owner, data: Data, size, price=None, plimit=None, exectype=None, valid=None, oco=None, parent=None, transmit=True, is_buy=True, **kwargs) -> BuyOrder | SellOrder:
         """Создание заявки: Created/Rejected. Привязка параметров счета и тикера. Обработка связанных и родительской/дочерних заявок"""
@@ -132,16 +247,15 @@ class Broker(with_metaclass(MetaBroker, BrokerBase)):
             return order  # Возвращаем отклоненную заявку
 
         if oco:  # Если есть связанная заявка
-            self.ocos[order.ref] = oco.ref  # то заносим в список связанных заявок
+            self.orders.set_oco(order.ref, oco.ref)  # то заносим в список связанных заявок
         if not transmit or parent:  # Для родительской/дочерних заявок
             parent_ref = getattr(order.parent, 'ref', order.ref)  # Номер транзакции родительской заявки или номер заявки, если родительской заявки нет
-            if order.ref != parent_ref and parent_ref not in self.pcs:  # Если есть родительская заявка, но она не найдена в очереди родительских/дочерних заявок
+            if order.ref != parent_ref and self.orders.get_children(parent_ref) is None:  # Если есть родительская заявка, но она не найдена в очереди родительских/дочерних заявок
                 self.logger.warning(f'Постановка заявки {order.ref} по тикеру {data.p.dataname} отклонена. Родительская заявка не найдена')
                 order.reject(self)  # то отклоняем заявку
                 self._oco_pc_check(order)  # Проверяем связанные и родительскую/дочерние заявки
                 return order  # Возвращаем отклоненную заявку
-            pcs = self.pcs[parent_ref]  # В очередь к родительской заявке
-            pcs.append(order)  # добавляем заявку (родительскую или дочернюю)
+            self.orders.add_child(parent_ref, order)  # В очередь к родительской заявке добавляем заявку (родительскую или дочернюю)
         if transmit:  # Если обычная заявка или последняя дочерняя заявка
             if not parent:  # Для обычных заявок
                 return self._place_order(order)  # Отправляем заявку на биржу
@@ -164,7 +278,7 @@ class Broker(with_metaclass(MetaBroker, BrokerBase)):
             return order  # Возвращаем отклоненную заявку
         order.addinfo(order_number=fl_order.id)  # Сохраняем пришедший номер заявки на бирже
         order.accept(self)  # Заявка принята на бирже (Order.Accepted)
-        self.orders[order.ref] = order  # Сохраняем заявку в списке заявок, отправленных на биржу
+        self.orders.add(order.ref, order, order_id=fl_order.id)  # Сохраняем заявку в списке заявок, отправленных на биржу, с индексом по номеру заявки на бирже
         return order  # Возвращаем заявку
 
     def _cancel_order(self, order: BTOrder) -> bool:
@@ -178,22 +292,18 @@ class Broker(with_metaclass(MetaBroker, BrokerBase)):
 
     def _oco_pc_check(self, order: BTOrder):
         """Проверка связанных и родительской/дочерних заявок"""
-        ocos = self.ocos.copy()  # Пока ищем связанные заявки, они могут измениться. Поэтому, работаем с копией
-        for order_ref, oco_ref in ocos.items():  # Пробегаемся по списку связанных заявок
-            if oco_ref == order.ref:  # Если в заявке номер эта заявка указана как связанная (по номеру транзакции)
-                self._cancel_order(self.orders[order_ref])  # то отменяем заявку
-        if order.ref in ocos.keys():  # Если у этой заявки указана связанная заявка
-            oco_ref = ocos[order.ref]  # то получаем номер транзакции связанной заявки
-            self._cancel_order(self.orders[oco_ref])  # отменяем связанную заявку
+        for order_ref in self.orders.get_oco_refs(order.ref):  # Пробегаемся по заявкам, в которых эта заявка указана как связанная (по номеру транзакции)
+            self._cancel_order(self.orders[order_ref])  # Отменяем заявку
+        oco_ref = self.orders.get_oco(order.ref)  # Номер транзакции связанной заявки
+        if oco_ref is not None:  # Если у этой заявки указана связанная заявка
+            self._cancel_order(self.orders[oco_ref])  # то отменяем связанную заявку
 
         if not order.parent and not order.transmit and order.status == BTOrder.Completed:  # Если исполнена родительская заявка
-            pcs = self.pcs[order.ref]  # Получаем очередь родительской/дочерних заявок
-            for child in pcs:  # Пробегаемся по всем заявкам
+            for child in self.orders.get_children(order.ref) or ():  # Пробегаемся по очереди родительской/дочерних заявок
                 if child.parent:  # Пропускаем первую (родительскую) заявку
                     self._place_order(child)  # Отправляем дочернюю заявку на биржу
         elif order.parent:  # Если исполнена/отменена дочерняя заявка
-            pcs = self.pcs[order.parent.ref]  # Получаем очередь родительской/дочерних заявок
-            for child in pcs:  # Пробегаемся по всем заявкам
+            for child in self.orders.get_children(order.parent.ref) or ():  # Пробегаемся по очереди родительской/дочерних заявок
                 if child.parent and child.ref != order.ref:  # Пропускаем первую (родительскую) заявку и исполненную заявку
                     self._cancel_order(child)  # Отменяем дочернюю заявку
 
@@ -288,8 +398,7 @@ class Broker(with_metaclass(MetaBroker, BrokerBase)):
             # Снимаем oco-заявку только после полного исполнения заявки
             # Если нужно снять oco-заявку на частичном исполнении, то прописываем это правило в ТС
             self._oco_pc_check(bt_order)  # Проверяем связанные и родительскую/дочерние заявки (Completed)
-        self.cash = self.store.broker.get_cash()  # Свободные средства
-        self.value = self.store.broker.get_value()  # Стоимость портфеля
+        # Свободные средства и стоимость портфеля обновляет PortfolioState по той же сделке
 
     @staticmethod
     def _position_to_bt_position(position: FLPosition) -> BTPosition:
@@ -1,9 +1,9 @@
 from collections import deque
+from threading import Condition
 
 from backtrader.metabase import MetaParams
 from backtrader.utils.py3 import with_metaclass
 
-from FinLabPy.Config import default_broker  # Брокер по умолчанию
 from FinLabPy.Core import Broker as FLBroker, Bar as FLBar
 
 
@@ -37,10 +37,17 @@ class Store(with_metaclass(MetaSingleton, object)):
 
     def __init__(self, **kwargs):
         super(Store, self).__init__()
-        self.broker: FLBroker = kwargs['broker'] if 'broker' in kwargs.keys() else default_broker  # Подключаемся к брокеру если указан. Иначе, используем брокера по умолчанию
+        if 'broker' in kwargs.keys():  # Если брокер указан
+            self.broker: FLBroker = kwargs['broker']  # то подключаемся к нему
+        else:  # Если брокер не указан
+            from FinLabPy.Config import default_broker  # то импортируем брокера по умолчанию. Подключение ко всем брокерам из Config.py нужно только в этом случае
+            self.broker: FLBroker = default_broker  # Используем брокера по умолчанию
         self.data: FLBroker = kwargs['data'] if 'data' in kwargs.keys() else self.broker  # Можно разделить брокера и поставщика данных
         self.notifs = deque()  # Очередь уведомлений
-        self.new_bars: list[FLBar] = []  # Спиоск новых бар по всем подпискам на тикеры
+        self.new_bars: dict[tuple[str, str], deque[FLBar]] = {}  # Очереди новых бар. Ключ - (название тикера, временной интервал)
+        self.new_bars_count = 0  # Кол-во новых бар во всех очередях
+        self.consumers: dict[tuple[str, str], int] = {}  # Кол-во данных, забирающих бары из очереди. Ключ - (название тикера, временной интервал). Бары без данных в очередь не попадают
+        self.new_bars_condition = Condition()  # Условие прихода нового бара по любой подписке
 
     def start(self):
         self.data.on_new_bar.subscribe(self._on_new_bar)  # Подписываемся на новые бары
@@ -54,10 +61,58 @@ class Store(with_metaclass(MetaSingleton, object)):
         self.notifs.append(None)  # Добавляем пустое уведомление
         return [x for x in iter(self.notifs.popleft, None)]  # Собираем накопленные уведомления в порядке их поступления до пустого элемента (до конца)
 
+    def add_consumer(self, dataname: str, time_frame: str) -> None:
+        """Данные начинают забирать новые бары тикера и временнОго интервала"""
+        with self.new_bars_condition:
+            self.consumers[(dataname, time_frame)] = self.consumers.get((dataname, time_frame), 0) + 1
+
+    def remove_consumer(self, dataname: str, time_frame: str) -> None:
+        """Данные перестают забирать новые бары тикера и временнОго интервала. Когда данных не остается, их очередь удаляется"""
+        with self.new_bars_condition:
+            key = (dataname, time_frame)  # Ключ очереди
+            count = self.consumers.get(key, 0) - 1  # Кол-во оставшихся данных
+            if count > 0:  # Если бары еще забирают другие данные
+                self.consumers[key] = count  # то очередь оставляем
+                return  # Выходим, дальше не продолжаем
+            self.consumers.pop(key, None)
+            self.new_bars_count -= len(self.new_bars.pop(key, ()))  # Бары из очереди уже никто не заберет
+
+    def put_bar(self, bar: FLBar) -> None:
+        """Добавление нового бара в очередь тикера и временнОго интервала. Ожидающие данные просыпаются сразу. Бары, которые не забирают данные, отбрасываются"""
+        with self.new_bars_condition:
+            key = (bar.dataname, bar.time_frame)  # Ключ очереди
+            if key not in self.consumers:  # Если бары тикера и временнОго интервала не забирают данные (другая подписка или данные остановлены)
+                return  # то бар не добавляем, иначе он навсегда останется в очереди, и ожидание нового бара прекратится
+            self.new_bars.setdefault(key, deque()).append(bar)  # Добавляем бар в очередь. Если очереди нет, то создаем ее
+            self.new_bars_count += 1
+            self.new_bars_condition.notify_all()  # Будим данные, ожидающие новый бар
+
+    def get_bar(self, dataname: str, time_frame: str, timeout: float = 0) -> FLBar | None:
+        """Новый бар из очереди тикера и временнОго интервала
+
+        :param str dataname: Название тикера
+        :param str time_frame: Временной интервал
+        :param float timeout: Время ожидания в секундах, если новых бар нет ни в одной очереди данных. Бар для других данных прерывает ожидание, чтобы его быстрее забрали
+        :return: Бар или None, если бара нет
+        """
+        with self.new_bars_condition:
+            bars = self.new_bars.get((dataname, time_frame))  # Очередь новых бар
+            if not bars and self.new_bars_count == 0 and timeout > 0:  # Если новых бар нет ни в одной очереди
+                self.new_bars_condition.wait(timeout)  # то ждем нового бара по любой подписке
+                bars = self.new_bars.get((dataname, time_frame))  # Очередь могла появиться за время ожидания
+            if not bars:  # Если в очереди нет новых бар
+                return None  # то выходим, дальше не продолжаем
+            self.new_bars_count -= 1
+            return bars.popleft()  # Забираем первый бар из очереди
+
+    def has_bars(self, dataname: str, time_frame: str) -> bool:
+        """Есть ли новые бары в очереди тикера и временнОго интервала"""
+        return bool(self.new_bars.get((dataname, time_frame)))
+
     def stop(self):
         self.data.on_new_bar.unsubscribe(self._on_new_bar)  # Отписываемся от новых бар
         if self.broker != self.data:  # Если брокер и поставщик данных один и тот же
             self.data.close()  # то закрываем поставщика данных
         self.broker.close()  # Перед выходом закрываем провайдер брокера
 
-    def _on_new_bar(self, bar: FLBar): self.new_bars.append(bar)  # При поступлении нового бара добавляем его в список новых бар
+    def _on_new_bar(self, bar: FLBar): self.put_bar(bar)  # При поступлении нового бара добавляем его в очередь новых бар
@@ -0,0 +1,45 @@
+from datetime import datetime, time  # Дата и время
+from time import perf_counter  # Замер времени
+
+import numpy as np  # Бары в колонках
+import pandas as pd  # Даты торговых дней
+
+from FinLabPy.Core import BarSeries  # Бары в колонках
+from FinLabPy.Schedule.MarketSchedule import Schedule, Session  # Расписание торгов биржи
+from FinLabPy.Schedule.BarValidator import BarValidator  # Проверка бар на соответствие условиям выборки
+
+
+def measure(name, func, *args):
+    """Время выполнения функции в секундах"""
+    dt_start = perf_counter()
+    result = func(*args)
+    seconds = perf_counter() - dt_start
+    print(f'{name:<24}: {seconds * 1000:10.1f} мс, подходит {result:,} бар')
+    return seconds
+
+
+def validate_bars(bars, time_frame):
+    """Проверка каждого бара (как было)"""
+    validator = BarValidator(schedule, time_frame, session_start=time(10), session_end=time(18, 45))
+    return sum(validator.is_bar_valid(bar) for bar in bars)
+
+
+def validate_columns(bars, time_frame):
+    """Проверка всех бар сразу. Бары в колонках или pandas DataFrame"""
+    validator = BarValidator(schedule, time_frame, session_start=time(10), session_end=time(18, 45))
+    return len(validator.validate(bars))
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    schedule = Schedule([Session(time(0, 0, 0), time(23, 59, 59))], weekend_days=())  # Круглосуточное расписание без выходных, как в данных BackTrader по умолчанию
+    days = pd.bdate_range(datetime(2020, 1, 1), datetime(2020, 12, 31))  # Рабочие дни за год
+    minutes = np.arange(7 * 60, 23 * 60 + 50, dtype='timedelta64[m]')  # Минутные бары с 07:00 до 23:50
+    date_time = (days.to_numpy(dtype='datetime64[m]')[:, None] + minutes).ravel()  # Даты и время всех бар
+    count = len(date_time)  # Кол-во бар
+    prices = np.round(300 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, count)), 2)  # Случайные цены
+    bars = BarSeries('TQBR', 'SBER', 'TQBR.SBER', 'M1', date_time, prices, prices + 0.5, prices - 0.5, prices, np.full(count, 1000))
+    print(f'Кол-во бар: {count:,}')
+    old = measure('по одному бару (было)', validate_bars, bars, 'M1')
+    new = measure('колонками', validate_columns, bars, 'M1')
+    measure('колонками (DataFrame)', validate_columns, bars.to_df(), 'M1')
+    print(f'Ускорение: {old / new:.0f}x')
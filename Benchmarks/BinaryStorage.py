@@ -0,0 +1,55 @@
+from datetime import datetime  # Работа с датой и временем
+from time import perf_counter  # Замер времени
+from os import path, listdir  # Размер файлов
+from shutil import rmtree  # Удаление папки с файлами
+
+import numpy as np  # Бары в колонках
+import pandas as pd  # Даты торговых дней
+
+from FinLabPy.Core import Symbol, BarSeries  # Тикер, бары в колонках
+from FinLabPy.Storage.FileStorage import FileStorage  # Файловое хранилище
+from FinLabPy.Storage.BinaryStorage import BinaryStorage  # Хранилище в двоичных файлах
+
+
+def measure(name, func, *args, repeat=3):
+    """Среднее время выполнения функции в секундах"""
+    dt_start = perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    seconds = (perf_counter() - dt_start) / repeat
+    print(f'{name:<24}: {seconds * 1000:10.2f} мс')
+    return seconds
+
+
+def load(storage, symbol, time_frame):
+    """Загрузка всех бар с обращением ко всем ценам закрытия, чтобы отображенные на память файлы были прочитаны"""
+    return storage.get_bars(symbol, time_frame).close.sum()
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)
+    time_frame = 'M1'  # Минутные бары
+    file_storage = FileStorage('Benchmark')  # Файлы истории для замера создаем в отдельной папке
+    file_storage.set_symbol(symbol)
+    binary_storage = BinaryStorage('Benchmark')
+
+    days = pd.bdate_range(datetime(2020, 1, 1), datetime(2024, 12, 31))  # Рабочие дни за 5 лет
+    minutes = np.arange(7 * 60, 23 * 60 + 50, dtype='timedelta64[m]')  # Минутные бары с 07:00 до 23:50
+    date_time = (days.to_numpy(dtype='datetime64[m]')[:, None] + minutes).ravel()  # Даты и время всех бар
+    count = len(date_time)
+    prices = np.round(300 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, count)), 2)  # Случайные цены
+    bars = BarSeries(symbol.board, symbol.symbol, symbol.dataname, time_frame, date_time, prices, prices + 0.5, prices - 0.5, prices, np.full(count, 1000))
+    file_storage.set_bars(bars)
+    binary_storage.import_file_storage()  # Переводим файл истории в двоичные файлы
+    print(f'Кол-во бар: {count:,}')
+
+    txt_size = path.getsize(f'{file_storage.datapath}{symbol.dataname}_{time_frame}.txt')  # Размер файла истории
+    bin_path = binary_storage._bars_path(symbol.dataname, time_frame)  # Папка с колонками бар
+    bin_size = sum(path.getsize(f'{bin_path}{filename}') for filename in listdir(bin_path))  # Размер двоичных файлов
+    print(f'Размер на диске: текст {txt_size / 2 ** 20:.1f} МБ, двоичные файлы {bin_size / 2 ** 20:.1f} МБ')
+    old = measure('загрузка (текст)', load, file_storage, symbol, time_frame)
+    new = measure('загрузка (двоичные)', load, binary_storage, symbol, time_frame)
+    print(f'Ускорение: {old / new:.1f}x')
+
+    file_storage.save_symbols()  # Сохраняем спецификации до удаления папки
+    rmtree(file_storage.datapath)  # Удаляем файлы замера
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter  # Замер времени
+
+import pandas as pd  # Бары в формате pandas DataFrame
+
+from FinLabPy.Core import Symbol, Bar, BarSeries, bars_to_df, df_to_bars  # Тикер, бар, бары в колонках, перевод бар в pandas DataFrame и обратно
+
+
+def old_bars_to_df(bars):
+    """Перевод списка бар в pandas DataFrame через словарь на каждый бар (как было)"""
+    pd_bars = pd.DataFrame.from_records([bar.to_dict() for bar in bars], index='datetime')
+    pd_bars['volume'] = pd_bars['volume'].astype(int)
+    return pd_bars
+
+
+def old_df_to_bars(pd_bars, symbol, time_frame):
+    """Перевод pandas DataFrame в список бар через обход строк (как было в FileStorage.get_bars)"""
+    return [Bar(symbol.board, symbol.symbol, symbol.dataname, time_frame, index, row['open'], row['high'], row['low'], row['close'], row['volume']) for index, row in pd_bars.iterrows()]
+
+
+def measure(name, func, *args):
+    """Время выполнения функции в секундах"""
+    dt_start = perf_counter()
+    func(*args)
+    seconds = perf_counter() - dt_start
+    print(f'{name:<20}: {seconds:8.3f} с')
+    return seconds
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    count = 1_000_000  # Кол-во бар. Обход строк старым способом занимает несколько минут
+    symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)
+    dt = datetime(2020, 1, 1)  # Дата и время первого бара
+    bars = [Bar(symbol.board, symbol.symbol, symbol.dataname, 'M1', dt + timedelta(minutes=i), 300.0 + i % 100, 301.0, 299.0, 300.5, 1000 + i % 7) for i in range(count)]
+    pd_bars = bars_to_df(bars)
+
+    old = measure('bars_to_df (был)', old_bars_to_df, bars)
+    new = measure('bars_to_df', bars_to_df, bars)
+    print(f'Ускорение: {old / new:.1f}x')
+    series = BarSeries.from_bars(bars)  # История из хранилища и брокеров приходит в колонках
+    new = measure('bars_to_df (колонки)', bars_to_df, series)
+    print(f'Ускорение: {old / new:.1f}x')
+    old = measure('df_to_bars (был)', old_df_to_bars, pd_bars, symbol, 'M1')
+    new = measure('df_to_bars', df_to_bars, pd_bars, symbol, 'M1')
+    print(f'Ускорение: {old / new:.1f}x')
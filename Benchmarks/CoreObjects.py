@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter  # Замер времени
+import tracemalloc  # Замер памяти
+
+from FinLabPy.Core import Bar, BarSeries  # Бар, бары в колонках
+
+
+class DictBar:
+    """Бар со словарем атрибутов экземпляра (как было до __slots__)"""
+    def __init__(self, board, symbol, dataname, time_frame, date_time, open_, high, low, close, volume):
+        self.board = board
+        self.symbol = symbol
+        self.dataname = dataname
+        self.time_frame = time_frame
+        self.datetime = date_time
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+
+def measure(name, create, count):
+    """Замер памяти на объект и скорости создания объектов
+
+    :param str name: Название замера
+    :param create: Функция создания объектов. Принимает кол-во, возвращает созданные объекты
+    :param int count: Кол-во объектов
+    """
+    tracemalloc.start()
+    dt_start = perf_counter()
+    objects = create(count)  # Создаем объекты. Держим ссылку, чтобы память не освободилась до замера
+    seconds = perf_counter() - dt_start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<12}: {memory / count:7.1f} байт/бар, {count / seconds:12,.0f} бар/с')
+    del objects
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    count = 1_000_000  # Кол-во бар
+    dt = datetime(2020, 1, 1)  # Дата и время первого бара
+    dts = [dt + timedelta(minutes=i) for i in range(count)]  # Даты и время бар создаем заранее, чтобы не учитывать их в замере
+
+    measure('dict', lambda n: [DictBar('TQBR', 'SBER', 'TQBR.SBER', 'M1', dts[i], 1.0, 2.0, 0.5, 1.5, 100) for i in range(n)], count)
+    measure('__slots__', lambda n: [Bar('TQBR', 'SBER', 'TQBR.SBER', 'M1', dts[i], 1.0, 2.0, 0.5, 1.5, 100) for i in range(n)], count)
+    measure('BarSeries', lambda n: BarSeries.from_rows('TQBR', 'SBER', 'TQBR.SBER', 'M1', [(dts[i], 1.0, 2.0, 0.5, 1.5, 100) for i in range(n)]), count)
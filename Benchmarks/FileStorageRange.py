@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter  # Замер времени
+from shutil import rmtree  # Удаление папки с файлами
+
+import numpy as np  # Бары в колонках
+import pandas as pd  # Даты торговых дней
+
+from FinLabPy.Core import Symbol, BarSeries  # Тикер, бары в колонках
+from FinLabPy.Storage.FileStorage import FileStorage  # Файловое хранилище
+
+
+def old_get_bars(storage, symbol, time_frame, dt_from=None, dt_to=None):
+    """Получение бар с разбором всего файла (как было)"""
+    filename = f'{storage.datapath}{symbol.dataname}_{time_frame}.txt'
+    return BarSeries.from_df(storage._read_bars(filename), symbol.board, symbol.symbol, symbol.dataname, time_frame).between(dt_from, dt_to)
+
+
+def measure(name, func, *args, repeat=5):
+    """Среднее время выполнения функции в секундах"""
+    dt_start = perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    seconds = (perf_counter() - dt_start) / repeat
+    print(f'{name:<24}: {seconds * 1000:10.2f} мс')
+    return seconds
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)
+    time_frame = 'M1'  # Минутные бары
+    storage = FileStorage('Benchmark')  # Файлы истории для замера создаем в отдельной папке
+    storage.set_symbol(symbol)
+
+    days = pd.bdate_range(datetime(2020, 1, 1), datetime(2024, 12, 31))  # Рабочие дни за 5 лет
+    minutes = np.arange(7 * 60, 23 * 60 + 50, dtype='timedelta64[m]')  # Минутные бары с 07:00 до 23:50
+    date_time = (days.to_numpy(dtype='datetime64[m]')[:, None] + minutes).ravel()  # Даты и время всех бар
+    count = len(date_time)
+    prices = np.full(count, 300.0)
+    storage.set_bars(BarSeries(symbol.board, symbol.symbol, symbol.dataname, time_frame, date_time, prices, prices + 1, prices - 1, prices, np.full(count, 1000)))
+    print(f'Кол-во бар: {count:,}')
+
+    dt_last = date_time[-1].astype(datetime)  # Последний бар
+    storage.get_bars(symbol, time_frame, dt_last)  # Индекс строится при первом запросе
+    old = measure('последний бар (был)', old_get_bars, storage, symbol, time_frame, dt_last)
+    new = measure('последний бар', storage.get_bars, symbol, time_frame, dt_last)
+    print(f'Ускорение: {old / new:.1f}x')
+    dt_from = dt_last - timedelta(days=7)  # Последняя неделя
+    old = measure('неделя (был)', old_get_bars, storage, symbol, time_frame, dt_from)
+    new = measure('неделя', storage.get_bars, symbol, time_frame, dt_from)
+    print(f'Ускорение: {old / new:.1f}x')
+    dt_from, dt_to = datetime(2022, 3, 1), datetime(2022, 3, 31)  # Месяц в середине файла
+    old = measure('месяц (был)', old_get_bars, storage, symbol, time_frame, dt_from, dt_to)
+    new = measure('месяц', storage.get_bars, symbol, time_frame, dt_from, dt_to)
+    print(f'Ускорение: {old / new:.1f}x')
+
+    storage.save_symbols()  # Сохраняем спецификации до удаления папки
+    rmtree(storage.datapath)  # Удаляем файлы истории замера
@@ -0,0 +1,84 @@
+import asyncio
+from time import sleep, process_time, perf_counter  # Ожидание, процессорное время, замер времени
+from threading import Thread, Lock  # Потоки подписок (как было)
+from multiprocessing import Process  # Сервер подписок в отдельном процессе, чтобы не влиять на замер
+from os import listdir  # Кол-во потоков процесса
+
+import grpc
+
+from FinLabPy.Brokers.GrpcStreams import GrpcStreams  # Потоковые подписки gRPC в одном цикле asyncio
+
+method = '/bench.MarketData/SubscribeBars'  # Метод подписки. Сообщения передаются байтами без protobuf
+
+
+def server_process(address, interval):
+    """Локальный сервер подписок. По каждой подписке отправляет сообщение раз в interval секунд"""
+    async def subscribe_bars(request, context):
+        while True:
+            yield request  # Отправляем название тикера как новый бар
+            await asyncio.sleep(interval)
+
+    async def serve():
+        server = grpc.aio.server(options=(('grpc.max_concurrent_streams', 1000),))
+        server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler('bench.MarketData', {'SubscribeBars': grpc.unary_stream_rpc_method_handler(subscribe_bars)}),))
+        server.add_insecure_port(address)
+        await server.start()
+        await server.wait_for_termination()
+
+    asyncio.run(serve())
+
+
+def on_message(message):
+    """Обработка нового бара"""
+    global received
+    with lock:
+        received += 1
+
+
+def subscribe_bars_thread(channel, ticker):
+    """Поток подписки на новые бары (как было). Один поток на подписку"""
+    try:
+        for message in channel.unary_stream(method)(ticker):
+            on_message(message)
+    except grpc.RpcError:  # Канал закрыт
+        pass
+
+
+def measure(name, subscribe, close):
+    """Потоки и процессорное время клиента на всех подписках"""
+    global received
+    subscribe()
+    sleep(3)  # Ждем, пока все подписки установятся
+    received = 0
+    threads = len(listdir('/proc/self/task'))  # Потоки процесса, включая потоки gRPC
+    cpu_start, dt_start = process_time(), perf_counter()
+    sleep(seconds)
+    cpu, elapsed = process_time() - cpu_start, perf_counter() - dt_start
+    print(f'{name:<24}: потоков {threads:>4}, сообщений {received / elapsed:8.0f} в с, процессор {cpu / elapsed:6.1%}')
+    close()
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    address = 'localhost:50551'  # Адрес локального сервера
+    subscriptions = 300  # Кол-во подписок
+    interval = 0.5  # Интервал между сообщениями по одной подписке в секундах
+    seconds = 10  # Время замера
+    tickers = [f'TQBR.T{i:03}'.encode() for i in range(subscriptions)]
+    received = 0  # Кол-во полученных сообщений
+    lock = Lock()
+
+    server = Process(target=server_process, args=(address, interval), daemon=True)
+    server.start()
+    sleep(1)  # Ждем запуска сервера
+    print(f'Подписок: {subscriptions}, сообщение по подписке раз в {interval} с')
+
+    streams = GrpcStreams(lambda: grpc.aio.insecure_channel(address))
+    measure('asyncio, один поток',
+            lambda: [streams.subscribe(ticker, lambda channel, ticker=ticker: channel.unary_stream(method)(ticker), on_message) for ticker in tickers],
+            streams.close)
+
+    channel = grpc.insecure_channel(address)
+    measure('поток на подписку (было)',
+            lambda: [Thread(target=subscribe_bars_thread, args=(channel, ticker), daemon=True).start() for ticker in tickers],
+            channel.close)
+    server.terminate()
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter, sleep  # Замер времени, задержка ответа провайдера
+from threading import Lock  # Подсчет одновременных запросов
+
+from FinLabPy.Core import Broker, Symbol, BarSeries  # Брокер, тикер, бары в колонках
+
+
+class FakeProvider:
+    """Провайдер без подключения. Отвечает на запрос окна истории с задержкой сети"""
+    def __init__(self):
+        self.requests = 0  # Кол-во запросов
+        self.active = 0  # Кол-во одновременных запросов
+        self.max_active = 0  # Максимальное кол-во одновременных запросов
+        self.lock = Lock()
+
+    def get_candles(self, seconds_from, seconds_to):
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        sleep(0.02)  # Задержка ответа провайдера
+        with self.lock:
+            self.active -= 1
+        return [(datetime.fromtimestamp(seconds, tz=None), 100.0, 101.0, 99.0, 100.0, 1) for seconds in range(seconds_from, seconds_to + 1, 60)]  # Минутные бары окна. Последний бар совпадает с первым баром следующего окна
+
+
+class FakeBroker(Broker):
+    """Брокер, скачивающий историю окнами по 1 дню, как Т-Инвестиции для минутных бар"""
+    def __init__(self, history_workers):
+        super().__init__('Б', 'Замер', FakeProvider())
+        self.history_workers = history_workers
+
+    def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
+        rows = self._download_history(self._history_windows(symbol, time_frame, int(dt_from.timestamp()), int(dt_to.timestamp()), int(timedelta(days=1).total_seconds())), self.provider.get_candles)
+        return BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, time_frame, rows)
+
+    def close(self):
+        pass
+
+
+def measure(history_workers):
+    """Время скачивания года минутной истории"""
+    broker = FakeBroker(history_workers)
+    dt_start = perf_counter()
+    bars = broker.get_history(symbol, 'M1', datetime(2024, 1, 1), datetime(2024, 12, 31))
+    seconds = perf_counter() - dt_start
+    name = 'по очереди (было)' if history_workers == 1 else f'{history_workers} потоков'
+    print(f'{name:<18}: запросов {broker.provider.requests}, одновременно {broker.provider.max_active:>2}, бар {len(bars):,}, дубликатов {len(bars) - len(set(bars.datetime.tolist())):,}, {seconds * 1000:8.0f} мс')
+    return seconds
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)
+    old = measure(1)
+    for workers in (4, 8):
+        new = measure(workers)
+        print(f'Ускорение: {old / new:.1f}x')
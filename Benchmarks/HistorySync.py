@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter  # Замер времени
+from shutil import rmtree  # Удаление хранилища замера
+import random  # Случайные пропуски в хранилище
+
+import numpy as np
+
+from FinLabPy.Core import Broker, Symbol, BarSeries, bar_cache  # Брокер, тикер, бары в колонках, кэш бар
+from FinLabPy.Schedule.MOEX import board_schedule  # Расписание торгов по режиму торгов
+
+
+class FakeBroker(Broker):
+    """Брокер без подключения. Провайдер отдает минутные бары торговых сессий окнами по 1 дню, как Т-Инвестиции"""
+    def __init__(self):
+        super().__init__('Б', 'Замер', None, storage='bin')
+        self.requests = 0  # Кол-во запросов окон
+
+    def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
+        return self.sync_history(symbol, time_frame, dt_from, dt_to)
+
+    def close(self):
+        pass
+
+    def _fetch_history(self, symbol, time_frame, dt_from, dt_to):
+        seconds_from = schedule.msk_datetime_to_timestamp(max(dt_from or dt_first, dt_first))  # Первый бар тикера
+        seconds_to = schedule.msk_datetime_to_timestamp(min(dt_to or dt_last, dt_last))  # Будущих бар нет
+        windows = self._history_windows(symbol, time_frame, seconds_from, seconds_to, int(timedelta(days=1).total_seconds()))
+        return self._download_history(windows, self.fetch)
+
+    def fetch(self, window_from, window_to):
+        """Минутные бары торговых сессий окна"""
+        self.requests += 1
+        i_from, i_to = np.searchsorted(all_seconds, window_from, side='left'), np.searchsorted(all_seconds, window_to, side='right')
+        return list(zip(all_bars.datetime[i_from:i_to].astype('datetime64[us]').tolist(), *([100.0] * (i_to - i_from),) * 4, [1] * (i_to - i_from)))
+
+
+def trading_minutes(d_from, d_to):
+    """Минутные бары всех торговых сессий по расписанию"""
+    minutes = []
+    for d in schedule.trade_dates(d_from, d_to):
+        for session in schedule.trade_sessions:
+            dt, dt_end = datetime.combine(d, session.time_begin), datetime.combine(d, session.time_end)
+            while dt <= dt_end:
+                minutes.append(dt)
+                dt += timedelta(minutes=1)
+    return np.array(minutes, dtype='datetime64[ns]')
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)
+    schedule = board_schedule(symbol.board)
+    date_time = trading_minutes(datetime(2023, 1, 2).date(), datetime(2024, 12, 31).date())  # 2 года минутных бар у провайдера
+    all_bars = BarSeries(symbol.board, symbol.symbol, symbol.dataname, 'M1', date_time, *([np.full(len(date_time), 100.0)] * 4), np.ones(len(date_time), dtype=np.int64))
+    all_seconds = (date_time - np.timedelta64(3, 'h')).astype('datetime64[s]').astype(np.int64)  # Секунды UTC для поиска окон
+    dt_first, dt_last = all_bars[0].datetime, all_bars[-1].datetime
+
+    broker = FakeBroker()
+    days = np.unique(date_time.astype('datetime64[D]'))  # Торговые дни
+    random.seed(1)
+    holes = set(random.sample(list(days[days >= np.datetime64('2023-07-01')]), 20))  # 20 пропущенных дней в хранилище
+    stored = all_bars.between(datetime(2023, 7, 1), datetime(2024, 11, 29, 23, 59))  # В хранилище бары с июля 2023 по ноябрь 2024
+    stored = stored[~np.isin(stored.datetime.astype('datetime64[D]'), list(holes))]  # с пропусками
+    broker.storage.set_bars(stored)
+    print(f'У провайдера {len(all_bars):,} бар за {len(days)} торговых дней. В хранилище {len(stored):,} бар с 20 пропущенными днями, без начала и конца истории')
+
+    dt_start = perf_counter()
+    bars = broker.get_history(symbol, 'M1', datetime(2023, 1, 2))
+    seconds = perf_counter() - dt_start
+    print(f'синхронизация    : запросов {broker.requests:>4}, бар {len(bars):,}, {"совпадают" if np.array_equal(bars.datetime, all_bars.datetime) else "НЕ СОВПАДАЮТ"} с провайдером, {seconds * 1000:6.0f} мс')
+    broker.requests = 0
+    bars = broker.get_history(symbol, 'M1', datetime(2023, 1, 2))
+    print(f'повторно         : запросов {broker.requests:>4}, бар {len(bars):,}')
+    stored_again = bar_cache.get_bars(broker.storage, symbol, 'M1')
+    print(f'в хранилище      : бар {len(stored_again):,}, {"совпадают" if np.array_equal(stored_again.datetime, all_bars.datetime) else "НЕ СОВПАДАЮТ"} с провайдером')
+    print(f'полная загрузка  : запросов {len(broker._history_windows(symbol, "M1", int(all_seconds[0]), int(all_seconds[-1]), 86400)):>4} (было, чтобы заполнить пропуски)')
+    rmtree(broker.storage.datapath)  # Удаляем хранилище замера
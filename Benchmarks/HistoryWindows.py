@@ -0,0 +1,72 @@
+from datetime import date, datetime, timedelta  # Работа с датой и временем
+
+from FinLabPy.Core import Broker, Symbol  # Брокер, тикер
+from FinLabPy.Schedule.MOEX import board_schedule  # Расписание торгов по режиму торгов
+
+holidays = {date(2022, 1, 7), date(2022, 2, 23), date(2022, 3, 8), date(2022, 5, 9), date(2022, 6, 13), date(2022, 11, 4),
+            date(2023, 1, 2), date(2023, 2, 23), date(2023, 3, 8), date(2023, 5, 1), date(2023, 5, 9), date(2023, 6, 12),
+            date(2024, 1, 1), date(2024, 1, 2), date(2024, 2, 23), date(2024, 3, 8), date(2024, 5, 1), date(2024, 5, 9), date(2024, 6, 12), date(2024, 11, 4), date(2024, 12, 31)}  # Основные праздники Московской Биржи в будние дни (приближенно)
+stocks_closed = (date(2022, 2, 28), date(2022, 3, 23))  # Фондовый рынок был закрыт
+
+
+def moex_trade_date(board, d):
+    """Торговый день по календарю Московской Биржи, а не по расписанию. Торги только в будние дни кроме праздников"""
+    if d.weekday() >= 5 or d in holidays:  # Выходные и праздники
+        return False
+    return board.startswith('SPB') or not stocks_closed[0] <= d <= stocks_closed[1]  # Фондовый рынок закрывался
+
+
+class FakeBroker(Broker):
+    """Брокер без подключения. Провайдер отдает минутные бары только в торговые дни календаря биржи во время торговых сессий"""
+    def __init__(self, history_max_bars):
+        super().__init__('Б', 'Замер', None)
+        self.history_max_bars = history_max_bars
+        self.requests = 0  # Кол-во запросов
+        self.empty = 0  # Кол-во запросов без бар
+
+    def fetch(self, board, schedule, first_seconds, last_seconds, window_from, window_to):
+        """Минутные бары окна с первого бара тикера до текущего момента"""
+        self.requests += 1
+        dt = schedule.timestamp_to_msk_datetime(max(window_from, first_seconds))
+        dt_to = schedule.timestamp_to_msk_datetime(min(window_to, last_seconds + 1))  # Будущих бар нет
+        rows = []
+        while dt < dt_to:
+            if moex_trade_date(board, dt.date()) and any(session.time_begin <= dt.time() <= session.time_end for session in schedule.trade_sessions):  # Бары есть только в торговые дни во время торговых сессий
+                rows.append((dt, 100.0, 101.0, 99.0, 100.0, 1))
+            dt += timedelta(minutes=1)
+        if len(rows) == 0:
+            self.empty += 1
+        return rows
+
+    def close(self):
+        pass
+
+
+def measure(name, board, window, max_bars, listed_days):
+    """Запросы на скачивание 3-х лет минутной истории окнами подряд (было) и по расписанию торгов"""
+    symbol = Symbol(board, 'T', f'{board}.T', 'Тикер', 2, 0.01, 1)
+    schedule = board_schedule(board)
+    dt_from, dt_to = datetime(2022, 1, 3, 10, 0), datetime(2024, 12, 31, 23, 59)  # 3 года
+    seconds_from, seconds_to = schedule.msk_datetime_to_timestamp(dt_from), schedule.msk_datetime_to_timestamp(dt_to)
+    first_seconds = schedule.msk_datetime_to_timestamp(dt_from + timedelta(days=listed_days))  # Первый бар тикера
+    window_seconds = int(window.total_seconds())
+
+    old = FakeBroker(max_bars)
+    old_windows = [(window_from, window_from + window_seconds) for window_from in range(seconds_from, seconds_to + 1, window_seconds)]  # Окна подряд с даты начала (было)
+    old_rows = old._download_history(old_windows, lambda window_from, window_to: old.fetch(board, schedule, first_seconds, seconds_to, window_from, window_to))
+
+    new = FakeBroker(max_bars)
+    new_windows = new._history_windows(symbol, 'M1', max(seconds_from, first_seconds), seconds_to, window_seconds)  # Окна по расписанию с первого бара тикера
+    new_rows = new._download_history(new_windows, lambda window_from, window_to: new.fetch(board, schedule, first_seconds, seconds_to, window_from, window_to))
+
+    saved = 1 - new.requests / old.requests
+    print(f'{name:<38}: было {old.requests:>5} запросов ({old.empty:>4} пустых), стало {new.requests:>5} ({new.empty:>3} пустых), экономия {saved:6.1%}, бары {"совпадают" if old_rows == new_rows else "НЕ СОВПАДАЮТ"} ({len(new_rows):,})')
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    print('3 года минутной истории (03.01.2022 - 31.12.2024)')
+    measure('Т-Инвестиции, акции', 'TQBR', timedelta(days=1), 2400, 0)
+    measure('Т-Инвестиции, фьючерсы', 'SPBFUT', timedelta(days=1), 2400, 0)
+    measure('Окна 7 дней, акции', 'TQBR', timedelta(days=7), None, 0)
+    measure('Т-Инвестиции, акции с листингом в 2023', 'TQBR', timedelta(days=1), 2400, 365)
+    measure('Окна 7 дней, акции с листингом в 2023', 'TQBR', timedelta(days=7), None, 365)
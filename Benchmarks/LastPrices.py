@@ -0,0 +1,49 @@
+from datetime import datetime  # Работа с датой и временем
+from time import perf_counter, sleep  # Замер времени, задержка ответа провайдера
+
+from FinLabPy.Core import Broker, Symbol, Bar  # Брокер, тикер, бар
+
+
+class FakeBroker(Broker):
+    """Брокер без подключения. Цена тикера запрашивается по одной, как у Финама и Московской Биржи"""
+    def __init__(self):
+        super().__init__('Б', 'Замер', None)
+        self.requests = 0  # Кол-во запросов цен
+
+    def get_last_price(self, symbol):
+        self.requests += 1
+        sleep(0.02)  # Задержка ответа провайдера
+        return 100.0
+
+    def close(self):
+        pass
+
+
+class FakeBatchBroker(FakeBroker):
+    """Брокер с запросом цен списком, как GetLastPrices у Т-Инвестиций"""
+    def _fetch_last_prices(self, symbols):
+        self.requests += 1
+        sleep(0.02)
+        return {symbol.dataname: 100.0 for symbol in symbols}
+
+
+def measure(name, broker, get_prices):
+    broker.requests = 0
+    dt_start = perf_counter()
+    prices = get_prices(broker)
+    print(f'{name:<34}: запросов {broker.requests:>3}, {(perf_counter() - dt_start) * 1000:5.0f} мс, цен {sum(price is not None for price in prices.values())}')
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    symbols = [Symbol('TQBR', f'T{i}', f'TQBR.T{i}', f'T{i}', 2, 0.01, 1) for i in range(50)]  # 50 тикеров
+    print(f'Последние цены {len(symbols)} тикеров, ответ провайдера 20 мс')
+    measure('по одной (было)', FakeBroker(), lambda broker: {symbol.dataname: broker.get_last_price(symbol) for symbol in symbols})
+    broker = FakeBroker()
+    measure('одновременно по одной', broker, lambda broker: broker.get_last_prices(symbols))
+    measure('повторно в течение жизни цен', broker, lambda broker: broker.get_last_prices(symbols))
+    broker = FakeBatchBroker()
+    measure('списком', broker, lambda broker: broker.get_last_prices(symbols))
+    broker = FakeBroker()
+    for symbol in symbols[:40]:  # Подписка на бары по 40 тикерам
+        broker.on_new_bar.trigger(Bar(symbol.board, symbol.symbol, symbol.dataname, 'M1', datetime.now(), 100.0, 100.0, 100.0, 100.0, 1))
+    measure('40 тикеров из подписки на бары', broker, lambda broker: broker.get_last_prices(symbols))
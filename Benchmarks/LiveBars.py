@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter, sleep  # Замер времени, ожидание
+from threading import Thread  # Поток отправки новых бар
+import random  # Случайный выбор тикера для нового бара
+
+import numpy as np  # Статистика задержек
+import backtrader as bt
+
+from FinLabPy.Core import Broker, Symbol, Bar, BarSeries  # Брокер, тикер, бар, бары в колонках
+from FinLabPy.BackTrader import Store, Data  # Хранилище и данные для BackTrader
+
+
+class FakeBroker(Broker):
+    """Брокер без подключения. Новые бары отправляются из потока замера"""
+    def __init__(self):
+        super().__init__('Б', 'Замер', None)
+
+    def get_symbol_by_dataname(self, dataname):
+        board, symbol = dataname.split('.')
+        return Symbol(board, symbol, dataname, symbol, 2, 0.01, 1)
+
+    def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
+        return BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, time_frame, [(dt_start, 100.0, 101.0, 99.0, 100.0, 1)])  # Один исторический бар
+
+    def subscribe_history(self, symbol, time_frame):
+        pass
+
+    def unsubscribe_history(self, symbol, time_frame):
+        pass
+
+    def close(self):
+        pass
+
+
+class TimedData(Data):
+    """Данные с замером времени от отправки нового бара брокером до его записи в линии BackTrader"""
+    def _load(self):
+        loaded = super()._load()
+        if loaded:  # Если бар записан в линии
+            key = (self.p.dataname, bt.num2date(self.lines.datetime[0]))  # Тикер и дата/время бара
+            if key in sent:  # Если бар был отправлен потоком замера
+                latencies.append(perf_counter() - sent.pop(key))  # то запоминаем задержку
+        return loaded
+
+
+class PollingData(TimedData):
+    """Получение новых бар опросом раз в секунду (как было)"""
+    def _load(self):
+        if self.history_index >= len(self.history_bars) and not self.store.has_bars(self.symbol.dataname, self.time_frame):  # Если исторических и новых бар нет
+            sleep(1)  # то ждем, как было до очередей
+            return None
+        return super()._load()
+
+
+class WaitAll(bt.Strategy):
+    """Окончание замера после получения всех новых бар"""
+    def prenext(self):
+        self.next()
+
+    def next(self):
+        if len(latencies) == count:  # Если получили все новые бары
+            self.env.runstop()  # то заканчиваем замер
+
+
+def send_bars():
+    """Отправка новых бар по случайным тикерам"""
+    sleep(1)  # Ждем запуска Cerebro
+    for i in range(count):
+        dataname = random.choice(datanames)  # Тикер нового бара
+        dt = dt_start + timedelta(minutes=i + 1)  # Дата и время нового бара
+        board, symbol = dataname.split('.')
+        sent[(dataname, dt)] = perf_counter()  # Запоминаем время отправки
+        broker.on_new_bar.trigger(Bar(board, symbol, dataname, 'M1', dt, 100.0, 101.0, 99.0, 100.0, 1))  # Отправляем новый бар как от брокера
+        sleep(0.02)  # Новые бары приходят не одновременно
+
+
+def measure(name, data_cls, bars_count):
+    """Замер задержек получения новых бар по всем тикерам"""
+    global count
+    count = bars_count  # Кол-во новых бар
+    latencies.clear()
+    cerebro = bt.Cerebro(stdstats=False)
+    for dataname in datanames:
+        cerebro.adddata(data_cls(dataname=dataname, timeframe=bt.TimeFrame.Minutes, compression=1, live_bars=True, broker=broker))
+    cerebro.addstrategy(WaitAll)
+    Thread(target=send_bars, daemon=True).start()
+    cerebro.run()
+    result = np.array(latencies) * 1000  # Задержки в мс
+    print(f'{name:<11}: {count} бар, средняя {result.mean():8.2f} мс, медиана {np.median(result):8.2f} мс, 99% {np.percentile(result, 99):8.2f} мс, максимальная {result.max():8.2f} мс')
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    feeds = 50  # Кол-во тикеров в реальном времени
+    count = 0  # Кол-во новых бар в текущем замере
+    dt_start = datetime(2020, 1, 1)  # Дата и время исторического бара
+    datanames = [f'TQBR.T{i:02}' for i in range(feeds)]
+    sent = {}  # Время отправки бар
+    latencies = []  # Задержки получения бар
+
+    broker = FakeBroker()
+    Store(broker=broker)  # Хранилище BackTrader с брокером замера
+    print(f'Тикеров: {feeds}')
+    measure('очереди', TimedData, 500)
+    measure('опрос (был)', PollingData, 20)  # Каждый проход Cerebro по тикерам без новых бар занимает до 50 с. Поэтому бар меньше
@@ -0,0 +1,29 @@
+from timeit import timeit  # Замер времени
+
+from FinLabPy.Core import Order, OrderRegistry  # Заявка, справочник заявок
+
+
+def measure(count):
+    """Поиск заявки по номеру на бирже для каждого события при count активных заявках"""
+    orders = [Order(None, str(100_000 + i), True, Order.Limit, 'TQBR.SBER', 2, 10, 300.0) for i in range(count)]  # Активные заявки
+    registry = OrderRegistry()
+    for trans_id, order in enumerate(orders, 1):
+        registry.add(trans_id, order, order_id=order.id, trans_id=trans_id)
+    order_ids = [order.id for order in orders[::max(1, count // 100)]]  # Номера заявок из событий по всему списку
+
+    def scan():  # Перебор списка заявок (было)
+        for order_id in order_ids:
+            next((order for order in orders if order.id == order_id), None)
+
+    def lookup():  # Индекс справочника
+        for order_id in order_ids:
+            registry.get_by_order_id(order_id)
+
+    scan_us = timeit(scan, number=10) / 10 / len(order_ids) * 1e6
+    lookup_us = timeit(lookup, number=10) / 10 / len(order_ids) * 1e6
+    print(f'{count:>6} заявок: перебор {scan_us:9.2f} мкс на событие, справочник {lookup_us:5.2f} мкс на событие')
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    for count in (10, 100, 1_000, 10_000):
+        measure(count)
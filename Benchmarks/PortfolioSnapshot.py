@@ -0,0 +1,74 @@
+from time import sleep  # Пауза между барами
+
+from FinLabPy.Core import Broker, Symbol, Position, PortfolioSnapshot  # Брокер, тикер, позиция, снимок портфеля
+
+
+class FakeProvider:
+    """Провайдер без подключения. Портфель отдает одним ответом, как GetPortfolio"""
+    def __init__(self):
+        self.requests = 0  # Кол-во запросов портфеля
+
+    def get_portfolio(self):
+        self.requests += 1
+        return 1_000_000.0, 500_000.0, [(f'TQBR.T{i}', 100, 50.0, 51.0) for i in range(5)]  # Оценка, свободные средства, позиции
+
+
+class OldBroker(Broker):
+    """Каждая функция портфеля запрашивает портфель заново (было)"""
+    def __init__(self):
+        super().__init__('Б', 'Замер', FakeProvider())
+
+    def get_last_price(self, symbol):
+        self.provider.requests += 1
+        return 51.0
+
+    def get_value(self):
+        return self.provider.get_portfolio()[0]
+
+    def get_cash(self):
+        return self.provider.get_portfolio()[1]
+
+    def get_positions(self):
+        self.positions = [Position(self, dataname, dataname, 2, quantity, average, current) for dataname, quantity, average, current in self.provider.get_portfolio()[2]]
+        return self.positions
+
+    def close(self):
+        pass
+
+
+class NewBroker(OldBroker):
+    """Функции портфеля берут данные из снимка"""
+    def get_value(self):
+        return self.get_snapshot().value
+
+    def get_cash(self):
+        return self.get_snapshot().cash
+
+    def get_positions(self):
+        self.positions = list(self.get_snapshot().positions)
+        return self.positions
+
+    def _fetch_snapshot(self):
+        value, cash, positions = self.provider.get_portfolio()
+        return PortfolioSnapshot(value, cash, [Position(self, dataname, dataname, 2, quantity, average, current) for dataname, quantity, average, current in positions])
+
+
+def measure(name, broker, bars):
+    """Стратегия на каждом баре запрашивает стоимость портфеля, свободные средства и позиции по 6 тикерам (5 открытых и 1 без позиции). На каждом 5-м баре сделка"""
+    symbols = [Symbol('TQBR', f'T{i}', f'TQBR.T{i}', f'T{i}', 2, 0.01, 1) for i in range(6)]
+    for i in range(bars):
+        broker.get_value()
+        broker.get_cash()
+        for symbol in symbols:
+            broker.get_position(symbol)
+        if i % 5 == 4:  # Сделка по подписке
+            broker.invalidate_snapshot()
+            broker.get_position(symbols[0])  # Позиция для события on_position
+        sleep(broker.snapshot_ttl)  # Следующий бар приходит после окончания жизни снимка
+    print(f'{name:<18}: {broker.provider.requests / bars:5.2f} запросов на бар')
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    Broker.snapshot_ttl = 0.02  # Бары чаще, чем время жизни снимка по умолчанию
+    measure('запросы (было)', OldBroker(), 50)
+    measure('снимок портфеля', NewBroker(), 50)
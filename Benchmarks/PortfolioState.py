@@ -0,0 +1,66 @@
+from datetime import datetime  # Работа с датой и временем
+from time import perf_counter, sleep  # Замер времени, задержка ответа брокера
+
+from FinLabPy.Core import Broker, Trade, Position  # Брокер, сделка, позиция
+from FinLabPy.BackTrader.Broker import PortfolioState  # Состояние портфеля
+
+
+class FakeBroker(Broker):
+    """Брокер без подключения. Портфель меняется сделками, каждый запрос портфеля отвечает с задержкой, как GetPortfolio"""
+    def __init__(self):
+        super().__init__('Б', 'Замер', None)
+        self.requests = 0  # Кол-во запросов портфеля
+        self.money = 1_000_000.0  # Свободные средства
+        self.quantities: dict[str, int] = {}  # Кол-во в позициях
+        self.prices: dict[str, float] = {}  # Последние цены
+
+    def get_cash(self):
+        self.requests += 1
+        sleep(0.02)
+        return self.money
+
+    def get_value(self):
+        self.requests += 1
+        sleep(0.02)
+        return self.money + sum(quantity * self.prices[dataname] for dataname, quantity in self.quantities.items())
+
+    def get_positions(self):
+        self.requests += 1
+        sleep(0.02)
+        return [Position(self, dataname, dataname, 2, quantity, self.prices[dataname], self.prices[dataname]) for dataname, quantity in self.quantities.items() if quantity]
+
+    def close(self):
+        pass
+
+    def fill(self, dataname, quantity, price):
+        """Сделка на бирже: меняет портфель и приходит по подписке вместе с позицией"""
+        self.money -= quantity * price
+        self.quantities[dataname] = self.quantities.get(dataname, 0) + quantity
+        self.prices[dataname] = price
+        self.on_trade.trigger(Trade(self, '1', dataname, dataname, 2, datetime.now(), quantity, price))
+        self.on_position.trigger(Position(self, dataname, dataname, 2, self.quantities[dataname], price, price))
+
+
+def trades(broker, on_fill):
+    """100 сделок по 10 тикерам. После каждой сделки стратегия запрашивает свободные средства и стоимость портфеля"""
+    dt_start = perf_counter()
+    for i in range(100):
+        broker.fill(f'TQBR.T{i % 10}', 10 if i % 3 else -5, 100.0 + i % 7)
+        cash, value = on_fill()
+    return perf_counter() - dt_start, cash, value
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    broker = FakeBroker()
+    seconds, cash, value = trades(broker, lambda: (broker.get_cash(), broker.get_value()))  # Запросы к брокеру на каждую сделку, как в BackTrader.Broker._on_trade (было)
+    print(f'запросы на сделку (было): запросов {broker.requests:>4}, {seconds * 1000:6.0f} мс, свободные средства {cash:,.2f}, стоимость {value:,.2f}')
+
+    broker = FakeBroker()
+    portfolio = PortfolioState(broker, reconcile_seconds=0)  # Сверку вызываем вручную в конце
+    portfolio.start()
+    broker.requests = 0
+    seconds, cash, value = trades(broker, lambda: (portfolio.cash, portfolio.value))
+    print(f'состояние портфеля      : запросов {broker.requests:>4}, {seconds * 1000:6.0f} мс, свободные средства {cash:,.2f}, стоимость {value:,.2f}')
+    portfolio.reconcile()
+    print(f'сверка с брокером       : запросов {broker.requests:>4}, расхождение {portfolio.drift:.2f}')
+    portfolio.stop()
@@ -0,0 +1,98 @@
+from time import perf_counter  # Замер времени
+
+import numpy as np  # Бары в колонках
+import backtrader as bt
+from backtrader import date2num
+
+from FinLabPy.Core import Broker, Symbol, BarSeries  # Брокер, тикер, бары в колонках
+from FinLabPy.BackTrader import Store, Data  # Хранилище и данные для BackTrader
+
+
+class FakeBroker(Broker):
+    """Брокер без подключения. История создается в памяти"""
+    def __init__(self):
+        super().__init__('Б', 'Замер', None)
+
+    def get_symbol_by_dataname(self, dataname):
+        board, symbol = dataname.split('.')
+        return Symbol(board, symbol, dataname, symbol, 2, 0.01, 1)
+
+    def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
+        return history[:count]
+
+    def close(self):
+        pass
+
+
+class OldData(Data):
+    """Загрузка истории по одному бару (как было)"""
+    def start(self):
+        super(Data, self).start()
+        self.validator = self._new_validator()
+        self.old_bars = [bar for bar in self.store.data.get_history(self.symbol, self.time_frame) if self.validator.is_bar_valid(bar)]  # Проверка каждого бара
+
+    def preload(self):
+        super(Data, self).preload()  # Загрузка по одному бару через _load
+
+    def _load(self):
+        if len(self.old_bars) == 0:
+            return False
+        bar = self.old_bars.pop(0)
+        self.lines.datetime[0] = date2num(bar.datetime)
+        self.lines.open[0] = bar.open
+        self.lines.high[0] = bar.high
+        self.lines.low[0] = bar.low
+        self.lines.close[0] = bar.close
+        self.lines.volume[0] = bar.volume
+        self.lines.openinterest[0] = 0
+        return True
+
+
+class SmaCross(bt.Strategy):
+    """Стратегия замера"""
+    def __init__(self):
+        self.cross = bt.ind.CrossOver(bt.ind.SMA(period=10), bt.ind.SMA(period=30))
+
+
+def measure_feed(name, data_cls, bars_count):
+    """Время загрузки истории в линии BackTrader без прогона стратегии"""
+    global count
+    count = bars_count
+    data = data_cls(dataname='TQBR.SBER', timeframe=bt.TimeFrame.Minutes, compression=1, broker=broker)
+    data.setenvironment(bt.Cerebro())  # Окружение нужно данным для запуска
+    dt_start = perf_counter()
+    data._start()  # Получение и проверка истории
+    data.preload()  # Запись в линии
+    seconds = perf_counter() - dt_start
+    print(f'{name:<24}: {bars_count:>9,} бар {seconds * 1000:10.0f} мс, в линиях {data.buflen():,} бар')
+    return seconds
+
+
+def measure_run(name, bars_count):
+    """Время прогона стратегии в Cerebro с предварительной загрузкой"""
+    global count
+    count = bars_count
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(Data(dataname='TQBR.SBER', timeframe=bt.TimeFrame.Minutes, compression=1, broker=broker))
+    cerebro.addstrategy(SmaCross)
+    dt_start = perf_counter()
+    cerebro.run(preload=True, runonce=True)
+    seconds = perf_counter() - dt_start
+    print(f'{name:<24}: {bars_count:>9,} бар {seconds * 1000:10.0f} мс')
+    return seconds
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    count = 0  # Кол-во бар в текущем замере
+    date_time = np.datetime64('2020-01-01T10:00', 'ns') + np.arange(1_000_000) * np.timedelta64(1, 'm')  # Минутные бары подряд
+    prices = np.round(300 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, len(date_time))), 2)  # Случайные цены
+    history = BarSeries('TQBR', 'SBER', 'TQBR.SBER', 'M1', date_time, prices, prices + 0.5, prices - 0.5, prices, np.full(len(date_time), 1000))
+
+    broker = FakeBroker()
+    Store(broker=broker)  # Хранилище BackTrader с брокером замера
+    old = measure_feed('по одному бару (было)', OldData, 100_000)  # Удаление первого бара из списка O(n). На 1 млн. бар не дождаться
+    new = measure_feed('колонками', Data, 100_000)
+    print(f'Ускорение загрузки: {old / new:.0f}x')
+    feed = measure_feed('колонками', Data, 1_000_000)
+    run = measure_run('Cerebro со стратегией', 1_000_000)
+    print(f'Доля загрузки истории во времени прогона: {feed / run:.1%}')
@@ -0,0 +1,86 @@
+from time import sleep  # Пауза между барами
+from shutil import rmtree  # Удаление хранилища замера
+from os import path  # Папка хранилища
+
+from FinLabPy.Core import Event  # Событие
+from FinLabPy.Brokers.Quik import Quik  # Брокер QUIK
+
+
+class FakeQuikPy:
+    """Провайдер QUIK без подключения. Считает запросы к QUIK через LUA скрипты"""
+    currency = 'SUR'
+
+    def __init__(self, count):
+        self.requests = 0  # Кол-во запросов к QUIK
+        self.accounts = [dict(account_id=0, client_code='К', firm_id='Ф', trade_account_id='С', futures=False)]  # Счет фондового рынка
+        self.depo_limits = [dict(client_code='К', firmid='Ф', limit_kind=1, currentbal=10, sec_code=f'T{i:02}', wa_position_price=100.0) for i in range(count)]  # Позиции
+        self.on_new_candle, self.on_trans_reply, self.on_order, self.on_stop_order, self.on_trade = Event(), Event(), Event(), Event(), Event()
+
+    def request(self, data):
+        self.requests += 1
+        return dict(data=data)
+
+    def get_classes_list(self):
+        return self.request('TQBR,SPBFUT')
+
+    def get_all_depo_limits(self):
+        return self.request(self.depo_limits)
+
+    def get_money_limits(self):
+        return self.request([dict(client_code='К', firmid='Ф', limit_kind=1, currcode='SUR', currentbal=100_000.0)])
+
+    def get_security_class(self, class_codes, sec_code):
+        return self.request('TQBR')
+
+    def get_symbol_info(self, class_code, sec_code):
+        self.requests += 1
+        return dict(short_name=sec_code, scale=2, min_price_step=0.01, lot_size=1)
+
+    def get_param_ex(self, class_code, sec_code, param_name):
+        return self.request(dict(param_value='101.0'))
+
+    @staticmethod
+    def class_sec_codes_to_dataname(class_code, sec_code):
+        return f'{class_code}.{sec_code}'
+
+    @staticmethod
+    def quik_price_to_price(class_code, sec_code, price):
+        return price
+
+
+def measure(name, count, get_portfolio):
+    """Стратегия на каждом баре запрашивает стоимость портфеля, свободные средства и позиции"""
+    provider = FakeQuikPy(count)
+    broker = Quik('К', 'Замер', provider, lots=False)
+    get_portfolio(broker)  # Первый бар получает режимы торгов и спецификации тикеров
+    provider.requests = 0
+    bars = 10
+    for _ in range(bars):
+        sleep(max(broker.snapshot_ttl, broker.last_prices_ttl) * 2)  # Следующий бар приходит после окончания жизни снимка и цен
+        get_portfolio(broker)
+    print(f'{name:<28}: {count} позиций, {provider.requests / bars:6.1f} запросов к QUIK на бар')
+    return broker
+
+
+def old_portfolio(broker):
+    """Каждая функция портфеля запрашивает позиции заново, режим торгов и цена запрашиваются на каждую позицию (было)"""
+    for _ in range(2):  # get_value запрашивал позиции, затем стратегия запрашивала их сама
+        for depo_limit in broker.provider.get_all_depo_limits()['data']:
+            broker.provider.get_security_class(broker.class_codes, depo_limit['sec_code'])
+            broker.provider.get_param_ex('TQBR', depo_limit['sec_code'], 'LAST')
+    broker.provider.get_money_limits()  # get_value
+    broker.provider.get_money_limits()  # get_cash
+
+
+def new_portfolio(broker):
+    broker.get_value()
+    broker.get_cash()
+    broker.get_positions()
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    Quik.snapshot_ttl = Quik.last_prices_ttl = 0.02  # Бары чаще, чем время жизни по умолчанию
+    measure('запросы по позициям (было)', 50, old_portfolio)
+    broker = measure('снимок портфеля', 50, new_portfolio)
+    broker.storage.save_symbols()  # Сохраняем спецификации до удаления папки
+    rmtree(path.dirname(broker.storage.symbols_filename), ignore_errors=True)  # Удаляем хранилище замера
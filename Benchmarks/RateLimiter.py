@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter, sleep  # Замер времени, задержка ответа провайдера
+from threading import Lock, Thread  # Подсчет запросов, одновременные скачивания
+from collections import deque  # Время последних запросов провайдера
+
+from FinLabPy.Core import Broker, RateLimiter, Symbol, BarSeries  # Брокер, ограничение частоты запросов, тикер, бары в колонках
+
+
+class ThrottledError(Exception):
+    """Провайдер отклонил запрос из-за превышения частоты запросов"""
+
+
+class FakeProvider:
+    """Провайдер без подключения. Отклоняет запросы сверх лимита за последнюю секунду, как брокеры"""
+    limit = 20  # Максимальное кол-во запросов за секунду
+
+    def __init__(self):
+        self.requests = 0  # Кол-во запросов
+        self.rejected = 0  # Кол-во отклоненных запросов
+        self.times = deque()  # Время запросов за последнюю секунду
+        self.lock = Lock()
+
+    def get_candles(self, seconds_from, seconds_to):
+        with self.lock:
+            self.requests += 1
+            now = perf_counter()
+            while len(self.times) > 0 and now - self.times[0] >= 1:  # Убираем запросы старше секунды
+                self.times.popleft()
+            if len(self.times) >= self.limit:  # Если лимит исчерпан
+                self.rejected += 1
+                raise ThrottledError
+            self.times.append(now)
+        sleep(0.02)  # Задержка ответа провайдера
+        return [(datetime.fromtimestamp(seconds), 100.0, 101.0, 99.0, 100.0, 1) for seconds in range(seconds_from, seconds_to + 1, 60)]  # Минутные бары окна
+
+
+class FakeBroker(Broker):
+    """Брокер, скачивающий историю окнами по 1 дню. Отклоненный запрос повторяет через секунду"""
+    history_workers = 8
+
+    def __init__(self, code, provider):
+        super().__init__(code, 'Замер', provider)
+
+    def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
+        def fetch(window_from, window_to):
+            while True:
+                self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
+                try:
+                    return self.provider.get_candles(window_from, window_to)
+                except ThrottledError:  # Если провайдер отклонил запрос
+                    sleep(1)  # то ждем и повторяем запрос
+
+        rows = self._download_history(self._history_windows(symbol, time_frame, int(dt_from.timestamp()), int(dt_to.timestamp()), int(timedelta(days=1).total_seconds())), fetch)
+        return BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, time_frame, rows)
+
+    def close(self):
+        pass
+
+
+def measure(name, rate_limits):
+    """Одновременное скачивание истории двумя брокерами одного провайдера"""
+    FakeBroker.rate_limits = rate_limits
+    provider = FakeProvider()
+    providers.append(provider)  # Ограничения хранятся по идентификатору провайдера. Провайдер не должен удаляться, чтобы его идентификатор не достался следующему
+    brokers = [FakeBroker(code, provider) for code in ('Б1', 'Б2')]  # Брокеры делят провайдера, как счета в Config.brokers
+    threads = [Thread(target=broker.get_history, args=(symbol, 'M1', datetime(2024, 1, 1), datetime(2024, 3, 31))) for broker in brokers]
+    dt_start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = perf_counter() - dt_start
+    print(f'{name:<22}: запросов {provider.requests:>4}, отклонено {provider.rejected:>4}, {seconds * 1000:6.0f} мс')
+    print(f'{"":<22}  {brokers[0].rate_limiter}')
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    providers = []  # Провайдеры замеров
+    symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)
+    print(f'Лимит провайдера: {FakeProvider.limit} запросов в секунду')
+    measure('без ограничения (было)', {})
+    measure('общий бюджет', {RateLimiter.MarketData: (FakeProvider.limit * 0.9, 1)})  # Запас 10% на неточность часов
@@ -0,0 +1,99 @@
+from datetime import time, timedelta  # Время сессии
+from time import perf_counter, sleep  # Замер времени, задержка ответа брокера
+from threading import Thread, Event, Lock, active_count  # Потоки старого способа, кол-во потоков
+
+from FinLabPy.Core import Broker, Symbol, BarSeries  # Брокер, тикер, бары в колонках
+from FinLabPy.Schedule.MarketSchedule import Schedule, Session  # Расписание торгов биржи
+from FinLabPy.Schedule.Scheduler import BarsScheduler  # Запросы новых бар по расписанию
+
+
+class FakeBroker(Broker):
+    """Брокер без подключения. Отвечает на запрос истории с задержкой сети"""
+    def __init__(self):
+        super().__init__('Б', 'Замер', None)
+        self.requests = 0  # Кол-во запросов истории
+        self.active = 0  # Кол-во одновременных запросов
+        self.max_active = 0  # Максимальное кол-во одновременных запросов
+        self.lock = Lock()
+
+    def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        sleep(0.05)  # Задержка ответа брокера
+        with self.lock:
+            self.active -= 1
+        return BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, time_frame, [(dt_from, 100.0, 101.0, 99.0, 100.0, 1)])
+
+    def close(self):
+        pass
+
+
+class WeekdaySchedule(Schedule):
+    """Круглосуточное расписание, в котором всегда будний день. Чтобы замер не ждал окончания выходных"""
+    def __init__(self):
+        super().__init__([Session(time(0, 0, 0), time(23, 59, 59))], timedelta(seconds=1))
+        self.days = timedelta(days=(2 - super().market_datetime_now.weekday()) % 7)  # Сдвиг на среду
+
+    @property
+    def market_datetime_now(self):
+        return super().market_datetime_now + self.days
+
+
+def on_new_bar(bar):
+    """Замер времени получения бара от наступления времени запроса"""
+    received.append(perf_counter())
+
+
+def bars_stream(broker, symbol, exit_event):
+    """Поток получения новых бар по расписанию (как было). Один поток на подписку"""
+    while True:
+        market_datetime_now = schedule.market_datetime_now
+        trade_bar_open_datetime = schedule.trade_bar_open_datetime(market_datetime_now, time_frame)
+        trade_bar_request_datetime = schedule.trade_bar_request_datetime(market_datetime_now, time_frame)
+        if exit_event.wait((trade_bar_request_datetime - market_datetime_now).total_seconds()):
+            return
+        on_new_bar(broker.get_history(symbol, time_frame, trade_bar_open_datetime)[0])
+
+
+def wait_bars():
+    """Ожидание новых бар по всем подпискам. Время от первого до последнего полученного бара"""
+    while len(received) < feeds:
+        sleep(0.01)
+    return received[-1] - received[0]
+
+
+def report(name, broker, threads, seconds):
+    print(f'{name:<22}: потоков {threads:>4}, запросов {broker.requests:>4}, одновременно {broker.max_active:>4}, все бары за {seconds * 1000:8.0f} мс')
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    feeds = 200  # Кол-во подписок
+    tickers = 100  # Кол-во тикеров. На каждый тикер по 2 подписки (например, 2 стратегии)
+    time_frame = 'M1'  # Минутные бары. Замер ждет следующую минуту
+    schedule = WeekdaySchedule()  # Круглосуточное расписание
+    symbols = [Symbol('TQBR', f'T{i:03}', f'TQBR.T{i:03}', f'T{i:03}', 2, 0.01, 1) for i in range(tickers)]
+    received = []  # Время получения бар
+
+    threads = active_count()
+    for max_workers in (8, 25):  # Размер пула потоков ограничивает нагрузку на брокера
+        received.clear()
+        broker = FakeBroker()
+        scheduler = BarsScheduler(max_workers)
+        for i in range(feeds):
+            scheduler.subscribe(broker, symbols[i % tickers], time_frame, schedule, on_new_bar)
+        seconds = wait_bars()
+        report(f'общее расписание {max_workers}', broker, active_count() - threads, seconds)
+        scheduler.close()
+
+    received.clear()
+    broker = FakeBroker()
+    exit_event = Event()
+    for i in range(feeds):
+        Thread(target=bars_stream, args=(broker, symbols[i % tickers], exit_event), daemon=True).start()
+    sleep(1)  # Все потоки ждут запроса
+    stream_threads = active_count() - threads
+    seconds = wait_bars()
+    report('поток на подписку', broker, stream_threads, seconds)
+    exit_event.set()
@@ -0,0 +1,90 @@
+import logging
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter, sleep  # Замер времени, задержка ответа провайдера
+from shutil import rmtree  # Удаление хранилищ замера
+from os import path  # Файл состояния прогрева
+import tempfile  # Папка файла состояния прогрева
+
+from FinLabPy.Core import Broker, Symbol, bar_cache  # Брокер, тикер, кэш бар
+from FinLabPy.Storage.Warmup import HistoryWarmup  # Прогрев истории
+
+
+class FakeProvider:
+    """Провайдер без подключения. Отвечает на запрос окна истории с задержкой"""
+    def get_candles(self, seconds_from, seconds_to):
+        sleep(0.01)  # Задержка ответа провайдера
+        return [(datetime.fromtimestamp(seconds), 100.0, 101.0, 99.0, 100.0, 1) for seconds in range(seconds_from, seconds_to, 3600)]  # Часовые бары окна
+
+
+class FakeBroker(Broker):
+    """Брокер, скачивающий историю окнами по 30 дней. Тикеры из списка failed не находятся"""
+    def __init__(self, code):
+        super().__init__(code, f'Замер{code}', FakeProvider(), storage='bin')
+        self.storage = self.storage.__class__(f'Замер{code}')  # Отдельное хранилище на брокера
+        self.failed = set()  # Названия тикеров, которые не находятся
+
+    def get_symbol_by_dataname(self, dataname):
+        if dataname in self.failed:
+            return None
+        board, symbol = dataname.split('.')
+        return Symbol(board, symbol, dataname, symbol, 2, 0.01, 1)
+
+    def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
+        return self.sync_history(symbol, time_frame, dt_from, dt_to)
+
+    def close(self):
+        pass
+
+    def _fetch_history(self, symbol, time_frame, dt_from, dt_to):
+        seconds_from, seconds_to = int((dt_from or datetime(2024, 1, 1)).timestamp()), int(min(dt_to or dt_end, dt_end).timestamp())
+        windows = self._history_windows(symbol, time_frame, seconds_from, seconds_to, int(timedelta(days=30).total_seconds()))
+        return self._download_history(windows, lambda window_from, window_to: self._fetch(window_from, min(window_to, seconds_to)))
+
+    def _fetch(self, window_from, window_to):
+        self._limit('market_data')  # Считаем запрос
+        return self.provider.get_candles(window_from, window_to)
+
+
+def clear(brokers):
+    """Пустые хранилища и кэш"""
+    bar_cache.clear()
+    for broker in brokers:
+        rmtree(broker.storage.datapath, ignore_errors=True)
+        broker.storage = broker.storage.__class__(broker.storage.source)
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    logging.disable(logging.ERROR)  # Пустые хранилища и ошибки прогрева не логируем
+    dt_end = datetime(2025, 1, 1)  # Окончание истории у провайдера
+    datanames = [f'X.T{i:03}' for i in range(40)]  # Тикеры. Режим торгов без расписания, окна идут подряд
+    time_frames = ['M60', 'M240']
+    brokers = [FakeBroker('Б1'), FakeBroker('Б2')]  # Брокеры с разными провайдерами
+    state_filename = path.join(tempfile.mkdtemp(), 'Warmup.json')
+    print(f'{len(brokers)} брокера x {len(datanames)} тикеров x {len(time_frames)} интервала, история за 2024 год окнами по 30 дней, ответ провайдера 10 мс')
+
+    clear(brokers)
+    dt_start = perf_counter()
+    bars = 0
+    for broker in brokers:  # Цикл по тикерам, как в Brokers/Examples/BarsHistory.py (было)
+        for dataname in datanames:
+            for time_frame in time_frames:
+                bars += len(broker.get_history(broker.get_symbol_by_dataname(dataname), time_frame, datetime(2024, 1, 1)))
+    seconds = perf_counter() - dt_start
+    print(f'цикл (было)     : {bars:,} бар за {seconds:.2f} с, {bars / seconds:,.0f} бар/с')
+
+    clear(brokers)
+    warmup = HistoryWarmup(brokers, workers=4, state_filename=state_filename)
+    stats = warmup.run(datanames, time_frames, datetime(2024, 1, 1))
+    print(f'прогрев         : {stats}')
+
+    clear(brokers)
+    brokers[1].failed = set(datanames[::2])  # Половина тикеров второго брокера с ошибкой, как при обрыве связи
+    stats = warmup.run(datanames, time_frames, datetime(2024, 1, 1))
+    print(f'прогрев с ошибками: {stats}, файл состояния {"сохранен" if path.isfile(state_filename) else "удален"}')
+    brokers[1].failed = set()
+    stats = warmup.run(datanames, time_frames, datetime(2024, 1, 1))
+    print(f'продолжение     : {stats}, файл состояния {"сохранен" if path.isfile(state_filename) else "удален"}')
+
+    data_path = path.normpath(path.join(brokers[0].storage.datapath, '..', '..'))  # Папка хранилищ
+    for source in [broker.storage.source for broker in brokers] + [FakeBroker.__name__]:  # Удаляем хранилища замера
+        rmtree(path.join(data_path, source), ignore_errors=True)
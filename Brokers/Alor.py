@@ -1,12 +1,15 @@
 import logging
 from datetime import datetime, UTC
 
-from FinLabPy.Core import Broker, Bar, Position, Trade, Order, Symbol  # Брокер, бар, позиция, сделка, заявка, тикер
+from FinLabPy.Core import Broker, RateLimiter, Bar, Position, PortfolioSnapshot, Trade, Order, Symbol  # Брокер, бар, позиция, снимок портфеля, сделка, заявка, тикер
 from AlorPy import AlorPy  # Работа с Alor OpenAPI V2 из Python через REST/WebSockets
 
 
 class Alor(Broker):
     """Брокер Алор"""
+    rate_limits = {RateLimiter.MarketData: (10, 20),  # Бюджеты запросов Alor OpenAPI. Рыночные данные - 10 запросов в секунду
+                   RateLimiter.Orders: (5, 10),  # Заявки - 5 запросов в секунду
+                   RateLimiter.Portfolio: (5, 10)}  # Портфель - 5 запросов в секунду
     def __init__(self, code, name, provider: AlorPy, account_id=0, exchange=AlorPy.exchanges[0], storage='file'):
         super().__init__(code, name, provider, account_id, storage)
         logging.getLogger('urllib3').setLevel(logging.CRITICAL + 1)  # Не получаем сообщения подключений и отправки запросов в лог
@@ -15,6 +18,7 @@ class Alor(Broker):
         account = self.provider.accounts[self.account_id]  # Номер счета по порядковому номеру
         self.portfolio = account['portfolio']  # Портфель
         self.exchange = exchange  # Биржа
+        self.storage.add_symbol_index('exchange_symbol', lambda symbol: (symbol.broker_info['exchange'], symbol.symbol))  # Индекс тикеров по бирже и коду Алора
 
         self.provider.on_new_bar.subscribe(self._on_new_bar)  # Подписка на новые бары
         self.provider.on_order.subscribe(self._on_order)  # Подписка на заявки
@@ -31,29 +35,7 @@ class Alor(Broker):
         return self._get_symbol_info(exchange, alor_symbol)
 
     def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
-        bars = super().get_history(symbol, time_frame, dt_from, dt_to)  # Получаем бары из хранилища
-        alor_tf, intraday = self.provider.timeframe_to_alor_timeframe(time_frame)  # Временной интервал Алор с признаком внутридневного интервала
-        if bars is None:  # Если бары из хранилища не получены
-            bars = []  # Пока список полученных бар пустой
-            seconds_from = 0 if dt_from is None else self.provider.msk_datetime_to_timestamp(dt_from)  # Первый возможный бар
-        else:  # Если бары из хранилища получены
-            seconds_from = self.provider.msk_datetime_to_timestamp(bars[-1].datetime) if intraday else int(bars[-1].datetime.timestamp())  # Дата и время открытия последнего бара
-            del bars[-1]  # Удаляем последний бар. Он перепишется первым полученным баром за период
-        seconds_to = self.provider.msk_datetime_to_timestamp(datetime.now() if dt_to is None else dt_to)  # Последний возможный бар
-        exchange = symbol.broker_info['exchange']  # Биржа
-        history = self.provider.get_history(exchange, symbol.symbol, alor_tf, seconds_from, seconds_to)  # Запрос истории рынка
-        if 'history' not in history:  # Если в полученной истории нет ключа history
-            return None  # то выходим, дальше не продолжаем
-        for bar in history['history']:  # Пробегаемся по всем пришедшим барам
-            dt_msk = self.provider.timestamp_to_msk_datetime(bar['time']) if intraday else datetime.fromtimestamp(bar['time'], UTC).replace(tzinfo=None)  # Дневные бары и выше ставим на начало дня по UTC. Остальные - по МСК
-            open_ = self.provider.alor_price_to_price(exchange, symbol.symbol, bar['open'])  # Конвертируем цены
-            high = self.provider.alor_price_to_price(exchange, symbol.symbol, bar['high'])  # из цен Алор
-            low = self.provider.alor_price_to_price(exchange, symbol.symbol, bar['low'])  # в зависимости от
-            close = self.provider.alor_price_to_price(exchange, symbol.symbol, bar['close'])  # режима торгов
-            volume = self.provider.lots_to_size(exchange, symbol.symbol, int(bar['volume']))  # Объем в штуках
-            bars.append(Bar(symbol.board, symbol.symbol, symbol.dataname, time_frame, dt_msk, open_, high, low, close, volume))  # Добавляем бар
-        self.storage.set_bars(bars)  # Сохраняем бары в хранилище
-        return bars
+        return self.sync_history(symbol, time_frame, dt_from, dt_to)  # Бары из хранилища, дополненные недостающими интервалами от провайдера
 
     def subscribe_history(self, symbol, time_frame):
         if (symbol, time_frame) in self.history_subscriptions.keys():  # Если подписка уже есть
@@ -69,43 +51,23 @@ class Alor(Broker):
 
     def get_last_price(self, symbol):
         exchange = symbol.broker_info['exchange']  # Биржа
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
         quotes = self.provider.get_quotes(f'{exchange}:{symbol.symbol}')[0]  # Последнюю котировку получаем через запрос
         return None if quotes is None else self.provider.alor_price_to_price(exchange, symbol.symbol, quotes['last_price'])  # Последняя цена сделки
 
     def get_value(self):
-        return round(self.provider.get_risk(self.portfolio, self.exchange)['portfolioLiquidationValue'], 2)  # Общая стоимость портфеля
+        return self.get_snapshot().value  # Общая стоимость портфеля из снимка
 
     def get_cash(self):
-        if self.portfolio[0:3] == '750':  # Для счета срочного рынка
-            cash = round(self.provider.get_forts_risk(self.portfolio, self.exchange)['moneyFree'], 2)  # Свободные средства. Сумма рублей и залогов, дисконтированных в рубли, доступная для открытия позиций. (MoneyFree = MoneyAmount + VmInterCl – MoneyBlocked – VmReserve – Fee)
-        else:  # Для остальных счетов
-            cash = next((position['qtyUnits'] for position in self.provider.get_positions(self.portfolio, self.exchange, False) if position['symbol'] == 'RUB'), 0)  # Свободные средства через денежную позицию
-        return round(cash, 2)
+        return self.get_snapshot().cash  # Свободные средства из снимка
 
     def get_positions(self):
-        self.positions = []  # Текущие позиции
-        for position in self.provider.get_positions(self.portfolio, self.exchange, True):  # Пробегаемся по всем позициям без денежной позиции
-            if position['qty'] == 0:  # Если кол-во нулевое (позиция закрыта)
-                continue  # то переходим на следующую позицию, дальше не продолжаем
-            alor_symbol = position['symbol']  # Тикер
-            exchange = position['exchange']  # Биржа
-            symbol = self._get_symbol_info(exchange, alor_symbol)  # Спецификация тикера по бирже и тикеру Алора
-            size = self.provider.lots_to_size(exchange, symbol.symbol, position['qty'])  # Кол-во в штуках
-            entry_price = self.provider.alor_price_to_price(exchange, symbol.symbol, position['avgPrice'])  # Цена входа
-            # last_price = position['currentVolume'] / size  # Последняя цена по bid/ask
-            last_price = entry_price + position['unrealisedPl'] / size  # Последняя цена по бумажной прибыли/убытку
-            self.positions.append(Position(  # Добавляем текущую позицию в список
-                self,  # Брокер
-                symbol.dataname,  # Название тикера
-                symbol.description,  # Описание тикера
-                symbol.decimals,  # Кол-во десятичных знаков в цене
-                size,  # Кол-во в штуках
-                entry_price,  # Средняя цена входа в рублях
-                last_price))  # Последняя цена в рублях
+        self.positions = list(self.get_snapshot().positions)  # Текущие позиции из снимка
         return self.positions
 
     def get_orders(self):
         self.orders = []  # Активные заявки
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         orders = self.provider.get_orders(self.portfolio, self.exchange)  # Получаем список активных заявок
         for order in orders:  # Пробегаемся по всем активным заявкам
             if order['status'] != 'working':  # Если заявка исполнена/отменена/отклонена
@@ -124,6 +86,7 @@ class Alor(Broker):
                 self.provider.alor_price_to_price(exchange, symbol.symbol, order['price']),  # Цена
                 0,  # Цена срабатывания стоп заявки
                 Order.Accepted if int(order['filledQtyBatch']) == 0 else Order.Partial))  # Статус
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         stop_orders = self.provider.get_stop_orders(self.portfolio, self.exchange)  # Получаем список активных стоп заявок
         for stop_order in stop_orders:  # Пробегаемся по всем активным стоп заявкам
             if stop_order['status'] != 'working':  # Если заявка исполнена/отменена/отклонена
@@ -154,6 +117,7 @@ class Alor(Broker):
         alor_board = self.provider.board_to_alor_board(symbol.board)  # Код режима торгов Алора
         condition = 'MoreOrEqual' if order.buy else 'LessOrEqual'  # Условие срабатывания стоп цены
         response = None  # Результат запроса
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         if order.exec_type == Order.Market:  # Рыночная заявка
             response = self.provider.create_market_order(self.portfolio, exchange, symbol.symbol, side, quantity, alor_board)
         elif order.exec_type == Order.Limit:  # Лимитная заявка
@@ -173,6 +137,7 @@ class Alor(Broker):
         symbol = self.get_symbol_by_dataname(order.dataname)  # Тикер
         exchange = symbol.broker_info['exchange']  # Биржа
         stop = order.exec_type in (Order.Stop, Order.StopLimit)  # Удаляем стоп заявку
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         self.provider.delete_order(self.portfolio, exchange, int(order.id), stop)  # Отменяем заявку по номеру
 
     def subscribe_transactions(self):
@@ -202,11 +167,71 @@ class Alor(Broker):
 
     # Внутренние функции
 
+    def _fetch_last_prices(self, symbols):
+        """Последние цены тикеров одним запросом котировок по списку тикеров через запятую"""
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
+        quotes = self.provider.get_quotes(','.join(f'{symbol.broker_info["exchange"]}:{symbol.symbol}' for symbol in symbols)) or []  # Последние котировки всех тикеров
+        prices = {(quote['exchange'], quote['symbol']): self.provider.alor_price_to_price(quote['exchange'], quote['symbol'], quote['last_price']) for quote in quotes if quote is not None}  # Последние цены сделок по бирже и тикеру
+        return {symbol.dataname: prices.get((symbol.broker_info['exchange'], symbol.symbol)) for symbol in symbols}
+
+    def _fetch_snapshot(self):
+        """Снимок портфеля: оценка портфеля и все позиции вместе с денежной. Для счета срочного рынка свободные средства запрашиваются отдельно"""
+        self._limit(RateLimiter.Portfolio)  # Ждем, если бюджет запросов к провайдеру исчерпан
+        value = round(self.provider.get_risk(self.portfolio, self.exchange)['portfolioLiquidationValue'], 2)  # Общая стоимость портфеля
+        self._limit(RateLimiter.Portfolio)  # Ждем, если бюджет запросов к провайдеру исчерпан
+        alor_positions = self.provider.get_positions(self.portfolio, self.exchange, False)  # Все позиции вместе с денежной
+        if self.portfolio[0:3] == '750':  # Для счета срочного рынка
+            self._limit(RateLimiter.Portfolio)  # Ждем, если бюджет запросов к провайдеру исчерпан
+            cash = self.provider.get_forts_risk(self.portfolio, self.exchange)['moneyFree']  # Свободные средства. Сумма рублей и залогов, дисконтированных в рубли, доступная для открытия позиций. (MoneyFree = MoneyAmount + VmInterCl – MoneyBlocked – VmReserve – Fee)
+        else:  # Для остальных счетов
+            cash = next((position['qtyUnits'] for position in alor_positions if position['symbol'] == 'RUB'), 0)  # Свободные средства через денежную позицию
+        positions = []  # Текущие позиции
+        for position in alor_positions:  # Пробегаемся по всем позициям
+            if position['isCurrency'] or position['qty'] == 0:  # Если денежная позиция или кол-во нулевое (позиция закрыта)
+                continue  # то переходим на следующую позицию, дальше не продолжаем
+            alor_symbol = position['symbol']  # Тикер
+            exchange = position['exchange']  # Биржа
+            symbol = self._get_symbol_info(exchange, alor_symbol)  # Спецификация тикера по бирже и тикеру Алора
+            size = self.provider.lots_to_size(exchange, symbol.symbol, position['qty'])  # Кол-во в штуках
+            entry_price = self.provider.alor_price_to_price(exchange, symbol.symbol, position['avgPrice'])  # Цена входа
+            # last_price = position['currentVolume'] / size  # Последняя цена по bid/ask
+            last_price = entry_price + position['unrealisedPl'] / size  # Последняя цена по бумажной прибыли/убытку
+            positions.append(Position(  # Добавляем текущую позицию в список
+                self,  # Брокер
+                symbol.dataname,  # Название тикера
+                symbol.description,  # Описание тикера
+                symbol.decimals,  # Кол-во десятичных знаков в цене
+                size,  # Кол-во в штуках
+                entry_price,  # Средняя цена входа в рублях
+                last_price))  # Последняя цена в рублях
+        return PortfolioSnapshot(value, round(cash, 2), positions)
+
+    def _fetch_history(self, symbol, time_frame, dt_from, dt_to):
+        alor_tf, intraday = self.provider.timeframe_to_alor_timeframe(time_frame)  # Временной интервал Алор с признаком внутридневного интервала
+        seconds_from = 0 if dt_from is None else self.provider.msk_datetime_to_timestamp(dt_from)  # Первый возможный бар
+        seconds_to = self.provider.msk_datetime_to_timestamp(datetime.now() if dt_to is None else dt_to)  # Последний возможный бар
+        exchange = symbol.broker_info['exchange']  # Биржа
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
+        history = self.provider.get_history(exchange, symbol.symbol, alor_tf, seconds_from, seconds_to)  # Запрос истории рынка
+        if 'history' not in history:  # Если в полученной истории нет ключа history
+            return []  # то бар нет
+        rows = []  # Строки полученных бар
+        for bar in history['history']:  # Пробегаемся по всем пришедшим барам
+            dt_msk = self.provider.timestamp_to_msk_datetime(bar['time']) if intraday else datetime.fromtimestamp(bar['time'], UTC).replace(tzinfo=None)  # Дневные бары и выше ставим на начало дня по UTC. Остальные - по МСК
+            open_ = self.provider.alor_price_to_price(exchange, symbol.symbol, bar['open'])  # Конвертируем цены
+            high = self.provider.alor_price_to_price(exchange, symbol.symbol, bar['high'])  # из цен Алор
+            low = self.provider.alor_price_to_price(exchange, symbol.symbol, bar['low'])  # в зависимости от
+            close = self.provider.alor_price_to_price(exchange, symbol.symbol, bar['close'])  # режима торгов
+            volume = self.provider.lots_to_size(exchange, symbol.symbol, int(bar['volume']))  # Объем в штуках
+            rows.append((dt_msk, open_, high, low, close, volume))  # Добавляем бар
+        return rows
+
     def _get_symbol_info(self, exchange: str, alor_symbol: str) -> Symbol | None:
         """Спецификация тикера по бирже и коду Алора"""
-        symbol = next((symbol for symbol in self.storage.symbols.values() if symbol.symbol == alor_symbol and symbol.broker_info['exchange'] == exchange), None)  # Проверяем, есть ли спецификация тикера в хранилище по тикеру и бирже
+        symbol = self.storage.get_symbol_by_index('exchange_symbol', (exchange, alor_symbol))  # Проверяем, есть ли спецификация тикера в хранилище по бирже и тикеру
         if symbol is not None:  # Если есть тикер
             return symbol  # то возвращаем его, выходим, дальше не продолжаем
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
         si = self.provider.get_symbol_info(exchange, alor_symbol)  # Спецификация тикера
         if 'board' not in si:  # Если тикер не получен
             return None  # то выходим, дальше не продолжаем
@@ -237,6 +262,7 @@ class Alor(Broker):
 
     def _on_position(self, response):
         """Получение позиции по подписке"""
+        self.invalidate_snapshot()  # Событие по счету меняет портфель
         position = response['data']  # Данные позиции
         if position['isCurrency']:  # Если пришли валютные остатки (деньги)
             return  # то выходим, дальше не продолжаем
@@ -250,10 +276,11 @@ class Alor(Broker):
             symbol.decimals,  # Кол-во десятичных знаков в цене
             self.provider.lots_to_size(exchange, symbol.symbol, position['qty']),  # Кол-во в штуках
             self.provider.alor_price_to_price(exchange, symbol.symbol, position['avgPrice']),  # Цена входа в рублях за штуку
-            self.get_last_price(symbol)))  # Последняя цена в рублях за штуку
+            self.get_last_prices([symbol])[symbol.dataname]))  # Последняя цена в рублях за штуку
 
     def _on_trade(self, response):
         """Получение сделки по подписке"""
+        self.invalidate_snapshot()  # Событие по счету меняет портфель
         trade = response['data']  # Данные сделки
         if trade['existing']:  # При (пере)подключении к серверу передаются сделки как из истории, так и новые. Если сделка из истории
             return  # то выходим, дальше не продолжаем
@@ -278,6 +305,7 @@ class Alor(Broker):
 
     def _on_order(self, response):
         """Получение рыночной/лимитной заявки по подписке"""
+        self.invalidate_snapshot()  # Событие по счету меняет портфель
         order = response['data']  # Данные заявки
         exchange = order['exchange']  # Биржа
         symbol = self._get_symbol_info(exchange, order['symbol'])  # Спецификация тикера
@@ -304,6 +332,7 @@ class Alor(Broker):
 
     def _on_stop_order_v2(self, response):
         """Получение стоп/стоп лимитной заявки по подписке"""
+        self.invalidate_snapshot()  # Событие по счету меняет портфель
         stop_order = response['data']  # Данные заявки
         exchange = stop_order['exchange']  # Биржа
         symbol = self._get_symbol_info(exchange, stop_order['symbol'])  # Спецификация тикера
@@ -0,0 +1,25 @@
+import logging
+from datetime import datetime
+
+from pytz import timezone
+
+from FinLabPy.Config import brokers  # Все брокеры
+from FinLabPy.Storage.Warmup import HistoryWarmup  # Прогрев истории
+
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    datanames = ('TQBR.SBER', 'TQBR.VTBR', 'TQBR.GAZP', 'TQBR.LKOH', 'TQBR.GMKN', 'TQBR.YDEX', 'TQBR.ROSN', 'TQBR.NVTK')  # Тикеры
+    time_frames = ('M1', 'M5', 'M15', 'M60', 'D1')  # Временные интервалы
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',  # Формат сообщения
+                        datefmt='%d.%m.%Y %H:%M:%S',  # Формат даты
+                        level=logging.INFO,  # Уровень логируемых событий NOTSET/DEBUG/INFO/WARNING/ERROR/CRITICAL
+                        handlers=[logging.FileHandler('BarsWarmup.log', encoding='utf-8'), logging.StreamHandler()])  # Лог записываем в файл и выводим на консоль
+    logging.Formatter.converter = lambda *args: datetime.now(tz=timezone('Europe/Moscow')).timetuple()  # В логе время указываем по МСК
+    logging.getLogger('urllib3').setLevel(logging.CRITICAL + 1)  # Пропускаем события запросов
+
+    warmup = HistoryWarmup(list(brokers.values()))  # Прогрев истории у всех брокеров. После прерывания скрипт продолжит с невыполненных заданий
+    stats = warmup.run(datanames, time_frames)  # Прогреваем историю
+    print(stats)  # Статистика прогрева
+    for broker in brokers.values():  # Пробегаемся по всем брокерам
+        broker.close()  # Закрываем брокера
@@ -1,13 +1,16 @@
 from datetime import datetime
 from threading import Thread
 
+import grpc
 from google.protobuf.timestamp_pb2 import Timestamp
 from google.type.interval_pb2 import Interval
 from google.type.decimal_pb2 import Decimal
 
-from FinLabPy.Core import Broker, Bar, Position, Trade, Order, Symbol  # Брокер, бар, позиция, сделка, заявка, тикер
+from FinLabPy.Core import Broker, RateLimiter, Bar, Position, Trade, Order, Symbol  # Брокер, бар, позиция, сделка, заявка, тикер
+from FinLabPy.Brokers.GrpcStreams import GrpcStreams  # Потоковые подписки gRPC в одном цикле asyncio
 from FinamPy import FinamPy  # Работа с Finam Trade API gRPC https://tradeapi.finam.ru из Python
-from FinamPy.grpc.marketdata_service_pb2 import BarsRequest, BarsResponse, QuoteRequest, QuoteResponse, SubscribeBarsResponse, TimeFrame  # История
+from FinamPy.grpc.marketdata_service_pb2 import BarsRequest, BarsResponse, QuoteRequest, QuoteResponse, SubscribeBarsRequest, SubscribeBarsResponse, TimeFrame  # История
+from FinamPy.grpc.marketdata_service_pb2_grpc import MarketDataServiceStub  # Сервис рыночных данных
 from FinamPy.grpc.accounts_service_pb2 import GetAccountRequest, GetAccountResponse  # Счет
 from FinamPy.grpc.orders_service_pb2 import OrdersRequest, OrdersResponse, OrderType, OrderState, OrderStatus, Order as FinamOrder, StopCondition, CancelOrderRequest  # Заявки
 from FinamPy.grpc.side_pb2 import Side  # Покупка/продажа
@@ -16,11 +19,18 @@ from FinamPy.grpc.trade_pb2 import AccountTrade  # Сделка
 
 class Finam(Broker):
     """Брокер Финам"""
+    rate_limits = {RateLimiter.MarketData: (200 / 60, 10),  # Бюджеты запросов Finam Trade API. Рыночные данные - 200 запросов в минуту
+                   RateLimiter.Orders: (200 / 60, 5),  # Заявки - 200 запросов в минуту
+                   RateLimiter.Portfolio: (200 / 60, 5)}  # Счета - 200 запросов в минуту
     def __init__(self, code, name, provider: FinamPy, account_id=0, storage='file'):
         super().__init__(code, name, provider, account_id, storage)
         self.provider = provider  # Уже инициирован в базовом классе. Выполням для того, чтобы работать с типом провайдера
         self.account_id = self.provider.account_ids[account_id]  # Номер счета по порядковому номеру
         self.last_bars = {}  # Последний бар. Он может быть не завершен
+        self.first_trade_days: dict[str, datetime | None] = {}  # Дата первого торгового дня тикера у провайдера. Ключ - название тикера
+        self.storage.add_symbol_index('ticker_mic', lambda symbol: (symbol.symbol, symbol.broker_info['mic']))  # Индекс тикеров по тикеру и бирже Финама
+        self.bars_streams = GrpcStreams(lambda: grpc.aio.secure_channel(self.provider.server, grpc.ssl_channel_credentials()), 'FinamBarsStreams') \
+            if hasattr(self.provider, 'server') and hasattr(self.provider, 'metadata') else None  # Подписки на новые бары. Все в одном потоке и канале. Если у провайдера нет адреса сервера и авторизации, то подписываемся потоками провайдера
 
         self.provider.on_new_bar.subscribe(self._on_new_bar)  # Обработка нового бара
 
@@ -35,38 +45,9 @@ class Finam(Broker):
         return self._get_symbol_info(f'{ticker}@{mic}')
 
     def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
-        bars = super().get_history(symbol, time_frame, dt_from, dt_to)  # Получаем бары из хранилища
-        if bars is None:  # Если бары из хранилища не получены
-            bars = []  # Пока список полученных бар пустой
-            seconds_from = self.provider.msk_datetime_to_timestamp(self.provider.min_history_date if dt_from is None else dt_from)  # Первый возможный бар
-        else:  # Если бары из хранилища получены
-            seconds_from = self.provider.msk_datetime_to_timestamp(bars[-1].datetime)  # Дата и время открытия последнего бара
-        seconds_to = self.provider.msk_datetime_to_timestamp(datetime.now() if dt_to is None else dt_to)  # Последний возможный бар
-        finam_tf, tf_range, intraday = self.provider.timeframe_to_finam_timeframe(time_frame)  # Временной интервал Финама, максимальный размер запроса в днях, внутридневной бар
-        while seconds_from <= seconds_to:  # Пока нужно получать данные
-            bars_response: BarsResponse = self.provider.call_function(  # Получаем историю тикера за период
-                self.provider.marketdata_stub.Bars,  # Получение исторических данных по инструменту (агрегированные свечи)
-                BarsRequest(symbol=f'{symbol.symbol}@{symbol.broker_info['mic']}',  # Тикер Финама
-                            timeframe=finam_tf,  # Временной интервал Финама
-                            interval=Interval(start_time=Timestamp(seconds=seconds_from),  # Дата и время начала запроса
-                                              end_time=Timestamp(seconds=seconds_from + int(tf_range.total_seconds())))))  # Дата и время окончания запроса
-            if len(bars_response.bars) > 0:  # Если за период получены бары
-                if len(bars) > 0:  # Если список бар не пустой
-                    del bars[-1]  # то удаляем последний бар. Он перепишется первым полученным баром за период
-                for bar in bars_response.bars:  # Пробегаемся по всем пришедшим барам
-                    dt_msk = self.provider.timestamp_to_msk_datetime(bar.timestamp.seconds)  # Дата и время полученного бара
-                    if not intraday:  # Для дневных временнЫх интервалов и выше
-                        dt_msk = dt_msk.replace(hour=0, minute=0)  # убираем время, оставляем только дату
-                    open_ = self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(bar.open.value))  # Конвертируем цены
-                    high = self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(bar.high.value))  # из цен Финама
-                    low = self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(bar.low.value))  # в зависимости от
-                    close = self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(bar.close.value))  # режима торгов
-                    bars.append(Bar(symbol.board, symbol.symbol, symbol.dataname, time_frame, dt_msk, open_, high, low, close, int(float(bar.volume.value))))  # Добавляем бар
-            seconds_from += int(tf_range.total_seconds())  # Дату и время начала запроса переносим на дату окончания
-        if len(bars) == 0:  # Если новых бар нет
-            return None  # то выходим, дальше не продолжаем
-        self.storage.set_bars(bars)  # Сохраняем бары в хранилище
-        self.last_bars[(symbol.dataname, time_frame)] = bars[-1]  # Запомним последний бар. Он может быть не завершен
+        bars = self.sync_history(symbol, time_frame, dt_from, dt_to)  # Бары из хранилища, дополненные недостающими интервалами от провайдера
+        if bars is not None:  # Если бары получены
+            self.last_bars[(symbol.dataname, time_frame)] = bars[-1]  # Запомним последний бар. Он может быть не завершен
         return bars
 
     def subscribe_history(self, symbol, time_frame):
@@ -77,26 +58,39 @@ class Finam(Broker):
             return  # то выходим, дальше не продолжаем
         mic = self.provider.get_mic(finam_board, ticker)  # Код биржи по ISO 10383
         finam_tf, _, _ = self.provider.timeframe_to_finam_timeframe(time_frame)  # Временной интервал Финама
-        Thread(target=self.provider.subscribe_bars_thread, name=f'BarsThread {symbol.dataname} {time_frame}', args=(f'{ticker}@{mic}', finam_tf)).start()  # Создаем и запускаем поток подписки на новые бары
-        self.history_subscriptions[(symbol, time_frame)] = True  # Ставим отметку в справочнике подписок
+        self.history_subscriptions[(symbol, time_frame)] = True  # Ставим отметку в справочнике подписок до первого бара
+        if self.bars_streams is None:  # Если подписки в одном цикле недоступны
+            Thread(target=self.provider.subscribe_bars_thread, name=f'BarsThread {symbol.dataname} {time_frame}', args=(f'{ticker}@{mic}', finam_tf)).start()  # то создаем и запускаем поток подписки провайдера
+            return  # Выходим, дальше не продолжаем
+        request = SubscribeBarsRequest(symbol=f'{ticker}@{mic}', timeframe=finam_tf)  # Запрос подписки на новые бары
+        self.bars_streams.subscribe(
+            (symbol.dataname, time_frame),  # Ключ подписки
+            lambda channel: MarketDataServiceStub(channel).SubscribeBars(request, metadata=(self.provider.metadata,)),  # Поток новых бар. Авторизация берется при каждом подключении
+            lambda bars: self._on_bars(symbol, time_frame, bars))  # Тикер известен при подписке. Спецификацию по каждому ответу не ищем
 
     def unsubscribe_history(self, symbol, time_frame):
-        self.history_subscriptions[(symbol, time_frame)] = False  # Реальной отмены подписки на историю тикера нет. Снимаем отметку в справочнике подписок
+        if self.bars_streams is not None:  # Если подписки в одном цикле
+            self.bars_streams.unsubscribe((symbol.dataname, time_frame))  # то отменяем подписку на бары. Поток подписки провайдера отменить нельзя, его бары отбрасываются по справочнику подписок
+        self.history_subscriptions.pop((symbol, time_frame), None)  # Удаляем из справочника подписок
 
     def get_last_price(self, symbol):
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
         quote_response: QuoteResponse = self.provider.call_function(self.provider.marketdata_stub.LastQuote, QuoteRequest(symbol=f'{symbol.symbol}@{symbol.broker_info['mic']}'))  # Получение последней котировки по инструменту
         return None if quote_response is None else self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(quote_response.quote.last.value))  # Последняя цена сделки
 
     def get_value(self):
+        self._limit(RateLimiter.Portfolio)  # Ждем, если бюджет запросов к провайдеру исчерпан
         account: GetAccountResponse = self.provider.call_function(self.provider.accounts_stub.GetAccount, GetAccountRequest(account_id=self.account_id))  # Получаем счет
         return round(float(account.equity.value), 2)  # Стоимость портфеля
 
     def get_cash(self):
+        self._limit(RateLimiter.Portfolio)  # Ждем, если бюджет запросов к провайдеру исчерпан
         account: GetAccountResponse = self.provider.call_function(self.provider.accounts_stub.GetAccount, GetAccountRequest(account_id=self.account_id))  # Получаем счет
         return next((round(cash.units + cash.nanos * 10 ** -9, 2) for cash in account.cash if cash.currency_code == 'RUB'), 0)  # Свободные средства в рублях, если есть
 
     def get_positions(self):
         self.positions = []  # Сбрасываем текущие позиции
+        self._limit(RateLimiter.Portfolio)  # Ждем, если бюджет запросов к провайдеру исчерпан
         account: GetAccountResponse = self.provider.call_function(self.provider.accounts_stub.GetAccount, GetAccountRequest(account_id=self.account_id))  # Получаем счет
         for position in account.positions:  # Пробегаемся по всем позициям
             symbol = self._get_symbol_info(position.symbol)  # Тикер
@@ -114,6 +108,7 @@ class Finam(Broker):
 
     def get_orders(self):
         self.orders = []  # Сбрасываем активные заявки
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         orders: OrdersResponse = self.provider.call_function(self.provider.orders_stub.GetOrders, OrdersRequest(account_id=self.account_id))  # Получаем заявки
         for order in orders.orders:  # Пробегаемся по всем заявкам
             if order.status not in (OrderStatus.ORDER_STATUS_NEW, OrderStatus.ORDER_STATUS_WAIT, OrderStatus.ORDER_STATUS_PARTIALLY_FILLED):  # Если заявка еще не активная
@@ -164,6 +159,7 @@ class Finam(Broker):
                                      limit_price=limit_price)
         else:  # По рынку
             finam_order = FinamOrder(account_id=self.account_id, symbol=finam_symbol, quantity=quantity, side=side, type=OrderType.ORDER_TYPE_MARKET, client_order_id=client_order_id)
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         order_state: OrderState = self.provider.call_function(self.provider.orders_stub.PlaceOrder, finam_order)
         if order_state.status == OrderStatus.ORDER_STATUS_NEW:  # Должен вернуться статус "Новая заявка"
             order.id = order_state.order_id  # Уникальный код заявки
@@ -173,6 +169,7 @@ class Finam(Broker):
         return False  # Операция завершилась с ошибкой
 
     def cancel_order(self, order):
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         self.provider.call_function(self.provider.orders_stub.CancelOrder, CancelOrderRequest(account_id=self.account_id, order_id=order.id))  # Удаление заявки
 
     def subscribe_transactions(self):
@@ -187,18 +184,61 @@ class Finam(Broker):
 
     def close(self):
         self.provider.on_new_bar.unsubscribe(self._on_new_bar)  # Обработка нового бара
+        if self.bars_streams is not None:  # Если подписки в одном цикле
+            self.bars_streams.close()  # то отменяем все подписки на новые бары
 
 
         self.provider.close_channel()  # Закрываем канал перед выходом
 
     # Внутренние функции
 
+    def _fetch_history(self, symbol, time_frame, dt_from, dt_to):
+        seconds_from = self.provider.msk_datetime_to_timestamp(self.provider.min_history_date if dt_from is None else dt_from)  # Первый возможный бар
+        seconds_to = self.provider.msk_datetime_to_timestamp(datetime.now() if dt_to is None else dt_to)  # Последний возможный бар
+        finam_tf, tf_range, intraday = self.provider.timeframe_to_finam_timeframe(time_frame)  # Временной интервал Финама, максимальный размер запроса в днях, внутридневной бар
+
+        def fetch(window_from: int, window_to: int) -> list[tuple]:
+            """Строки бар за окно с ... по ..."""
+            self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
+            bars_response: BarsResponse = self.provider.call_function(  # Получаем историю тикера за период
+                self.provider.marketdata_stub.Bars,  # Получение исторических данных по инструменту (агрегированные свечи)
+                BarsRequest(symbol=f'{symbol.symbol}@{symbol.broker_info['mic']}',  # Тикер Финама
+                            timeframe=finam_tf,  # Временной интервал Финама
+                            interval=Interval(start_time=Timestamp(seconds=window_from),  # Дата и время начала запроса
+                                              end_time=Timestamp(seconds=window_to))))  # Дата и время окончания запроса
+            window_rows = []  # Строки бар окна
+            for bar in bars_response.bars:  # Пробегаемся по всем пришедшим барам
+                dt_msk = self.provider.timestamp_to_msk_datetime(bar.timestamp.seconds)  # Дата и время полученного бара
+                if not intraday:  # Для дневных временнЫх интервалов и выше
+                    dt_msk = dt_msk.replace(hour=0, minute=0)  # убираем время, оставляем только дату
+                open_ = self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(bar.open.value))  # Конвертируем цены
+                high = self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(bar.high.value))  # из цен Финама
+                low = self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(bar.low.value))  # в зависимости от
+                close = self.provider.finam_price_to_price(symbol.symbol, symbol.broker_info['mic'], float(bar.close.value))  # режима торгов
+                window_rows.append((dt_msk, open_, high, low, close, int(float(bar.volume.value))))  # Добавляем бар
+            return window_rows
+
+        if intraday and seconds_to - seconds_from > tf_range.total_seconds():  # Если внутридневную историю скачиваем несколькими окнами
+            dt_first_day = self._first_trade_day(symbol)  # Первый торговый день тикера
+            if dt_first_day is not None:  # Если он известен
+                seconds_from = max(seconds_from, self.provider.msk_datetime_to_timestamp(dt_first_day))  # то окна до первого торгового дня тикера не запрашиваем
+        windows = self._history_windows(symbol, time_frame, seconds_from, seconds_to, int(tf_range.total_seconds()))  # Окна запросов. Выходные и ночи пропускаем по расписанию торгов
+        return self._download_history(windows, fetch)  # Строки полученных бар. Окна запрашиваем одновременно
+
+    def _first_trade_day(self, symbol: Symbol) -> datetime | None:
+        """Дата первого торгового дня тикера у провайдера. Запрашивается один раз на тикер дневными барами напрямую у провайдера, без синхронизации дневной истории в хранилище"""
+        if symbol.dataname not in self.first_trade_days:  # Если тикер еще не запрашивали
+            rows = self._fetch_history(symbol, 'D1', self.provider.min_history_date, None)  # Дневные бары с начала истории. Дневных окон в разы меньше, чем внутридневных
+            self.first_trade_days[symbol.dataname] = rows[0][0] if len(rows) > 0 else None  # Запоминаем первый торговый день
+        return self.first_trade_days[symbol.dataname]
+
     def _get_symbol_info(self, finam_symbol: str) -> Symbol | None:
         """Спецификация тикера по тикеру Финама"""
         ticker, mic = finam_symbol.split('@')  # По разделителю разбиваем на тикер и биржу
-        symbol = next((symbol for symbol in self.storage.symbols.values() if symbol.symbol == ticker and symbol.broker_info['mic'] == mic), None)  # Проверяем, есть ли спецификация тикера в хранилище по тикеру и бирже
+        symbol = self.storage.get_symbol_by_index('ticker_mic', (ticker, mic))  # Проверяем, есть ли спецификация тикера в хранилище по тикеру и бирже
         if symbol is not None:  # Если есть тикер
             return symbol  # то возвращаем его, выходим, дальше не продолжаем
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
         si = self.provider.get_symbol_info(ticker, mic)  # Спецификация тикера
         if si is None:  # Если тикер не найден
             return None  # то выходим, дальше не продолжаем
@@ -210,11 +250,15 @@ class Finam(Broker):
         return symbol
 
     def _on_new_bar(self, bars: SubscribeBarsResponse, timeframe: TimeFrame.ValueType):
-        """Получение нового бара по подписке"""
+        """Получение нового бара по подписке провайдера"""
         symbol = self._get_symbol_info(bars.symbol)  # Спецификация тикера
         if symbol is None:  # Если тикер не найден
             return  # то выходим, дальше не продолжаем
         time_frame, _, _ = self.provider.finam_timeframe_to_timeframe(timeframe)  # Временной интервал
+        self._on_bars(symbol, time_frame, bars)
+
+    def _on_bars(self, symbol: Symbol, time_frame: str, bars: SubscribeBarsResponse):
+        """Обработка новых бар тикера и временнОго интервала"""
         if (symbol, time_frame) not in self.history_subscriptions:  # Если была отписка от тикера
             return  # Выходим, дальше не продолжаем
         last_bar = self.last_bars.get((symbol.dataname, time_frame))  # Последний бар. Он может быть не завершен
@@ -0,0 +1,114 @@
+import logging
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock, Event as ThreadingEvent
+from typing import Any, Callable, AsyncIterator
+
+import grpc
+
+
+class GrpcStreams:
+    """Потоковые подписки gRPC в одном цикле asyncio. Сотни подписок работают в одном потоке и одном канале. Ответы обрабатываются по порядку в отдельном потоке, чтобы обработчики не блокировали цикл"""
+    logger = logging.getLogger('GrpcStreams')  # Будем вести лог
+    reconnect_seconds = 5  # Пауза перед переподключением оборванной подписки
+
+    def __init__(self, channel_factory: Callable[[], grpc.aio.Channel], name: str = 'GrpcStreams'):
+        """
+        :param channel_factory: Создание канала gRPC asyncio. Вызывается в потоке цикла
+        :param name: Название потока цикла
+        """
+        self.channel_factory = channel_factory  # Создание канала
+        self.name = name  # Название потока цикла
+        self.loop: asyncio.AbstractEventLoop | None = None  # Цикл asyncio. Запускается при первой подписке
+        self.thread: Thread | None = None  # Поток цикла
+        self.executor: ThreadPoolExecutor | None = None  # Поток обработки ответов. Один, чтобы ответы обрабатывались по порядку
+        self.lock = Lock()  # Запуск и остановка цикла из разных потоков
+        self.channel: grpc.aio.Channel | None = None  # Канал, общий для всех подписок
+        self.tasks: dict[Any, asyncio.Task] = {}  # Задачи подписок. Меняются только в потоке цикла
+
+    def subscribe(self, key, open_stream: Callable[[grpc.aio.Channel], AsyncIterator], on_message: Callable[[Any], None]) -> None:
+        """Подписка. Если подписка с таким ключом уже есть, то она заменяется
+
+        :param key: Ключ подписки для отмены
+        :param open_stream: Открытие потока ответов сервера по каналу
+        :param on_message: Обработка ответа. Вызывается в потоке обработки ответов, может обращаться к хранилищу и провайдеру
+        """
+        with self.lock:  # Цикл запускается один раз, даже если подписываются из нескольких потоков одновременно
+            if self.thread is None:  # Если цикл еще не запущен
+                self.executor = ThreadPoolExecutor(1, f'{self.name}Handler')  # Поток обработки ответов
+                started = ThreadingEvent()  # Событие запуска цикла
+                self.thread = Thread(target=self._loop_thread, args=(started,), name=self.name, daemon=True)  # Поток цикла
+                self.thread.start()
+                started.wait()  # Ждем, пока цикл запустится
+            self.loop.call_soon_threadsafe(self._start_task, key, open_stream, on_message)  # Задачи меняем только в потоке цикла
+
+    def unsubscribe(self, key) -> None:
+        """Отмена подписки по ключу"""
+        with self.lock:
+            if self.loop is not None:  # Если цикл запущен
+                self.loop.call_soon_threadsafe(self._cancel_task, key)
+
+    def close(self) -> None:
+        """Отмена всех подписок, закрытие канала и остановка цикла"""
+        with self.lock:
+            if self.thread is None:  # Если цикл не запускался
+                return  # то выходим, дальше не продолжаем
+            asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()  # Отменяем подписки и закрываем канал в потоке цикла
+            self.loop.call_soon_threadsafe(self.loop.stop)  # Останавливаем цикл
+            self.thread.join()
+            self.executor.shutdown(cancel_futures=True)  # Необработанные ответы отменяем
+            self.thread = self.loop = self.executor = None
+
+    # Внутренние функции
+
+    def _loop_thread(self, started: ThreadingEvent) -> None:
+        """Поток цикла asyncio"""
+        self.loop = asyncio.new_event_loop()  # Цикл потока
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(started.set)  # Сообщаем о запуске из работающего цикла
+        self.loop.run_forever()
+        self.loop.close()
+
+    def _start_task(self, key, open_stream, on_message) -> None:
+        """Запуск задачи подписки в потоке цикла"""
+        self._cancel_task(key)  # Старую подписку с тем же ключом отменяем
+        if self.channel is None:  # Если канала еще нет
+            self.channel = self.channel_factory()  # то создаем его в потоке цикла
+        self.tasks[key] = self.loop.create_task(self._run(key, open_stream, on_message))
+
+    def _cancel_task(self, key) -> None:
+        """Отмена задачи подписки в потоке цикла"""
+        task = self.tasks.pop(key, None)  # Задача подписки
+        if task is not None:  # Если подписка есть
+            task.cancel()  # то отменяем ее. Вызов gRPC отменяется вместе с задачей
+
+    async def _run(self, key, open_stream, on_message) -> None:
+        """Получение ответов по подписке. Оборванная подписка переподключается"""
+        while True:
+            try:
+                async for message in open_stream(self.channel):  # Пробегаемся по всем ответам сервера
+                    self.executor.submit(self._handle, key, on_message, message)  # Обрабатываем ответ вне цикла
+                self.logger.debug(f'Сервер завершил подписку {key}')
+            except grpc.aio.AioRpcError as ex:  # Если подписка оборвалась
+                self.logger.warning(f'Подписка {key} оборвалась: {ex.code()} {ex.details()}')
+            except Exception as ex:  # Любая другая ошибка (открытие потока, разбор ответа) тоже не должна завершать подписку навсегда
+                self.logger.exception(f'Ошибка подписки {key}: {ex}')
+            await asyncio.sleep(self.reconnect_seconds)  # Ждем перед переподключением
+
+    def _handle(self, key, on_message, message) -> None:
+        """Обработка ответа в потоке обработки ответов"""
+        try:
+            on_message(message)
+        except Exception as ex:  # Ошибка обработчика не должна обрывать подписку
+            self.logger.error(f'Ошибка обработки ответа по подписке {key}: {ex}')
+
+    async def _close(self) -> None:
+        """Отмена всех подписок и закрытие канала в потоке цикла"""
+        tasks = list(self.tasks.values())
+        self.tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)  # Ждем окончания отмененных задач
+        if self.channel is not None:  # Если канал был создан
+            await self.channel.close()
+            self.channel = None
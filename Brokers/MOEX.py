@@ -1,12 +1,13 @@
 import logging
 from datetime import datetime
 
-from FinLabPy.Core import Broker, Bar, Symbol  # Брокер, бар, тикер
+from FinLabPy.Core import Broker, RateLimiter, Bar, Symbol  # Брокер, бар, тикер
 from MOEXPy import MOEXPy  # Работа с Algopack API Московской Биржи из Python через REST/WebSockets
 
 
 class MOEX(Broker):
     """Московская Биржа"""
+    rate_limits = {RateLimiter.MarketData: (5, 5)}  # Бюджет запросов ISS Московской Биржи. 5 запросов в секунду
 
     def __init__(self, code='МБ', name='МосБиржа', provider=MOEXPy(), storage='file'):
         super().__init__(code, name, provider, 0, storage)
@@ -21,6 +22,7 @@ class MOEX(Broker):
         if symbol is not None:  # Если есть тикер
             return symbol  # то возвращаем его, дальше не продолжаем
         board, symbol = self.provider.dataname_to_board_symbol(dataname)  # Код режима торгов и тикер из названия тикера
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
         si = self.provider.get_ticker(board, symbol)  # Получаем информацию о тикере (спецификация и рыночные данные)
         if si is None:  # Если информация о тикере не найдена
             return None  # то выходим, дальше не продолжаем
@@ -37,33 +39,7 @@ class MOEX(Broker):
         return symbol
 
     def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
-        if dt_from is None:  # Если не указана дата начала
-            dt_from = datetime(1990, 1, 1)  # то пытаемся получить с начала истории
-        if dt_to is None:  # Если не указана дата окончания
-            dt_to = datetime.now(self.provider.tz_msk).replace(tzinfo=None)  # то пытаемся получить до настоящего момента
-        bars = super().get_history(symbol, time_frame, dt_from, dt_to)  # Получаем бары из хранилища
-        if bars is None:  # Если бары из хранилища не получены
-            bars = []  # Пока список полученных бар пустой
-        else:  # Если бары из хранилища получены
-            dt_from = bars[-1].datetime  # Дата и время открытия последнего бара
-            del bars[-1]  # Удаляем последний бар. Он перепишется первым полученным баром за период
-        moex_tf = self.provider.timeframe_to_moex_timeframe(time_frame)  # Временной интервал Московской Биржи (REST)
-        history = self.provider.get_candles(symbol.board, symbol.symbol, dt_from, dt_to, moex_tf)  # Получаем всю историю тикера
-        col_bars = {col: idx for idx, col in enumerate(history['candles']['columns'])}  # Колонки истории тикера с их порядковыми номерами
-        data_bars = history['candles']['data']  # Данные истории тикера
-        if len(data_bars) == 0:  # Если бары не получены
-            return None  # то выходим, дальше не продолжаем
-        for bar in data_bars:  # Пробегаемся по всем барам
-            bars.append(Bar(
-                symbol.board, symbol.symbol, symbol.dataname, time_frame,
-                datetime.fromisoformat(bar[col_bars['begin']]),
-                bar[col_bars['open']],
-                bar[col_bars['high']],
-                bar[col_bars['low']],
-                bar[col_bars['close']],
-                int(bar[col_bars['volume']])))  # Добавляем бар
-        self.storage.set_bars(bars)  # Сохраняем бары в хранилище
-        return bars
+        return self.sync_history(symbol, time_frame, dt_from, dt_to)  # Бары из хранилища, дополненные недостающими интервалами от провайдера
 
     def subscribe_history(self, symbol, time_frame):
         moex_ws_tf = self.provider.timeframe_to_moex_ws_timeframe(time_frame)  # Временной интервал Московской Биржи (WebSockets)
@@ -92,6 +68,7 @@ class MOEX(Broker):
             })
 
     def get_last_price(self, symbol):
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
         si = self.provider.get_ticker(symbol.board, symbol.symbol)  # Получаем информацию о тикере (спецификация и рыночные данные)
         col_marketdata = {col: idx for idx, col in enumerate(si['marketdata']['columns'])}  # Колонки рыночных данных тикера с их порядковыми номерами
         data_marketdata = si['marketdata']['data'][0]  # Рыночные данные тикера
@@ -102,6 +79,29 @@ class MOEX(Broker):
 
     # Внутренние функции
 
+    def _fetch_history(self, symbol, time_frame, dt_from, dt_to):
+        if dt_from is None:  # Если не указана дата начала
+            dt_from = datetime(1990, 1, 1)  # то пытаемся получить с начала истории
+        if dt_to is None:  # Если не указана дата окончания
+            dt_to = datetime.now(self.provider.tz_msk).replace(tzinfo=None)  # то пытаемся получить до настоящего момента
+        moex_tf = self.provider.timeframe_to_moex_timeframe(time_frame)  # Временной интервал Московской Биржи (REST)
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
+        history = self.provider.get_candles(symbol.board, symbol.symbol, dt_from, dt_to, moex_tf)  # Получаем всю историю тикера
+        col_bars = {col: idx for idx, col in enumerate(history['candles']['columns'])}  # Колонки истории тикера с их порядковыми номерами
+        data_bars = history['candles']['data']  # Данные истории тикера
+        if len(data_bars) == 0:  # Если бары не получены
+            return []  # то выходим, дальше не продолжаем
+        rows = []  # Строки полученных бар
+        for bar in data_bars:  # Пробегаемся по всем барам
+            rows.append((
+                datetime.fromisoformat(bar[col_bars['begin']]),
+                bar[col_bars['open']],
+                bar[col_bars['high']],
+                bar[col_bars['low']],
+                bar[col_bars['close']],
+                int(bar[col_bars['volume']])))  # Добавляем бар
+        return rows
+
     def _on_new_bar(self, headers, body):  # Обработчик события прихода нового бара
         if '.candles' not in headers['destination']:  # Если пришла подписка не на новый бар
             return  # то выходим, дальше не продолжаем
@@ -1,12 +1,13 @@
 from datetime import datetime
 import itertools  # Итератор для уникальных номеров транзакций
 
-from FinLabPy.Core import Broker, Bar, Position, Trade, Order, Symbol  # Брокер, бар, позиция, сделка, заявка, тикер
+from FinLabPy.Core import Broker, Bar, BarSeries, Position, PortfolioSnapshot, Trade, Order, OrderRegistry, Symbol, bar_cache  # Брокер, бар, бары в колонках, позиция, снимок портфеля, сделка, заявка, справочник заявок, тикер, кэш бар
 from QuikPy import QuikPy  # Работа с QUIK из Python через LUA скрипты QuikSharp
 
 
 class Quik(Broker):
     """Брокер QUIK"""
+    last_prices_workers = 1  # Запросы к QUIK идут по одному соединению. Последние цены запрашиваем по очереди
     def __init__(self, code, name, provider: QuikPy, account_id=0, limit_kind=1, lots=True, storage='file'):
         super().__init__(code, name, provider, account_id, storage)
         self.provider = provider  # Уже инициирован в базовом классе. Выполням для того, чтобы работать с типом провайдера
@@ -15,7 +16,11 @@ class Quik(Broker):
         self.lots = lots  # Входящий остаток в лотах (задается брокером)
         self.class_codes = self.provider.get_classes_list()['data']  # Режимы торгов через запятую
         self.trans_id = itertools.count(1)  # Номер транзакции задается пользователем. Он будет начинаться с 1 и каждый раз увеличиваться на 1
+        self.order_registry = OrderRegistry()  # Заявки автоторговли по номеру транзакции и номеру заявки на бирже
+        self.order_lots: dict[str, list] = {}  # Лоты заявок в финальном статусе. Ключ - ключ заявки, значение - [кол-во лотов в пришедших сделках, кол-во исполненных лотов или None, пока статус не финальный]
         self.trade_nums = {}  # Список номеров сделок по тикеру для фильтрации дублей сделок
+        self.security_classes: dict[str, str] = {}  # Коды режимов торгов счета по коду тикера. Режим торгов тикера не меняется
+        self.storage.add_symbol_index('class_sec', lambda symbol: (symbol.board, symbol.symbol))  # Индекс тикеров по режиму торгов и коду тикера QUIK
 
         self.provider.on_new_candle.subscribe(self._on_new_bar)  # Обработка нового бара
         self.provider.on_trans_reply.subscribe(self._on_trans_reply)  # Обработка транзакций
@@ -39,15 +44,16 @@ class Quik(Broker):
             return None  # то выходим, дальше не продолжаем
         if 'data' not in history:  # Если бар нет в словаре
             return None  # то выходим, дальше не продолжаем
-        bars = []  # Список полученных бар
+        rows = []  # Строки полученных бар
         for bar in history['data']:  # Пробегаемся по всем полученным барам
             dt = datetime(bar['datetime']['year'], bar['datetime']['month'], bar['datetime']['day'], bar['datetime']['hour'], bar['datetime']['min'])  # Собираем дату и время бара до минут
             if dt_from and dt_from > dt:  # Если задана дата начала, и она позже даты и времени бара
                 continue  # то пропускаем этот бар
             if dt_to and dt_to < dt:  # Если задана дата окончания, и она раньше даты и времени бара
                 continue  # то пропускаем этот бар
-            bars.append(Bar(symbol.board, symbol.symbol, symbol.dataname, time_frame, dt, bar['open'], bar['high'], bar['low'], bar['close'], int(bar['volume'])))  # Добавляем бар
-        self.storage.set_bars(bars)  # Сохраняем бары в хранилище
+            rows.append((dt, bar['open'], bar['high'], bar['low'], bar['close'], int(bar['volume'])))  # Добавляем бар
+        bars = BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, time_frame, rows)  # Переводим бары в колонки
+        bar_cache.set_bars(self.storage, bars)  # Сохраняем бары в хранилище и кэш
         return bars
 
     def subscribe_history(self, symbol, time_frame):
@@ -67,91 +73,13 @@ class Quik(Broker):
         return self.provider.quik_price_to_price(symbol.board, symbol.symbol, last_price)  # Цена в рублях за штуку
 
     def get_value(self):
-        if self.account['futures']:  # Для срочного рынка
-            # noinspection PyBroadException
-            try:  # Пытаемся получить стоимость позиций
-                cbpl_used = float(self.provider.get_futures_limit(self.account['firm_id'], self.account['trade_account_id'], 0, self.provider.currency)['data']['cbplused'])  # Тек.чист.поз. (Заблокированное ГО под открытые позиции)
-                return cbpl_used + self.get_cash()  # Стоимость портфеля срочного рынка
-            except Exception:  # При ошибке Futures limit returns nil
-                return 0  # Выдаем пустое значение. Получим стоимость позиций когда сервер будет работать
-        # Для остальных рынков
-        self.get_positions()  # Получаем текущие позиции
-        pos_price = round(sum([position.current_price * position.quantity for position in self.positions]), 2)  # Суммируем текущую ст-сть всех позиций
-        return pos_price + self.get_cash()  # Стоимость портфеля
+        return self.get_snapshot().value  # Стоимость портфеля из снимка
 
     def get_cash(self):
-        if self.account['futures']:  # Для срочного рынка
-            # Видео: https://www.youtube.com/watch?v=u2C7ElpXZ4k
-            # Баланс = Лимит откр.поз. + Вариац.маржа + Накоплен.доход
-            # Лимит откр.поз. = Сумма, которая была на счету вчера в 19:00 МСК (после вечернего клиринга)
-            # Вариац.маржа = Рассчитывается с 19:00 предыдущего дня без учета комисии. Перейдет в Накоплен.доход и обнулится в 14:00 (на дневном клиринге)
-            # Накоплен.доход включает Биржевые сборы
-            # Тек.чист.поз. = Заблокированное ГО под открытые позиции
-            # План.чист.поз. = На какую сумму можете открыть еще позиции
-            # noinspection PyBroadException
-            try:
-                futures_limit = self.provider.get_futures_limit(self.account['firm_id'], self.account['trade_account_id'], 0, self.provider.currency)['data']  # Фьючерсные лимиты
-                return float(futures_limit['cbplimit']) + float(futures_limit['varmargin']) + float(futures_limit['accruedint'])  # Лимит откр.поз. + Вариац.маржа + Накоплен.доход
-            except Exception:  # При ошибке Futures limit returns nil
-                return 0  # Выдаем пустое значение. Получим стоимость позиций когда сервер будет работать
-        # Для остальных рынков
-        money_limits = self.provider.get_money_limits()['data']  # Все денежные лимиты (остатки на счетах)
-        if len(money_limits) == 0:  # Если денежных лимитов нет
-            return 0
-        cash = [money_limit for money_limit in money_limits  # Из всех денежных лимитов
-                if money_limit['client_code'] == self.account['client_code'] and  # выбираем по коду клиента
-                money_limit['firmid'] == self.account['firm_id'] and  # фирме
-                money_limit['limit_kind'] == self.limit_kind and  # дню лимита
-                money_limit["currcode"] == self.provider.currency]  # и валюте
-        if len(cash) != 1:  # Если ни один денежный лимит не подходит
-            return 0
-        return float(cash[0]['currentbal'])  # Денежный лимит (остаток) по счету
+        return self.get_snapshot().cash  # Свободные средства из снимка
 
     def get_positions(self):
-        self.positions = []  # Текущие позиции
-        if self.account['futures']:  # Для срочного рынка
-            active_futures_holdings = [futures_holding for futures_holding in self.provider.get_futures_holdings()['data'] if futures_holding['totalnet'] != 0]  # Активные фьючерсные позиции
-            for active_futures_holding in active_futures_holdings:  # Пробегаемся по всем активным фьючерсным позициям
-                class_code = 'SPBFUT'  # Код режима торгов
-                sec_code = active_futures_holding['sec_code']  # Код тикера
-                symbol = self._get_symbol_info(class_code, sec_code)  # Спецификация тикера
-                size = active_futures_holding['totalnet']  # Кол-во
-                if self.lots:  # Если входящий остаток в лотах
-                    size *= symbol.lot_size  # то переводим кол-во из лотов в штуки
-                entry_price = self.provider.quik_price_to_price(class_code, sec_code, float(active_futures_holding['avrposnprice']))  # Цена входа в рублях за штуку
-                last_price = self.provider.quik_price_to_price(class_code, sec_code, float(self.provider.get_param_ex(class_code, sec_code, 'LAST')['data']['param_value']))  # Последняя цена сделки в рублях за штуку
-                self.positions.append(Position(  # Добавляем текущую позицию в список
-                    self,  # Брокер
-                    symbol.dataname,  # Название тикера
-                    symbol.description,  # Описание тикера
-                    symbol.decimals,  # Кол-во десятичных знаков в цене
-                    size,  # Кол-во в штуках
-                    entry_price,  # Средняя цена входа в рублях
-                    last_price))  # Последняя цена в рублях
-        else:  # Для остальных рынков
-            depo_limits = self.provider.get_all_depo_limits()['data']  # Все лимиты по бумагам (позиции по инструментам)
-            firm_kind_depo_limits = [depo_limit for depo_limit in depo_limits if  # Бумажный лимит
-                                     depo_limit['client_code'] == self.account['client_code'] and  # выбираем по коду клиента
-                                     depo_limit['firmid'] == self.account['firm_id'] and  # фирме
-                                     depo_limit['limit_kind'] == self.limit_kind and  # и дню лимита
-                                     depo_limit['currentbal'] != 0]  # только открытые позиции
-            for firm_kind_depo_limit in firm_kind_depo_limits:  # Пробегаемся по всем позициям
-                sec_code = firm_kind_depo_limit['sec_code']  # Код тикера
-                class_code = self.provider.get_security_class(self.class_codes, sec_code)['data']  # Код режима торгов из режимов торгов счета
-                symbol = self._get_symbol_info(class_code, sec_code)  # Спецификация тикера
-                size = int(firm_kind_depo_limit['currentbal'])  # Кол-во
-                if self.lots:  # Если входящий остаток в лотах
-                    size *= symbol.lot_size  # то переводим кол-во из лотов в штуки
-                entry_price = self.provider.quik_price_to_price(class_code, sec_code, float(firm_kind_depo_limit["wa_position_price"]))  # Цена входа в рублях за штуку
-                last_price = self.provider.quik_price_to_price(class_code, sec_code, float(self.provider.get_param_ex(class_code, sec_code, 'LAST')['data']['param_value']))  # Последняя цена сделки в рублях за штуку
-                self.positions.append(Position(  # Добавляем текущую позицию в список
-                    self,  # Брокер
-                    symbol.dataname,  # Название тикера
-                    symbol.description,  # Описание тикера
-                    symbol.decimals,  # Кол-во десятичных знаков в цен
-                    size,  # Кол-во в штуках
-                    entry_price,  # Средняя цена входа в рублях
-                    last_price))  # Последняя цена в рублях
+        self.positions = list(self.get_snapshot().positions)  # Текущие позиции из снимка
         return self.positions
 
     def get_orders(self) -> list[Order]:
@@ -222,14 +150,19 @@ class Quik(Broker):
         order.id = trans_id  # Пока у заявки нет номера, ставим номер транзакции. Номер заявки придет в _on_trans_reply
         order.status = Order.Submitted  # Заявка отправлена брокеру
         self.orders.append(order)  # Добавляем новую заявку в список заявок
+        self.order_registry.add(trans_id, order, trans_id=trans_id)  # Ответ на транзакцию найдет заявку по номеру транзакции
         return True  # Операция завершилась успешно
 
     def cancel_order(self, order):
         class_code, sec_code = self.provider.dataname_to_class_sec_codes(order.dataname)  # Код режима торгов и тикер из названия тикера
         action = 'KILL_STOP_ORDER' if order.exec_type in (Order.Stop, Order.StopLimit) else 'KILL_ORDER'  # Действие над заявкой
         order_key = 'STOP_ORDER_KEY' if order.exec_type in (Order.Stop, Order.StopLimit) else 'ORDER_KEY'  # Номер заявки
+        trans_id = str(next(self.trans_id))  # Следующий номер транзакции
+        key = self.order_registry.get_key(order.id)  # Ключ заявки в справочнике по номеру транзакции или номеру заявки на бирже
+        if key is not None:  # Если заявка выставлена из автоторговли
+            self.order_registry.set_trans_id(key, trans_id)  # то ответ на транзакцию снятия найдет ее по номеру транзакции снятия. Номер удалится вместе с заявкой
         transaction = {  # Все значения должны передаваться в виде строк
-            'TRANS_ID': str(next(self.trans_id)),  # Следующий номер транзакции
+            'TRANS_ID': trans_id,  # Номер транзакции
             'ACTION': action,  # Тип заявки: Удаление существующей заявки
             'CLASSCODE': class_code,  # Код режима торгов
             'SECCODE': sec_code,  # Код тикера
@@ -253,8 +186,94 @@ class Quik(Broker):
 
     # Внутренние функции
 
+    def _fetch_snapshot(self):
+        """Снимок портфеля. Позиции оцениваются за один проход, стоимость портфеля считается по ним без повторного запроса позиций"""
+        positions = self._fetch_positions()  # Текущие позиции
+        if self.account['futures']:  # Для срочного рынка
+            # Видео: https://www.youtube.com/watch?v=u2C7ElpXZ4k
+            # Баланс = Лимит откр.поз. + Вариац.маржа + Накоплен.доход
+            # Лимит откр.поз. = Сумма, которая была на счету вчера в 19:00 МСК (после вечернего клиринга)
+            # Вариац.маржа = Рассчитывается с 19:00 предыдущего дня без учета комисии. Перейдет в Накоплен.доход и обнулится в 14:00 (на дневном клиринге)
+            # Накоплен.доход включает Биржевые сборы
+            # Тек.чист.поз. = Заблокированное ГО под открытые позиции
+            # План.чист.поз. = На какую сумму можете открыть еще позиции
+            # noinspection PyBroadException
+            try:
+                futures_limit = self.provider.get_futures_limit(self.account['firm_id'], self.account['trade_account_id'], 0, self.provider.currency)['data']  # Фьючерсные лимиты. Одним запросом для свободных средств и стоимости портфеля
+                cash = float(futures_limit['cbplimit']) + float(futures_limit['varmargin']) + float(futures_limit['accruedint'])  # Лимит откр.поз. + Вариац.маржа + Накоплен.доход
+                value = float(futures_limit['cbplused']) + cash  # Тек.чист.поз. (Заблокированное ГО под открытые позиции) + свободные средства
+            except Exception:  # При ошибке Futures limit returns nil
+                cash = value = 0  # Выдаем пустые значения. Получим их когда сервер будет работать
+        else:  # Для остальных рынков
+            cash = self._fetch_cash()  # Свободные средства
+            value = round(sum([position.current_price * position.quantity for position in positions]), 2) + cash  # Текущая стоимость всех позиций и свободные средства
+        return PortfolioSnapshot(value, cash, positions)
+
+    def _fetch_cash(self) -> float:
+        """Денежный лимит (остаток) по счету для всех рынков, кроме срочного"""
+        money_limits = self.provider.get_money_limits()['data']  # Все денежные лимиты (остатки на счетах)
+        if len(money_limits) == 0:  # Если денежных лимитов нет
+            return 0
+        cash = [money_limit for money_limit in money_limits  # Из всех денежных лимитов
+                if money_limit['client_code'] == self.account['client_code'] and  # выбираем по коду клиента
+                money_limit['firmid'] == self.account['firm_id'] and  # фирме
+                money_limit['limit_kind'] == self.limit_kind and  # дню лимита
+                money_limit["currcode"] == self.provider.currency]  # и валюте
+        if len(cash) != 1:  # Если ни один денежный лимит не подходит
+            return 0
+        return float(cash[0]['currentbal'])  # Денежный лимит (остаток) по счету
+
+    def _fetch_positions(self) -> list[Position]:
+        """Текущие позиции. Режимы торгов и спецификации тикеров берутся из кэша, последние цены всех позиций запрашиваются вместе"""
+        holdings = []  # Позиции (тикер, кол-во в штуках, цена входа в рублях за штуку)
+        if self.account['futures']:  # Для срочного рынка
+            active_futures_holdings = [futures_holding for futures_holding in self.provider.get_futures_holdings()['data'] if futures_holding['totalnet'] != 0]  # Активные фьючерсные позиции
+            for active_futures_holding in active_futures_holdings:  # Пробегаемся по всем активным фьючерсным позициям
+                class_code = 'SPBFUT'  # Код режима торгов
+                sec_code = active_futures_holding['sec_code']  # Код тикера
+                symbol = self._get_symbol_info(class_code, sec_code)  # Спецификация тикера
+                size = active_futures_holding['totalnet']  # Кол-во
+                if self.lots:  # Если входящий остаток в лотах
+                    size *= symbol.lot_size  # то переводим кол-во из лотов в штуки
+                holdings.append((symbol, size, self.provider.quik_price_to_price(class_code, sec_code, float(active_futures_holding['avrposnprice']))))  # Цена входа в рублях за штуку
+        else:  # Для остальных рынков
+            depo_limits = self.provider.get_all_depo_limits()['data']  # Все лимиты по бумагам (позиции по инструментам)
+            firm_kind_depo_limits = [depo_limit for depo_limit in depo_limits if  # Бумажный лимит
+                                     depo_limit['client_code'] == self.account['client_code'] and  # выбираем по коду клиента
+                                     depo_limit['firmid'] == self.account['firm_id'] and  # фирме
+                                     depo_limit['limit_kind'] == self.limit_kind and  # и дню лимита
+                                     depo_limit['currentbal'] != 0]  # только открытые позиции
+            for firm_kind_depo_limit in firm_kind_depo_limits:  # Пробегаемся по всем позициям
+                sec_code = firm_kind_depo_limit['sec_code']  # Код тикера
+                class_code = self._get_security_class(sec_code)  # Код режима торгов из режимов торгов счета
+                symbol = self._get_symbol_info(class_code, sec_code)  # Спецификация тикера
+                size = int(firm_kind_depo_limit['currentbal'])  # Кол-во
+                if self.lots:  # Если входящий остаток в лотах
+                    size *= symbol.lot_size  # то переводим кол-во из лотов в штуки
+                holdings.append((symbol, size, self.provider.quik_price_to_price(class_code, sec_code, float(firm_kind_depo_limit["wa_position_price"]))))  # Цена входа в рублях за штуку
+        last_prices = self.get_last_prices([symbol for symbol, _, _ in holdings])  # Последние цены всех позиций. Свежие цены берутся из кэша и подписок на бары
+        return [Position(
+            self,  # Брокер
+            symbol.dataname,  # Название тикера
+            symbol.description,  # Описание тикера
+            symbol.decimals,  # Кол-во десятичных знаков в цене
+            size,  # Кол-во в штуках
+            entry_price,  # Средняя цена входа в рублях
+            last_prices[symbol.dataname] or 0)  # Последняя цена в рублях или 0, если не найдена
+            for symbol, size, entry_price in holdings]
+
+    def _get_security_class(self, sec_code: str) -> str:
+        """Код режима торгов тикера из режимов торгов счета. Запрашивается у QUIK один раз на тикер"""
+        class_code = self.security_classes.get(sec_code)  # Режим торгов из кэша
+        if class_code is None:  # Если режима торгов в кэше нет
+            class_code = self.security_classes[sec_code] = self.provider.get_security_class(self.class_codes, sec_code)['data']  # то запрашиваем его у QUIK
+        return class_code
+
     def _get_symbol_info(self, class_code: str, sec_code: str) -> Symbol | None:
         """Спецификация тикера по режиму торгов и коду"""
+        symbol = self.storage.get_symbol_by_index('class_sec', (class_code, sec_code))  # Проверяем, есть ли спецификация тикера в хранилище по режиму торгов и коду
+        if symbol is not None:  # Если есть тикер
+            return symbol  # то возвращаем его, выходим, дальше не продолжаем
         si = self.provider.get_symbol_info(class_code, sec_code)  # Спецификация тикера
         if si is None:  # Если тикер не найден
             return None  # то выходим, дальше не продолжаем
@@ -276,15 +295,18 @@ class Quik(Broker):
 
     def _on_trans_reply(self, data):
         """Получение ответа на транзакцию пользователя"""
+        self.invalidate_snapshot()  # Событие по счету меняет портфель
         trans_reply = data['data']  # Ответ на транзакцию
         trans_id = int(trans_reply['trans_id'])  # Номер транзакции заявки
         if trans_id == 0:  # Заявки, выставленные не из автоторговли / только что (с нулевыми номерами транзакции)
             return  # не обрабатываем, пропускаем
         order_num = int(trans_reply['order_num'])  # Номер заявки на бирже
-        order = next((order for order in self.orders if order.id == trans_id), None)  # Ищем заявку по номеру транзакции
-        if order is None:  # Если заявка не найдена
+        key = self.order_registry.get_key(trans_id)  # Ищем заявку по номеру транзакции. Номер транзакции в заявке - строка, в ответе - число. Справочник сравнивает их как строки
+        if key is None:  # Если заявка не найдена
             return  # то выходим, дальше не продолжаем
+        order = self.order_registry[key]  # Заявка
         order.id = order_num  # Ставим номер заявки
+        self.order_registry.set_order_id(key, order_num)  # Сделки найдут заявку по номеру заявки на бирже
         # TODO Есть поле flags, но оно не документировано. Лучше вместо текстового результата транзакции разбирать по нему
         result_msg = str(trans_reply['result_msg']).lower()  # По результату исполнения транзакции (очень плохое решение)
         status = int(trans_reply['status'])  # Статус транзакции
@@ -302,10 +324,13 @@ class Quik(Broker):
             order.status = Order.Rejected  # Заявка отклонена брокером
         elif status == 6:  # Транзакция не прошла проверку лимитов сервера QUIK
             order.status = Order.Margin  # Недостаточно средств
+        if order.status in (Order.Rejected, Order.Margin) and key == str(trans_id):  # Если заявка не выставлена (ответ на транзакцию выставления, а не снятия)
+            self._release_order(key, executed=0)  # то сделок по ней не будет. Удаляем ее из справочника
         self.on_order.trigger(order)
 
     def _on_order(self, data):
         """Получение заявки по подписке"""
+        self.invalidate_snapshot()  # Событие по счету меняет портфель
         order = data['data']  # Заявка
         buy = order['flags'] & 0b100 != 0b100  # Заявка на покупку
         class_code = order['class_code']  # Код режима торгов
@@ -314,6 +339,9 @@ class Quik(Broker):
         quantity = self.provider.lots_to_size(class_code, sec_code, order['qty'])  # Кол-во в штуках
         order_price = self.provider.quik_price_to_price(class_code, sec_code, order['price'])  # Цена заявки в рублях за штуку
         status = self._ext_order_status_to_status(int(order['ext_order_status']))  # Статус заявки по расширенному статусу заявки
+        key = self.order_registry.get_key(order['order_num'])  # Ключ заявки автоторговли в справочнике
+        if key is not None and status in (Order.Completed, Order.Canceled, Order.Rejected):  # Если заявка автоторговли в финальном статусе
+            self._release_order(key, executed=int(order['qty']) - int(order['balance']))  # то удаляем ее из справочника после прихода всех сделок по ней
         self.on_order.trigger(Order(
             self,  # Брокер
             order['order_num'],  # Уникальный код заявки
@@ -327,6 +355,7 @@ class Quik(Broker):
 
     def _on_stop_order(self, data):
         """Получение стоп заявки по подписке"""
+        self.invalidate_snapshot()  # Событие по счету меняет портфель
         stop_order = data['data']  # Стоп заявка
         buy = stop_order['flags'] & 0b100 != 0b100  # Заявка на покупку
         class_code = stop_order['class_code']  # Код режима торгов
@@ -336,6 +365,9 @@ class Quik(Broker):
         condition_price = self.provider.quik_price_to_price(class_code, sec_code, stop_order['condition_price'])  # Цена срабатывания стоп заявки в рублях за штуку
         order_price = self.provider.quik_price_to_price(class_code, sec_code, stop_order['price'])  # Цена заявки в рублях за штуку
         status = Order.Accepted if int(stop_order['filled_qty']) == 0 else Order.Completed  # Статус
+        key = self.order_registry.get_key(stop_order['order_num'])  # Ключ стоп заявки автоторговли в справочнике
+        if key is not None and stop_order['flags'] & 0b1 != 0b1:  # Если стоп заявка автоторговли больше не активна (сработала или снята)
+            self._release_order(key, executed=0)  # то удаляем ее из справочника. Сделки придут по выставленной ей заявке с другим номером
         self.on_order.trigger(Order(
             self,  # Брокер
             stop_order['order_num'],  # Уникальный код заявки
@@ -363,10 +395,12 @@ class Quik(Broker):
         elif trade_num in self.trade_nums[symbol.dataname]:  # Если номер сделки есть в списке (фильтр для дублей)
             return  # то выходим, дальше не продолжаем
         self.trade_nums[symbol.dataname].append(trade_num)  # Запоминаем номер сделки по тикеру, чтобы в будущем ее не обрабатывать (фильтр для дублей)
+        self.invalidate_snapshot()  # Сделка меняет портфель. Текущую позицию получим новым снимком
         order_num = trade['order_num']  # Номер заявки на бирже
-        order = next((order for order in self.orders if order.id == order_num), None)  # Ищем заявку по номеру
-        if order is None:  # Если заявка не найдена
+        key = self.order_registry.get_key(order_num)  # Ищем заявку по номеру
+        if key is None:  # Если заявка не найдена
             return  # то выходим, дальше не продолжаем
+        self._release_order(key, traded=int(trade['qty']))  # Заявку в финальном статусе удаляем из справочника после прихода всех сделок по ней
         dt = trade['datetime']
         dt_msk = datetime(int(dt['year']), int(dt['month']), int(dt['day']), int(dt['hour']), int(dt['min']), int(dt['sec']))
         quantity = int(trade['qty'])  # Абсолютное кол-во
@@ -385,6 +419,22 @@ class Quik(Broker):
             self.provider.quik_price_to_price(class_code, sec_code, float(trade['price']))))  # Цена сделки
         self.on_position.trigger(self.get_position(symbol))  # При любой сделке позиция изменяется. Отправим текущую или пустую позицию по тикеру по подписке
 
+    def _release_order(self, key: str, traded: int = 0, executed: int = None) -> None:
+        """Удаление заявки в финальном статусе из справочника. Сделки и заявки приходят по разным подпискам в любом порядке,
+        поэтому заявка удаляется только после прихода сделок на все исполненные лоты
+
+        :param key: Ключ заявки в справочнике
+        :param traded: Кол-во лотов в пришедшей сделке
+        :param executed: Кол-во исполненных лотов из финального статуса заявки
+        """
+        lots = self.order_lots.setdefault(key, [0, None])  # Лоты в пришедших сделках, исполненные лоты
+        lots[0] += traded
+        if executed is not None:  # Если пришел финальный статус заявки
+            lots[1] = executed  # то запоминаем кол-во исполненных лотов
+        if lots[1] is not None and lots[0] >= lots[1]:  # Если статус финальный, и сделки пришли на все исполненные лоты
+            self.order_registry.remove(key)  # то удаляем заявку со всеми номерами (выставления, снятия, на бирже)
+            del self.order_lots[key]
+
     @staticmethod
     def _ext_order_status_to_status(ext_order_status: int):
         if ext_order_status in (1, 8):  # заявка активна / приостановлено исполнение
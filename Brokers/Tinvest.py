@@ -3,7 +3,7 @@ from threading import Thread  # Запускаем поток подписки
 from math import log10  # Кол-во десятичных знаков будем получать из шага цены через десятичный логарифм
 from uuid import uuid4  # Номера заявок должны быть уникальными во времени и пространстве
 
-from FinLabPy.Core import Broker, Bar, Position, Trade, Order, Symbol  # Брокер, бар, позиция, сделка, заявка, тикер
+from FinLabPy.Core import Broker, RateLimiter, Bar, Position, PortfolioSnapshot, Trade, Order, Symbol  # Брокер, бар, позиция, снимок портфеля, сделка, заявка, тикер
 from TinvestPy import TinvestPy  # Работа с T-Invest API из Python
 from TinvestPy.grpc.instruments_pb2 import InstrumentRequest, InstrumentIdType, InstrumentResponse  # Тикер
 from TinvestPy.grpc.operations_pb2 import PortfolioRequest, PortfolioResponse  # Портфель
@@ -19,11 +19,18 @@ from TinvestPy.grpc.stoporders_pb2 import (
 
 class Tinvest(Broker):
     """Брокер Т-Инвестиции"""
+    rate_limits = {RateLimiter.MarketData: (600 / 60, 10),  # Бюджеты запросов T-Invest API. Рыночные данные - 600 запросов в минуту
+                   RateLimiter.Orders: (100 / 60, 5),  # Заявки - 100 запросов в минуту
+                   RateLimiter.Portfolio: (200 / 60, 5)}  # Портфель - 200 запросов в минуту
+    history_max_bars = 2400  # Максимальное кол-во свечей в ответе GetCandles
     def __init__(self, code, name, provider: TinvestPy, account_id=0, storage='file'):
         super().__init__(code, name, provider, account_id, storage)
         self.provider = provider  # Уже инициирован в базовом классе. Выполням для того, чтобы работать с типом провайдера
         self.account_id = self.provider.accounts[account_id].id  # Номер счета по порядковому номеру
         self.history_thread = None  # Поток подписок на историю тикера
+        self.storage.add_symbol_index('board_symbol', lambda symbol: (symbol.board, symbol.symbol))  # Индекс тикеров по режиму торгов и тикеру
+        self.storage.add_symbol_index('figi', lambda symbol: symbol.broker_info['figi'])  # Индекс тикеров по figi
+        self.storage.add_symbol_index('uid', lambda symbol: symbol.broker_info['uid'])  # Индекс тикеров по уникальному коду инструмента
 
         self.provider.on_candle.subscribe(self._on_new_bar)  # Обработка нового бара
         self.provider.on_order_state.subscribe(self._on_order)  # Обработка заявок
@@ -37,41 +44,7 @@ class Tinvest(Broker):
         return self._get_symbol_info(class_code=class_code, sec_code=sec_code)  # Спецификация тикера по режиму торгов и тикеру
 
     def get_history(self, symbol, time_frame, dt_from=None, dt_to=None):
-        bars = super().get_history(symbol, time_frame, dt_from, dt_to)  # Получаем бары из хранилища
-        tinvest_time_frame, intraday = self.provider.timeframe_to_tinvest_timeframe(time_frame)  # Временной интервал Т-Инвестиции, внутридневной интервал
-        if bars is None:  # Если бары из хранилища не получены
-            bars = []  # Пока список полученных бар пустой
-            seconds_from = self.provider.msk_datetime_to_timestamp(dt_from) if dt_from is not None else symbol.broker_info['first_1min_timestamp'] if intraday else symbol.broker_info['first_1day_timestamp']  # Первый возможный бар для внутридневного / дневного интервалов
-        else:  # Если бары из хранилища получены
-            seconds_from = self.provider.msk_datetime_to_timestamp(bars[-1].datetime)  # Дата и время открытия последнего бара
-            del bars[-1]  # Этот бар удалим из выборки хранилища. Возможно, он был несформированный
-        seconds_to = self.provider.msk_datetime_to_timestamp(datetime.now() if dt_to is None else dt_to)  # Последний возможный бар
-        _, td = self.provider.tinvest_timeframe_to_timeframe(tinvest_time_frame)  # Временной интервал для имени файла и максимальный период запроса
-        while seconds_from <= seconds_to:  # Пока нужно получать данные
-            request = GetCandlesRequest(instrument_id=symbol.broker_info['figi'], interval=tinvest_time_frame)  # Запрос на получение бар
-            from_ = getattr(request, 'from')  # т.к. from - ключевое слово в Python, то получаем атрибут from из атрибута интервала
-            from_.seconds = seconds_from  # Дата и время начала запроса
-            to_ = getattr(request, 'to')  # Аналогично будем работать с атрибутом to для единообразия
-            to_.seconds = seconds_from + int(td.total_seconds())  # Дата и время окончания запроса
-            candles_response: GetCandlesResponse = self.provider.call_function(self.provider.stub_marketdata.GetCandles, request)  # Получаем ответ на запрос бар
-            if len(candles_response.candles) > 0:  # Если за период получены бары
-                if len(bars) > 0:  # Если список бар не пустой
-                    del bars[-1]  # то удаляем последний бар. Он перепишется первым полученным баром за период
-                for candle in candles_response.candles:  # Пробегаемся по всем пришедшим барам
-                    dt_msk = self.provider.google_timestamp_to_msk_datetime(candle.time)  # Дата и время полученного бара
-                    if not intraday:  # Для дневных временнЫх интервалов и выше
-                        dt_msk = dt_msk.replace(hour=0, minute=0)  # убираем время, оставляем только дату
-                    open_ = self.provider.tinvest_price_to_price(symbol.board, symbol.symbol, self.provider.quotation_to_float(candle.open))  # Конвертируем цены
-                    high = self.provider.tinvest_price_to_price(symbol.board, symbol.symbol, self.provider.quotation_to_float(candle.high))  # из цен Т-Инвестиции
-                    low = self.provider.tinvest_price_to_price(symbol.board, symbol.symbol, self.provider.quotation_to_float(candle.low))  # в зависимости от
-                    close = self.provider.tinvest_price_to_price(symbol.board, symbol.symbol, self.provider.quotation_to_float(candle.close))  # режима торгов
-                    volume = candle.volume * symbol.lot_size  # Объем в шутках
-                    bars.append(Bar(symbol.board, symbol.symbol, symbol.dataname, time_frame, dt_msk, open_, high, low, close, volume))  # Добавляем бар
-            seconds_from += int(td.total_seconds())  # Дату и время начала запроса переносим на дату окончания
-        if len(bars) == 0:  # Если новых бар нет
-            return None  # то выходим, дальше не продолжаем
-        self.storage.set_bars(bars)  # Сохраняем бары в хранилище
-        return bars
+        return self.sync_history(symbol, time_frame, dt_from, dt_to)  # Бары из хранилища, дополненные недостающими интервалами от провайдера
 
     def subscribe_history(self, symbol, time_frame):
         if (symbol, time_frame) in self.history_subscriptions.keys():  # Если подписка уже есть
@@ -98,41 +71,24 @@ class Tinvest(Broker):
 
     def get_last_price(self, symbol):
         request = GetLastPricesRequest(instrument_id=[symbol.broker_info['figi']])
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
         response: GetLastPricesResponse = self.provider.call_function(self.provider.stub_marketdata.GetLastPrices, request)  # Запрос последних цен
         return self.provider.quotation_to_float(response.last_prices[-1].price)  # Последняя цена
 
     def get_value(self):
-        request = PortfolioRequest(account_id=self.account_id, currency=self.provider.currency)
-        response: PortfolioResponse = self.provider.call_function(self.provider.stub_operations.GetPortfolio, request)  # Получаем портфель по счету
-        return self.provider.money_value_to_float(response.total_amount_portfolio)  # Оценка портфеля
+        return self.get_snapshot().value  # Оценка портфеля из снимка
 
     def get_cash(self):
-        request = PortfolioRequest(account_id=self.account_id, currency=self.provider.currency)
-        response: PortfolioResponse = self.provider.call_function(self.provider.stub_operations.GetPortfolio, request)  # Получаем портфель по счету
-        cash = self.provider.money_value_to_float(response.total_amount_currencies)  # Свободные средства по счету
-        return cash
+        return self.get_snapshot().cash  # Свободные средства по счету из снимка
 
     def get_positions(self):
-        self.positions = []  # Текущие позиции
-        request = PortfolioRequest(account_id=self.account_id, currency=self.provider.currency)
-        response: PortfolioResponse = self.provider.call_function(self.provider.stub_operations.GetPortfolio, request)  # Получаем портфель по счету
-        for position in response.positions:  # Пробегаемся по всем активным позициям счета
-            symbol = self._get_symbol_info(figi=position.figi)  # Спецификация тикера по figi
-            if symbol.board == 'CETS':  # Валюты
-                continue  # за позиции не считаем
-            self.positions.append(Position(  # Добавляем текущую позицию в список
-                self,  # Брокер
-                symbol.dataname,  # Название тикера
-                symbol.description,  # Описание тикера
-                symbol.decimals,  # Кол-во десятичных знаков в цене
-                int(self.provider.quotation_to_float(position.quantity)),  # Кол-во в штуках
-                self.provider.money_value_to_float(position.average_position_price),  # Средняя цена входа в рублях
-                self.provider.money_value_to_float(position.current_price)))  # Последняя цена в рублях
+        self.positions = list(self.get_snapshot().positions)  # Текущие позиции из снимка
         return self.positions
 
     def get_orders(self):
         self.orders = []  # Активные заявки
         request = GetOrdersRequest(account_id=self.account_id)
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         response: GetOrdersResponse = self.provider.call_function(self.provider.stub_orders.GetOrders, request)  # Получаем активные заявки
         for order in response.orders:  # Пробегаемся по всем заявкам
             if order.execution_report_status in (OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL, OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_REJECTED, OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED):  # Если заявка не активная
@@ -149,6 +105,7 @@ class Tinvest(Broker):
                 self.provider.money_value_to_float(order.initial_security_price),  # Цена
                 status=Order.Partial if order.execution_report_status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_PARTIALLYFILL else Order.Accepted))  # Статус
         request = GetStopOrdersRequest(account_id=self.account_id)
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         response: GetStopOrdersResponse = self.provider.call_function(self.provider.stub_stop_orders.GetStopOrders, request)  # Получаем активные стоп заявки
         for stop_order in response.stop_orders:  # Пробегаемся по всем стоп заявкам
             symbol = self._get_symbol_info(figi=stop_order.figi)  # Спецификация тикера по figi
@@ -171,6 +128,7 @@ class Tinvest(Broker):
         price = 0 if order.exec_type in (Order.Market, Order.Stop) else self.provider.float_to_quotation(order.price)  # Для рыночной заявки цену не ставим
         stop_price = 0 if order.exec_type in (Order.Market, Order.Limit) else self.provider.float_to_quotation(order.stop_price)  # Стоп цена
         order_id = str(uuid4())  # Уникальный идентификатор заявки
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         if order.exec_type == Order.Market:  # Рыночная заявка
             direction = OrderDirection.ORDER_DIRECTION_BUY if order.buy else OrderDirection.ORDER_DIRECTION_SELL  # Покупка/продажа
             request = PostOrderRequest(instrument_id=symbol.broker_info['figi'], quantity=quantity, direction=direction,
@@ -216,6 +174,7 @@ class Tinvest(Broker):
         return False  # Операция завершилась с ошибкой
 
     def cancel_order(self, order):
+        self._limit(RateLimiter.Orders)  # Ждем, если бюджет запросов к провайдеру исчерпан
         if order.exec_type in (Order.Market, Order.Limit):  # Заявка
             request = CancelOrderRequest(account_id=self.account_id, order_id=order.id)
             self.provider.call_function(self.provider.stub_orders.CancelOrder, request)  # Отменяем активную заявку
@@ -239,20 +198,89 @@ class Tinvest(Broker):
 
     # Внутренние функции
 
-    def _get_symbol_info(self, class_code: str = None, sec_code: str = None, figi: str = None) -> Symbol | None:
-        """Спецификация тикера по режиму торгов и тикеру или figi"""
+    def _fetch_last_prices(self, symbols):
+        """Последние цены тикеров одним запросом GetLastPrices"""
+        request = GetLastPricesRequest(instrument_id=[symbol.broker_info['figi'] for symbol in symbols])  # Запрос принимает список инструментов
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
+        response: GetLastPricesResponse = self.provider.call_function(self.provider.stub_marketdata.GetLastPrices, request)  # Запрос последних цен
+        prices = {last_price.figi: self.provider.quotation_to_float(last_price.price) for last_price in response.last_prices}  # Последние цены по figi
+        return {symbol.dataname: prices.get(symbol.broker_info['figi']) for symbol in symbols}
+
+    def _fetch_snapshot(self):
+        """Снимок портфеля одним запросом GetPortfolio"""
+        request = PortfolioRequest(account_id=self.account_id, currency=self.provider.currency)
+        self._limit(RateLimiter.Portfolio)  # Ждем, если бюджет запросов к провайдеру исчерпан
+        response: PortfolioResponse = self.provider.call_function(self.provider.stub_operations.GetPortfolio, request)  # Получаем портфель по счету
+        positions = []  # Текущие позиции
+        for position in response.positions:  # Пробегаемся по всем активным позициям счета
+            symbol = self._get_symbol_info(figi=position.figi)  # Спецификация тикера по figi
+            if symbol.board == 'CETS':  # Валюты
+                continue  # за позиции не считаем
+            positions.append(Position(  # Добавляем текущую позицию в список
+                self,  # Брокер
+                symbol.dataname,  # Название тикера
+                symbol.description,  # Описание тикера
+                symbol.decimals,  # Кол-во десятичных знаков в цене
+                int(self.provider.quotation_to_float(position.quantity)),  # Кол-во в штуках
+                self.provider.money_value_to_float(position.average_position_price),  # Средняя цена входа в рублях
+                self.provider.money_value_to_float(position.current_price)))  # Последняя цена в рублях
+        return PortfolioSnapshot(
+            self.provider.money_value_to_float(response.total_amount_portfolio),  # Оценка портфеля
+            self.provider.money_value_to_float(response.total_amount_currencies),  # Свободные средства по счету
+            positions)  # Текущие позиции
+
+    def _fetch_history(self, symbol, time_frame, dt_from, dt_to):
+        tinvest_time_frame, intraday = self.provider.timeframe_to_tinvest_timeframe(time_frame)  # Временной интервал Т-Инвестиции, внутридневной интервал
+        seconds_from = 0 if dt_from is None else self.provider.msk_datetime_to_timestamp(dt_from)  # Дата и время начала интервала
+        seconds_from = max(seconds_from, symbol.broker_info['first_1min_timestamp'] if intraday else symbol.broker_info['first_1day_timestamp'])  # Окна до первого бара тикера не запрашиваем
+        seconds_to = self.provider.msk_datetime_to_timestamp(datetime.now() if dt_to is None else dt_to)  # Последний возможный бар
+        _, td = self.provider.tinvest_timeframe_to_timeframe(tinvest_time_frame)  # Временной интервал для имени файла и максимальный период запроса
+
+        def fetch(window_from: int, window_to: int) -> list[tuple]:
+            """Строки бар за окно с ... по ..."""
+            request = GetCandlesRequest(instrument_id=symbol.broker_info['figi'], interval=tinvest_time_frame)  # Запрос на получение бар
+            from_ = getattr(request, 'from')  # т.к. from - ключевое слово в Python, то получаем атрибут from из атрибута интервала
+            from_.seconds = window_from  # Дата и время начала запроса
+            to_ = getattr(request, 'to')  # Аналогично будем работать с атрибутом to для единообразия
+            to_.seconds = window_to  # Дата и время окончания запроса
+            self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
+            candles_response: GetCandlesResponse = self.provider.call_function(self.provider.stub_marketdata.GetCandles, request)  # Получаем ответ на запрос бар
+            window_rows = []  # Строки бар окна
+            for candle in candles_response.candles:  # Пробегаемся по всем пришедшим барам
+                dt_msk = self.provider.google_timestamp_to_msk_datetime(candle.time)  # Дата и время полученного бара
+                if not intraday:  # Для дневных временнЫх интервалов и выше
+                    dt_msk = dt_msk.replace(hour=0, minute=0)  # убираем время, оставляем только дату
+                open_ = self.provider.tinvest_price_to_price(symbol.board, symbol.symbol, self.provider.quotation_to_float(candle.open))  # Конвертируем цены
+                high = self.provider.tinvest_price_to_price(symbol.board, symbol.symbol, self.provider.quotation_to_float(candle.high))  # из цен Т-Инвестиции
+                low = self.provider.tinvest_price_to_price(symbol.board, symbol.symbol, self.provider.quotation_to_float(candle.low))  # в зависимости от
+                close = self.provider.tinvest_price_to_price(symbol.board, symbol.symbol, self.provider.quotation_to_float(candle.close))  # режима торгов
+                volume = candle.volume * symbol.lot_size  # Объем в шутках
+                window_rows.append((dt_msk, open_, high, low, close, volume))  # Добавляем бар
+            return window_rows
+
+        windows = self._history_windows(symbol, time_frame, seconds_from, seconds_to, int(td.total_seconds()))  # Окна запросов. Выходные и ночи пропускаем по расписанию торгов
+        return self._download_history(windows, fetch)  # Строки полученных бар. Окна запрашиваем одновременно
+
+    def _get_symbol_info(self, class_code: str = None, sec_code: str = None, figi: str = None, uid: str = None) -> Symbol | None:
+        """Спецификация тикера по режиму торгов и тикеру, figi или уникальному коду инструмента"""
         if class_code is not None and sec_code is not None:  # Если передали режим торгов и тикер
-            symbol = next((symbol for symbol in self.storage.symbols.values() if symbol.board == class_code and symbol.symbol == sec_code), None)  # Проверяем, есть ли спецификация тикера в хранилище по режиму торгов и тикеру
+            symbol = self.storage.get_symbol_by_index('board_symbol', (class_code, sec_code))  # Проверяем, есть ли спецификация тикера в хранилище по режиму торгов и тикеру
             if symbol is not None:  # Если есть тикер
                 return symbol  # то возвращаем его, выходим, дальше не продолжаем
             request = InstrumentRequest(id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_TICKER, class_code=class_code, id=sec_code)  # Поиск тикера по коду режима торгов/названию
         elif figi is not None:  # Если передали figi
-            symbol = next((symbol for symbol in self.storage.symbols.values() if symbol.broker_info['figi'] == figi), None)  # Проверяем, есть ли спецификация тикера в хранилище по figi
+            symbol = self.storage.get_symbol_by_index('figi', figi)  # Проверяем, есть ли спецификация тикера в хранилище по figi
             if symbol is not None:  # Если есть тикер
                 return symbol  # то возвращаем его, выходим, дальше не продолжаем
             request = InstrumentRequest(id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, class_code='', id=figi)  # Поиск тикера по figi
+        elif uid is not None:  # Если передали уникальный код инструмента
+            symbol = self.storage.get_symbol_by_index('uid', uid)  # Проверяем, есть ли спецификация тикера в хранилище по уникальному коду инструмента
+            if symbol is not None:  # Если есть тикер
+                return symbol  # то возвращаем его, выходим, дальше не продолжаем
+            request = InstrumentRequest(id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_UID, class_code='', id=uid)  # Поиск тикера по уникальному коду инструмента
         else:  # Если не передали режим торгов или тикер
             return None  # то выходим, дальше не продолжаем
+        self._limit(RateLimiter.MarketData)  # Ждем, если бюджет запросов к провайдеру исчерпан
         response: InstrumentResponse = self.provider.call_function(self.provider.stub_instruments.GetInstrumentBy, request)  # Получаем информацию о тикере
         if not response:  # Если информация о тикере не найдена
             return None  # то выходим, дальше не продолжаем
@@ -260,7 +288,7 @@ class Tinvest(Broker):
         min_step = self.provider.quotation_to_float(si.min_price_increment)  # Шаг цены
         decimals = 0 if min_step == 0 else int(log10(1 / min_step + 0.99))  # Из шага цены получаем кол-во десятичных знаков
         dataname = self.provider.class_code_symbol_to_dataname(si.class_code, si.ticker)  # Название тикера
-        broker_info = {'figi': si.figi, 'first_1min_timestamp': si.first_1min_candle_date.seconds, 'first_1day_timestamp': si.first_1day_candle_date.seconds}  # Информация брокера
+        broker_info = {'figi': si.figi, 'uid': si.uid, 'first_1min_timestamp': si.first_1min_candle_date.seconds, 'first_1day_timestamp': si.first_1day_candle_date.seconds}  # Информация брокера
         symbol = Symbol(si.class_code, si.ticker, dataname, si.name, decimals, min_step, si.lot, broker_info)
         self.storage.set_symbol(symbol)  # Добавляем спецификацию тикера в хранилище
         return symbol
@@ -278,6 +306,7 @@ class Tinvest(Broker):
         self.on_new_bar.trigger(Bar(symbol.board, symbol.symbol, symbol.dataname, time_frame, dt_msk, open_, high, low, close, volume))  # Вызываем событие добавления нового бара
 
     def _on_trade(self, order_trades: OrderTrades):
+        self.invalidate_snapshot()  # Сделка меняет портфель. Текущую позицию получим новым снимком
         symbol = self._get_symbol_info(figi=order_trades.figi)  # Спецификация тикера
         for trade in order_trades.trades:
             self.on_trade.trigger(Trade(
@@ -292,6 +321,7 @@ class Tinvest(Broker):
         self.on_position.trigger(self.get_position(symbol))  # При любой сделке позиция изменяется. Отправим текущую или пустую позицию по тикеру по подписке
 
     def _on_order(self, order_state: OrderState):
+        self.invalidate_snapshot()  # Заявка меняет портфель
         if order_state.order_type == OrderType.ORDER_TYPE_MARKET:  # Рыночная заявка
             order_type = Order.Market
         elif order_state.order_type == OrderType.ORDER_TYPE_LIMIT:  # Лимитная заявка
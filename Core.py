@@ -1,15 +1,24 @@
 # Курс Мультиброкер: Контроль https://finlab.vip/wpm-category/mbcontrol/
 
 from abc import ABC, abstractmethod  # Абстрактный класс и метод
-from typing import Any  # Любой тип
-from datetime import datetime  # Работа с датой и временем
+from typing import Any, Callable  # Любой тип, функция
+from datetime import datetime, date, time, timedelta  # Работа с датой и временем
 from math import copysign  # Знак числа
+from os import path, replace  # Файл спецификаций тикеров
+import json  # Спецификации тикеров в формате JSON
+from collections import OrderedDict  # Словарь с порядком использования для вытеснения из кэша
+from threading import Lock, Timer  # Блокировка кэша бар и спецификаций тикеров, отложенное сохранение спецификаций
+from time import monotonic, sleep  # Время для ограничения частоты запросов, ожидание
+from concurrent.futures import ThreadPoolExecutor  # Пул потоков для одновременных запросов истории
 
+import numpy as np  # Бары в колонках массивов NumPy
 import pandas as pd  # Конвертация бар в формат pandas DataFrame
 
 
 class Symbol:
     """Тикер"""
+    __slots__ = ('board', 'symbol', 'dataname', 'description', 'decimals', 'min_step', 'lot_size', 'broker_info')  # Атрибуты тикера. Без словаря атрибутов экземпляра для экономии памяти
+
     def __init__(self, board: str, symbol: str, dataname: str, description: str, decimals: int, min_step: float, lot_size: int, broker_info=None):
         self.board = board  # Код режима торгов
         self.symbol = symbol  # Тикер
@@ -26,6 +35,8 @@ class Symbol:
 
 class Bar:
     """Бар"""
+    __slots__ = ('board', 'symbol', 'dataname', 'time_frame', 'datetime', 'open', 'high', 'low', 'close', 'volume')  # Атрибуты бара
+
     def __init__(self, board: str, symbol: str, dataname: str, time_frame: str, date_time: datetime, open_: float, high: float, low: float, close: float, volume: int):
         self.board = board  # Код режима торгов
         self.symbol = symbol  # Тикер
@@ -46,12 +57,91 @@ class Bar:
         return f'{self.dataname} ({self.time_frame}) {self.datetime} Open: {self.open}, High: {self.high}, Low: {self.low}, Close: {self.close}, Volume: {self.volume}'
 
 
+class BarSeries:
+    """Бары тикера в колонках. Спецификация тикера хранится один раз на все бары"""
+    def __init__(self, board: str, symbol: str, dataname: str, time_frame: str, date_time=(), open_=(), high=(), low=(), close=(), volume=()):
+        self.board = board  # Код режима торгов
+        self.symbol = symbol  # Тикер
+        self.dataname = dataname  # Название тикера
+        self.time_frame = time_frame  # Временной интервал
+        self.datetime = date_time.astype('datetime64[ns]', copy=False) if isinstance(date_time, np.ndarray) else pd.DatetimeIndex(date_time).to_numpy(dtype='datetime64[ns]')  # Даты и время открытия бар по времени биржи. Список дат pandas переводит быстрее NumPy
+        self.open = np.asarray(open_, dtype=np.float64)  # Цены открытия
+        self.high = np.asarray(high, dtype=np.float64)  # Максимальные цены
+        self.low = np.asarray(low, dtype=np.float64)  # Минимальные цены
+        self.close = np.asarray(close, dtype=np.float64)  # Цены закрытия
+        self.volume = np.asarray(volume, dtype=np.int64)  # Объемы
+
+    @classmethod
+    def from_rows(cls, board: str, symbol: str, dataname: str, time_frame: str, rows: list[tuple]) -> 'BarSeries':
+        """Бары из списка строк (дата и время, open, high, low, close, volume)"""
+        if len(rows) == 0:  # Если строк нет
+            return cls(board, symbol, dataname, time_frame)  # то возвращаем пустые бары
+        date_time, open_, high, low, close, volume = zip(*rows)  # Разбиваем строки на колонки
+        return cls(board, symbol, dataname, time_frame, date_time, open_, high, low, close, volume)
+
+    @classmethod
+    def from_bars(cls, bars: list[Bar]) -> 'BarSeries':
+        """Бары из списка бар. Спецификация тикера берется по первому бару"""
+        first_bar = bars[0]  # Первый бар
+        return cls(first_bar.board, first_bar.symbol, first_bar.dataname, first_bar.time_frame,  # Колонки строим сразу по атрибутам бар без промежуточных строк
+                   [bar.datetime for bar in bars], [bar.open for bar in bars], [bar.high for bar in bars], [bar.low for bar in bars], [bar.close for bar in bars], [bar.volume for bar in bars])
+
+    @classmethod
+    def from_df(cls, pd_bars: pd.DataFrame, board: str, symbol: str, dataname: str, time_frame: str) -> 'BarSeries':
+        """Бары из pandas DataFrame с индексом по дате/времени бара"""
+        return cls(board, symbol, dataname, time_frame, pd_bars.index.to_numpy(), pd_bars['open'].to_numpy(), pd_bars['high'].to_numpy(), pd_bars['low'].to_numpy(), pd_bars['close'].to_numpy(), pd_bars['volume'].to_numpy())
+
+    def to_df(self, copy: bool = False) -> pd.DataFrame:
+        """Перевод в pandas DataFrame с индексом по дате/времени бара
+
+        :param bool copy: Копировать колонки. Без копирования DataFrame для бар из кэша только для чтения
+        """
+        return pd.DataFrame({'open': self.open, 'high': self.high, 'low': self.low, 'close': self.close, 'volume': self.volume},
+                            index=pd.DatetimeIndex(self.datetime, name='datetime', copy=copy), copy=copy)
+
+    def between(self, dt_from: datetime = None, dt_to: datetime = None) -> 'BarSeries':
+        """Бары с даты/времени по дату/время включительно"""
+        i_from = 0 if dt_from is None else int(np.searchsorted(self.datetime, np.datetime64(dt_from, 'ns'), side='left'))  # Первый бар не раньше даты/времени начала
+        i_to = len(self) if dt_to is None else int(np.searchsorted(self.datetime, np.datetime64(dt_to, 'ns'), side='right'))  # Бар после последнего бара не позже даты/времени окончания
+        return self[i_from:i_to]
+
+    def append(self, bars: 'BarSeries') -> 'BarSeries':
+        """Объединение с новыми барами. При совпадении даты/времени остается новый бар"""
+        if len(bars) == 0:  # Если новых бар нет
+            return self  # то возвращаем текущие бары
+        if len(self) == 0:  # Если текущих бар нет
+            return bars  # то возвращаем новые бары
+        columns = [np.concatenate((getattr(self, name), getattr(bars, name))) for name in ('datetime', 'open', 'high', 'low', 'close', 'volume')]  # Объединяем колонки
+        if bars.datetime[0] <= self.datetime[-1]:  # Если новые бары пересекаются с текущими
+            order = np.argsort(columns[0], kind='stable')  # Сортируем по дате/времени. Для одинаковой даты/времени новые бары остаются после текущих
+            columns = [column[order] for column in columns]
+            keep = np.append(columns[0][1:] != columns[0][:-1], True)  # Из бар с одинаковой датой/временем оставляем последний (новый)
+            columns = [column[keep] for column in columns]
+        return BarSeries(self.board, self.symbol, self.dataname, self.time_frame, *columns)
+
+    def __len__(self):
+        return len(self.datetime)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):  # Если запрашивается один бар
+            return Bar(self.board, self.symbol, self.dataname, self.time_frame, self.datetime[item].astype('datetime64[us]').item(),
+                       float(self.open[item]), float(self.high[item]), float(self.low[item]), float(self.close[item]), int(self.volume[item]))  # то создаем его по запросу
+        return BarSeries(self.board, self.symbol, self.dataname, self.time_frame, self.datetime[item], self.open[item], self.high[item], self.low[item], self.close[item], self.volume[item])  # Срез бар без копирования колонок
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self):
+        return f'{self.dataname} ({self.time_frame}) Кол-во бар: {len(self)}'
+
+
 class Order:
     """Заявка"""
     (Market, Limit, Stop, StopLimit) = range(4)  # Тип заявки. По рынку/лимит/стоп/стоп-лимит
     ExecTypes = ['Market', 'Limit', 'Stop', 'StopLimit']  # Отображение типа заявки
     (Created, Submitted, Accepted, Partial, Completed, Canceled, Expired, Margin, Rejected) = range(9)  # Статус заявки. Создана/отправлена брокеру/принята брокером/частично исполнена/исполнена/отменена/снята по времени/недостаточно средств/отклонена брокером
     Status = ['Created', 'Submitted', 'Accepted', 'Partial', 'Completed', 'Canceled', 'Expired', 'Margin', 'Rejected']  # Отображение статуса заявки
+    __slots__ = ('broker', 'id', 'buy', 'exec_type', 'dataname', 'decimals', 'quantity', 'price', 'stop_price', 'status')  # Атрибуты заявки
 
     def __init__(self, broker, order_id: str, buy: bool, exec_type, dataname: str, decimals: int, quantity: int, price: float=0, stop_price: float=0, status = Created):
         self.broker = broker  # Брокер
@@ -78,6 +168,8 @@ class Order:
 
 class Trade:
     """Сделка"""
+    __slots__ = ('broker', 'order_id', 'dataname', 'description', 'decimals', 'datetime', 'quantity', 'price')  # Атрибуты сделки
+
     def __init__(self, broker, order_id: str, dataname: str, description: str, decimals: int, date_time: datetime, quantity: int, price: int | float):
         self.broker = broker  # Брокер
         self.order_id = order_id  # Уникальный код заявки, по которой исполнилась сделка
@@ -100,6 +192,8 @@ class Trade:
 
 class Position:
     """Позиция"""
+    __slots__ = ('broker', 'dataname', 'description', 'decimals', 'quantity', 'average_price', 'current_price', 'change_pct')  # Атрибуты позиции
+
     def __init__(self, broker, dataname: str, description: str, decimals: int, quantity: int, average_price: int | float, current_price: int | float):
         self.broker = broker  # Брокер
         self.dataname = dataname  # Название тикера
@@ -123,37 +217,245 @@ class Position:
         return f'[{self.broker.code}] {self.dataname} ({self.description})\n      {self.quantity} @ {format_average_price} / {format_current_price} {self.change_pct:.2f}%'
 
 
+class OrderRegistry:
+    """Справочник заявок с индексами. Заявка находится по своему ключу, номеру заявки на бирже и номеру транзакции за O(1).
+    Хранит связанные (OCO) и родительские/дочерние заявки. Номера приводятся к строкам, т.к. провайдеры отдают их то числами, то строками"""
+
+    def __init__(self):
+        self.lock = Lock()  # Блокировка индексов. Заявки приходят из потоков подписок
+        self.orders: dict[str, Any] = {}  # Заявки. Ключ - номер заявки у владельца справочника (номер транзакции, ref BackTrader)
+        self.order_ids: dict[str, str] = {}  # Ключи заявок по номеру заявки на бирже
+        self.trans_ids: dict[str, str] = {}  # Ключи заявок по номеру транзакции
+        self.numbers: dict[str, list[tuple[dict[str, str], str]]] = {}  # Номера заявки в индексах для удаления. Ключ - ключ заявки, значение - [(индекс, номер)]
+        self.ocos: dict[str, str] = {}  # Связанные заявки. Ключ - ключ заявки, значение - ключ связанной с ней заявки
+        self.oco_refs: dict[str, set[str]] = {}  # Обратный индекс связанных заявок. Ключ - ключ заявки, значение - ключи заявок, у которых она указана связанной
+        self.children: dict[str, list] = {}  # Родительская и дочерние заявки по порядку. Ключ - ключ родительской заявки
+
+    def add(self, key, order, order_id=None, trans_id=None) -> None:
+        """Добавление заявки
+
+        :param key: Ключ заявки
+        :param order: Заявка
+        :param order_id: Номер заявки на бирже, если уже известен
+        :param trans_id: Номер транзакции, если есть
+        """
+        key = str(key)
+        with self.lock:
+            self.orders[key] = order
+            if order_id is not None:  # Если номер заявки на бирже известен
+                self._index(self.order_ids, order_id, key)  # то индексируем по нему
+            if trans_id is not None:  # Если есть номер транзакции
+                self._index(self.trans_ids, trans_id, key)  # то индексируем по нему
+
+    def set_order_id(self, key, order_id) -> None:
+        """Номер заявки на бирже, пришедший после постановки"""
+        with self.lock:
+            self._index(self.order_ids, order_id, str(key))
+
+    def set_trans_id(self, key, trans_id) -> None:
+        """Номер следующей транзакции по заявке (снятие, изменение). Ответ на нее найдет ту же заявку"""
+        with self.lock:
+            self._index(self.trans_ids, trans_id, str(key))
+
+    def get(self, key, default=None):
+        """Заявка по ключу"""
+        return self.orders.get(str(key), default)
+
+    def get_by_order_id(self, order_id):
+        """Заявка по номеру заявки на бирже или None"""
+        key = self.order_ids.get(str(order_id))
+        return None if key is None else self.orders.get(key)
+
+    def get_by_trans_id(self, trans_id):
+        """Заявка по номеру транзакции или None"""
+        key = self.trans_ids.get(str(trans_id))
+        return None if key is None else self.orders.get(key)
+
+    def get_key(self, number) -> str | None:
+        """Ключ заявки по ключу, номеру заявки на бирже или номеру транзакции или None"""
+        number = str(number)
+        if number in self.orders:  # Если это ключ заявки
+            return number  # то возвращаем его
+        return self.order_ids.get(number, self.trans_ids.get(number))
+
+    def set_oco(self, key, oco_key) -> None:
+        """Связанная заявка (One Cancel Others)"""
+        key, oco_key = str(key), str(oco_key)
+        with self.lock:
+            self.ocos[key] = oco_key
+            self.oco_refs.setdefault(oco_key, set()).add(key)
+
+    def get_oco(self, key) -> str | None:
+        """Ключ заявки, связанной с заявкой, или None"""
+        return self.ocos.get(str(key))
+
+    def get_oco_refs(self, key) -> list[str]:
+        """Ключи заявок, у которых заявка указана связанной"""
+        return list(self.oco_refs.get(str(key), ()))
+
+    def add_child(self, parent_key, order) -> None:
+        """Добавление родительской или дочерней заявки в очередь родительской заявки"""
+        with self.lock:
+            self.children.setdefault(str(parent_key), []).append(order)
+
+    def get_children(self, parent_key) -> list | None:
+        """Родительская и дочерние заявки по порядку или None, если родительской заявки нет"""
+        return self.children.get(str(parent_key))
+
+    def remove(self, key) -> None:
+        """Удаление заявки со всеми индексами"""
+        key = str(key)
+        with self.lock:
+            if self.orders.pop(key, None) is None:  # Если заявки нет
+                return  # то выходим, дальше не продолжаем
+            for index, number in self.numbers.pop(key, ()):  # Номера заявки удаляем из индексов
+                index.pop(number, None)
+            oco_key = self.ocos.pop(key, None)  # Связанная заявка
+            if oco_key is not None:  # Если она есть
+                self.oco_refs.get(oco_key, set()).discard(key)  # то удаляем заявку из обратного индекса
+            self.children.pop(key, None)
+
+    def values(self) -> list:
+        """Все заявки"""
+        return list(self.orders.values())
+
+    def __contains__(self, key):
+        return str(key) in self.orders
+
+    def __getitem__(self, key):
+        return self.orders[str(key)]
+
+    def __len__(self):
+        return len(self.orders)
+
+    # Внутренние функции
+
+    def _index(self, index: dict[str, str], number, key: str) -> None:
+        """Добавление номера заявки в индекс"""
+        index[str(number)] = key
+        self.numbers.setdefault(key, []).append((index, str(number)))
+
+
+class PortfolioSnapshot:
+    """Снимок портфеля: стоимость, свободные средства и позиции, полученные от брокера за один раз"""
+    __slots__ = ('value', 'cash', 'positions', 'received')  # Атрибуты снимка
+
+    def __init__(self, value: float, cash: float, positions: list[Position]):
+        self.value = value  # Стоимость портфеля
+        self.cash = cash  # Свободные средства
+        self.positions = positions  # Открытые позиции
+        self.received = monotonic()  # Время получения снимка
+
+    def __repr__(self):
+        return f'Стоимость {self.value:.2f}, свободные средства {self.cash:.2f}, позиций {len(self.positions)}'
+
+
 # noinspection PyShadowingBuiltins
+class RateLimiter:
+    """Ограничение частоты запросов к провайдеру. Маркерная корзина (token bucket) на каждый класс запросов. Один на всех брокеров с одним провайдером"""
+    (MarketData, Orders, Portfolio) = ('market_data', 'orders', 'portfolio')  # Классы запросов. Рыночные данные/заявки/портфель
+
+    def __init__(self, budgets: dict[str, tuple[float, int]] = None):
+        """
+        :param budgets: Бюджеты запросов. Ключ - класс запросов, значение - (кол-во запросов в секунду, максимальная пачка запросов). Классы без бюджета не ограничиваются
+        """
+        self.lock = Lock()  # Блокировка корзин и статистики
+        self.buckets: dict[str, list[float]] = {}  # Корзины по классам запросов [запросов в секунду, размер корзины, маркеров в корзине, время пополнения]
+        self.metrics: dict[str, list[float]] = {}  # Статистика по классам запросов [кол-во запросов, кол-во ожиданий, суммарное ожидание в секундах, максимальное ожидание в секундах]
+        for endpoint, (rate, burst) in (budgets or {}).items():  # Пробегаемся по всем бюджетам
+            self.set_budget(endpoint, rate, burst)
+
+    def set_budget(self, endpoint: str, rate: float, burst: int = 1) -> None:
+        """Бюджет класса запросов
+
+        :param endpoint: Класс запросов
+        :param rate: Кол-во запросов в секунду
+        :param burst: Максимальная пачка запросов без ожидания
+        """
+        with self.lock:
+            self.buckets[endpoint] = [rate, burst, burst, monotonic()]  # Корзина изначально полная
+
+    def acquire(self, endpoint: str, tokens: int = 1) -> float:
+        """Разрешение на запрос. Если маркеров в корзине нет, то ждем их поступления
+
+        :param endpoint: Класс запросов
+        :param tokens: Кол-во запросов
+        :return: Ожидание в секундах
+        """
+        with self.lock:
+            metrics = self.metrics.setdefault(endpoint, [0, 0, 0.0, 0.0])  # Статистика класса запросов
+            metrics[0] += tokens  # Кол-во запросов
+            bucket = self.buckets.get(endpoint)  # Корзина класса запросов
+            if bucket is None:  # Если бюджета нет
+                return 0.0  # то запрос не ограничиваем
+            rate, burst, available, updated = bucket
+            now = monotonic()
+            available = min(burst, available + (now - updated) * rate) - tokens  # Пополняем корзину за прошедшее время и забираем маркеры. Отрицательный остаток - очередь ожидающих запросов
+            bucket[2], bucket[3] = available, now
+            wait = -available / rate if available < 0 else 0.0  # Ожидание, пока поступят маркеры за все запросы в очереди
+            if wait > 0:  # Если запросу придется ждать
+                metrics[1] += 1  # Кол-во ожиданий
+                metrics[2] += wait  # Суммарное ожидание
+                metrics[3] = max(metrics[3], wait)  # Максимальное ожидание
+        if wait > 0:  # Ждем вне блокировки, чтобы другие запросы вставали в очередь
+            sleep(wait)
+        return wait
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Статистика ожиданий по классам запросов"""
+        with self.lock:
+            return {endpoint: {'requests': requests, 'waits': waits, 'wait_total': wait_total, 'wait_max': wait_max, 'wait_avg': wait_total / requests if requests else 0.0}
+                    for endpoint, (requests, waits, wait_total, wait_max) in self.metrics.items()}
+
+    def __repr__(self):
+        return ', '.join(f'{endpoint}: {s["requests"]} запросов, {s["waits"]} ожиданий, всего {s["wait_total"]:.3f} с, максимум {s["wait_max"]:.3f} с' for endpoint, s in self.stats().items())
+
+
 class Broker(ABC):
     """Брокер"""
+    history_workers = 4  # Максимальное кол-во одновременных запросов истории к провайдеру
+    history_executors: dict[int, ThreadPoolExecutor] = {}  # Пулы потоков запросов истории. Ключ - идентификатор провайдера. Брокеры с одним провайдером делят один пул
+    history_executors_lock = Lock()  # Блокировка создания пулов потоков
+    history_max_bars: int | None = None  # Максимальное кол-во бар в ответе провайдера на запрос истории. None, если ограничен только период запроса
+    rate_limits: dict[str, tuple[float, int]] = {}  # Бюджеты запросов к провайдеру. Ключ - класс запросов RateLimiter, значение - (кол-во запросов в секунду, максимальная пачка запросов). Задаются в брокерах
+    rate_limiters: dict[int, RateLimiter] = {}  # Ограничения частоты запросов. Ключ - идентификатор провайдера. Брокеры с одним провайдером делят один бюджет
+    rate_limiters_lock = Lock()  # Блокировка создания ограничений частоты запросов
+    snapshot_ttl = 1.0  # Время жизни снимка портфеля в секундах. Стоимость, свободные средства и позиции в течение него берутся из снимка
+    last_prices_ttl = 1.0  # Время жизни последней цены в секундах. Цены из подписки на бары тоже живут это время
+    last_prices_workers = 4  # Максимальное кол-во одновременных запросов последних цен у брокеров без запроса цен списком
+
     def __init__(self, code: str, name: str, provider, account_id: int = 0, storage: str = 'file'):
         self.code = code  # Код брокера
         self.name = name  # Название провайдера
         self.provider = provider  # Провайдер
         self.account_id = account_id  # Порядковый номер счета
+        self.rate_limiter = self._rate_limiter()  # Ограничение частоты запросов к провайдеру
 
         if storage == 'file':  # Если файловое хранилище
             from FinLabPy.Storage.FileStorage import FileStorage  # то ипортируем библиотеку файлового хранилища
             self.storage = FileStorage(self.__class__.__name__)  # Инициализируем хранилище
         elif storage == 'db':  # Если хранилище в БД
-            try:
-                from FinLabPy.Storage.SQLiteStorage import SQLiteStorage  # Пытаемся импортировать библиотеку Курса Базы данных для трейдеров https://finlab.vip/wpm-category/databases/
-                self.storage = SQLiteStorage()  # Инициализируем хранилище
-            except ModuleNotFoundError:  # Если библиотека не найдена
-                from FinLabPy.Storage.FileStorage import FileStorage  # то ипортируем библиотеку файлового хранилища
-                self.storage = FileStorage(self.__class__.__name__)  # Инициализируем хранилище
+            from FinLabPy.Storage.SQLiteStorage import SQLiteStorage  # то ипортируем библиотеку хранилища в базе данных SQLite
+            self.storage = SQLiteStorage(self.__class__.__name__)  # Инициализируем хранилище
+        elif storage == 'bin':  # Если хранилище в двоичных файлах
+            from FinLabPy.Storage.BinaryStorage import BinaryStorage  # то ипортируем библиотеку хранилища в двоичных файлах
+            self.storage = BinaryStorage(self.__class__.__name__)  # Инициализируем хранилище
         else:  # В остальных случаях
             from FinLabPy.Storage.FileStorage import FileStorage  # то ипортируем библиотеку файлового хранилища
             self.storage = FileStorage(self.__class__.__name__)  # Инициализируем хранилище
 
         self.positions: list[Position] = []  # Текущие позиции
         self.orders: list[Order] = []  # Активные заявки
+        self.snapshot: PortfolioSnapshot | None = None  # Последний снимок портфеля
+        self.snapshot_lock = Lock()  # Блокировка запроса снимка. Одновременные запросы ждут один снимок
+        self.last_prices: dict[str, tuple[float, float]] = {}  # Последние цены. Ключ - название тикера, значение - (цена, время получения)
 
         self.history_subscriptions: dict[tuple[Symbol, str], Any] = {}  # Справочник подписок на историю тикеров. Ключ - (тикер, временной интервал), значение - данные подписки
         self.on_new_bar = Event()  # Получение нового бара по подписке
         self.on_order = Event()  # Получение заявки по подписке
         self.on_trade = Event()  # Получение сделки по подписке
         self.on_position = Event()  # Получение позиции по подписке
+        self.on_new_bar.subscribe(self._on_new_bar_price)  # Цена закрытия бара по подписке - последняя цена тикера
 
     def get_symbol_by_dataname(self, dataname: str) -> Symbol | None:
         """Тикер по названию"""
@@ -164,9 +466,39 @@ class Broker(ABC):
         """Название тикера из кода режима торгов и тикера"""
         return f'{board}.{symbol}'
 
-    def get_history(self, symbol: Symbol, time_frame: str, dt_from: datetime = None, dt_to: datetime = None) -> list[Bar] | None:
+    def get_history(self, symbol: Symbol, time_frame: str, dt_from: datetime = None, dt_to: datetime = None) -> BarSeries | None:
         """История тикера"""
-        return self.storage.get_bars(symbol, time_frame, dt_from, dt_to)
+        return bar_cache.get_bars(self.storage, symbol, time_frame, dt_from, dt_to)  # Бары из кэша или хранилища
+
+    def sync_history(self, symbol: Symbol, time_frame: str, dt_from: datetime = None, dt_to: datetime = None) -> BarSeries | None:
+        """История тикера из хранилища, дополненная у провайдера. Запрашиваются только интервалы, которых нет в хранилище:
+        до первого бара, пропущенные торговые дни по расписанию и после последнего бара. Полученные бары объединяются с хранилищем
+
+        :param symbol: Тикер
+        :param time_frame: Временной интервал https://ru.wikipedia.org/wiki/Таймфрейм
+        :param dt_from: Дата и время начала истории. None - с первого бара в хранилище или с начала истории у провайдера
+        :param dt_to: Дата и время окончания истории. None - до текущего момента
+        """
+        bars = bar_cache.get_bars(self.storage, symbol, time_frame, dt_from, dt_to)  # Бары из кэша или хранилища
+        rows = []  # Строки полученных бар
+        empty_days = []  # Запрошенные дни, за которые провайдер не вернул бар
+        for span_from, span_to, span_days in self._missing_spans(symbol, time_frame, bars, dt_from, dt_to):  # Пробегаемся по всем недостающим интервалам по порядку
+            span_rows = self._fetch_history(symbol, time_frame, span_from, span_to)  # Запрашиваем строки бар интервала у провайдера. Если запрос не удался, то дни интервала не отмечаются
+            rows.extend(span_rows)
+            if len(span_days) > 0:  # Если интервал закрывает пропущенные дни
+                received_days = {row[0].date() for row in span_rows}  # Дни, за которые получены бары
+                empty_days.extend(d for d in span_days if d not in received_days)  # Дни без бар у провайдера (праздники, дни без сделок)
+        if len(empty_days) > 0:  # Если есть дни без бар
+            self.storage.add_empty_days(symbol.dataname, time_frame, empty_days)  # то запоминаем их в хранилище, чтобы не запрашивать повторно и в следующих запусках
+        new_bars = BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, time_frame, rows)  # Полученные бары
+        if bars is not None:  # Если бары из хранилища получены
+            bars = bars.append(new_bars)  # Объединяем с полученными барами. Бары из хранилища на ту же дату и время переписываются полученными барами
+        else:  # Если баров в хранилище нет
+            bars = new_bars  # то история - это полученные бары
+        if len(bars) == 0:  # Если бар нет
+            return None  # то выходим, дальше не продолжаем
+        bar_cache.set_bars(self.storage, new_bars)  # Сохраняем в хранилище и кэш только полученные бары
+        return bars
 
     def subscribe_history(self, symbol: Symbol, time_frame: str) -> None:
         """Подписка на историю тикера"""
@@ -178,7 +510,7 @@ class Broker(ABC):
 
     def unsubscribe_all_history(self):
         """Отмена всех подписок на историю"""
-        for (symbol, time_frame) in self.history_subscriptions.keys():  # Пробегаемся по всем подпискам
+        for (symbol, time_frame) in list(self.history_subscriptions.keys()):  # Пробегаемся по всем подпискам. Подписки удаляются при отмене
             self.unsubscribe_history(symbol, time_frame)  # отменяем подписку
         self.history_subscriptions = {}  # Очищаем справочник подписок
 
@@ -186,6 +518,31 @@ class Broker(ABC):
         """Последняя цена тикера"""
         raise NotImplementedError
 
+    def get_last_prices(self, symbols: list[Symbol]) -> dict[str, float | None]:
+        """Последние цены тикеров. Цены, полученные не раньше last_prices_ttl секунд назад запросом или по подписке на бары, повторно не запрашиваются
+
+        :param symbols: Тикеры
+        :return: Последние цены. Ключ - название тикера, значение - цена или None, если не найдена
+        """
+        now = monotonic()
+        prices = {}  # Последние цены
+        missing = []  # Тикеры, цены которых нужно запросить
+        for symbol in symbols:  # Пробегаемся по всем тикерам
+            price, received = self.last_prices.get(symbol.dataname, (None, None))  # Цена в кэше
+            if received is not None and now - received < self.last_prices_ttl:  # Если цена не устарела
+                prices[symbol.dataname] = price  # то берем ее
+            elif symbol.dataname not in prices:  # Если цены нет, и тикер не повторяется
+                prices[symbol.dataname] = None  # то запросим ее
+                missing.append(symbol)
+        if len(missing) > 0:  # Если есть тикеры без цен
+            fetched = self._fetch_last_prices(missing)  # то запрашиваем их у брокера
+            now = monotonic()
+            for dataname, price in fetched.items():  # Пробегаемся по всем полученным ценам
+                prices[dataname] = price
+                if price is not None:  # Ненайденные цены не кэшируем
+                    self.last_prices[dataname] = (price, now)
+        return prices
+
     def get_value(self) -> float:
         """Стоимость портфеля"""
         raise NotImplementedError
@@ -198,9 +555,24 @@ class Broker(ABC):
         """Открытые позиции"""
         raise NotImplementedError
 
+    def get_snapshot(self) -> PortfolioSnapshot:
+        """Снимок портфеля. Запрашивается у брокера, только если последний снимок устарел или сброшен событием по счету"""
+        snapshot = self.snapshot  # Последний снимок
+        if snapshot is not None and monotonic() - snapshot.received < self.snapshot_ttl:  # Если снимок не устарел
+            return snapshot  # то возвращаем его без блокировки
+        with self.snapshot_lock:  # Снимок запрашивает один поток
+            snapshot = self.snapshot  # Снимок мог получить другой поток, пока мы ждали
+            if snapshot is None or monotonic() - snapshot.received >= self.snapshot_ttl:  # Если снимок по-прежнему устарел
+                snapshot = self.snapshot = self._fetch_snapshot()  # то запрашиваем его у брокера
+            return snapshot
+
+    def invalidate_snapshot(self) -> None:
+        """Сброс снимка портфеля. Вызывается при заявках, сделках и позициях по подписке"""
+        self.snapshot = None
+
     def get_position(self, symbol: Symbol) -> Position:
         """Открытая или пустая позиция по тикеру"""
-        self.get_positions()  # Получаем все открытые позиции
+        self.get_positions()  # Получаем все открытые позиции. Брокеры со снимком портфеля берут их из снимка
         position = next((position for position in self.positions if position.dataname == symbol.dataname), None)  # Из них пробуем получить позицию по тикеру
         if position is None:  # Если позиции не существует
             position = Position(
@@ -210,7 +582,7 @@ class Broker(ABC):
                 symbol.decimals,  # Кол-во десятичных знаков в цене
                 0,  # Кол-во в штуках (позиция закрыта)
                 0,  # Цена входа в рублях за штуку (не имеет смысла для закрытой позиции)
-                self.get_last_price(symbol) or 0)  # Последняя цена в рублях за штуку или 0, если не найдена
+                self.get_last_prices([symbol])[symbol.dataname] or 0)  # Последняя цена в рублях за штуку или 0, если не найдена
         return position
 
     def get_orders(self) -> list[Order]:
@@ -237,31 +609,420 @@ class Broker(ABC):
         """Закрытие провайдера"""
         raise NotImplementedError
 
+    # Внутренние функции
+
+    def _fetch_last_prices(self, symbols: list[Symbol]) -> dict[str, float | None]:
+        """Последние цены тикеров от брокера. Брокеры с запросом цен списком переопределяют эту функцию. Иначе, цены запрашиваются одновременно по одной
+
+        :param symbols: Тикеры без повторов
+        :return: Последние цены. Ключ - название тикера, значение - цена или None, если не найдена
+        """
+        if len(symbols) == 1:  # Если тикер один
+            return {symbols[0].dataname: self.get_last_price(symbols[0])}  # то запрашиваем цену в текущем потоке
+        with ThreadPoolExecutor(min(self.last_prices_workers, len(symbols)), thread_name_prefix=f'LastPrices{self.__class__.__name__}') as executor:  # Ограничиваем кол-во одновременных запросов
+            return dict(zip((symbol.dataname for symbol in symbols), executor.map(self.get_last_price, symbols)))
+
+    def _on_new_bar_price(self, bar: Bar) -> None:
+        """Цена закрытия бара по подписке в кэш последних цен"""
+        self.last_prices[bar.dataname] = (bar.close, monotonic())
+
+    def _fetch_snapshot(self) -> PortfolioSnapshot:
+        """Снимок портфеля от брокера. Брокеры, получающие стоимость, свободные средства и позиции одним ответом, переопределяют get_value, get_cash, get_positions через get_snapshot"""
+        return PortfolioSnapshot(self.get_value(), self.get_cash(), self.get_positions())
+
+    def _fetch_history(self, symbol: Symbol, time_frame: str, dt_from: datetime | None, dt_to: datetime | None) -> list[tuple]:
+        """Строки бар (дата и время, open, high, low, close, volume) от провайдера за интервал
+
+        :param symbol: Тикер
+        :param time_frame: Временной интервал https://ru.wikipedia.org/wiki/Таймфрейм
+        :param dt_from: Дата и время начала интервала. None - с начала истории у провайдера
+        :param dt_to: Дата и время окончания интервала. None - до текущего момента
+        """
+        raise NotImplementedError
+
+    def _missing_spans(self, symbol: Symbol, time_frame: str, bars: BarSeries | None, dt_from: datetime | None, dt_to: datetime | None) -> list[tuple[datetime | None, datetime | None, list[date]]]:
+        """Интервалы истории, которых нет в хранилище, по порядку. Дни без бар у провайдера, сохраненные в хранилище, не запрашиваются
+
+        :param symbol: Тикер
+        :param time_frame: Временной интервал https://ru.wikipedia.org/wiki/Таймфрейм
+        :param bars: Бары из хранилища с ... по ...
+        :param dt_from: Дата и время начала истории. None - с первого бара в хранилище
+        :param dt_to: Дата и время окончания истории. None - до текущего момента
+        :return: Интервалы (дата и время начала, дата и время окончания, дни, которые интервал закрывает). Дни, за которые провайдер не вернет бар, сохраняются в хранилище после запроса
+        """
+        if bars is None or len(bars) == 0:  # Если в хранилище нет бар
+            return [(dt_from, dt_to, [])]  # то запрашиваем всю историю
+        spans = []  # Недостающие интервалы
+        checked = self.storage.get_empty_days(symbol.dataname, time_frame)  # Дни без бар у провайдера, уже запрошенные ранее
+        dt_first, dt_last = bars[0].datetime, bars[-1].datetime  # Первый и последний бары в хранилище
+        from FinLabPy.Schedule.MOEX import board_schedule  # Расписание торгов по режиму торгов. Импортируем здесь, т.к. расписание нужно не всем
+        schedule = board_schedule(symbol.board)  # Расписание торгов тикера
+        if schedule is not None and schedule.parse_tf(time_frame)[0] in ('M', 'D'):  # Если бары внутридневные или дневные с известным расписанием
+            stored_days = set(np.unique(bars.datetime.astype('datetime64[D]')).tolist())  # Дни, в которых есть бары
+            d_from = dt_first.date() if dt_from is None else min(dt_from.date(), dt_first.date())  # Первый день истории
+            missing = [d for d in schedule.trade_dates(d_from, dt_last.date()) if d not in stored_days and d not in checked]  # Торговые дни без бар, которые еще не запрашивали
+            for d in missing:  # Пробегаемся по всем пропущенным дням. Идущие подряд торговые дни объединяем в один интервал
+                span_from = datetime.combine(d, time.min) if dt_from is None else max(datetime.combine(d, time.min), dt_from)  # Начало дня, но не раньше начала истории
+                span_to = datetime.combine(d, time.max)  # Окончание дня
+                if len(spans) > 0 and len(schedule.trade_dates(spans[-1][1].date() + timedelta(days=1), d)) == 1:  # Если предыдущий пропущенный день - предыдущий торговый день
+                    spans[-1][1] = span_to  # то продлеваем его интервал
+                    spans[-1][2].append(d)
+                else:  # Если между пропущенными днями есть бары
+                    spans.append([span_from, span_to, [d]])  # то начинаем новый интервал
+        elif dt_from is not None and dt_from < dt_first and dt_from.date() not in checked:  # Если расписание неизвестно, и история начинается раньше хранилища
+            spans.append([dt_from, dt_first, [dt_from.date()]])  # то запрашиваем бары до первого бара в хранилище. Если бар нет, то повторно не запрашиваем
+        if dt_to is None or dt_last < dt_to:  # Если история продолжается после последнего бара
+            spans.append([dt_last, dt_to, []])  # то запрашиваем с последнего бара. Он мог быть не завершен
+        return [tuple(span) for span in spans]
+
+    def _history_windows(self, symbol: Symbol, time_frame: str, seconds_from: int, seconds_to: int, window_seconds: int) -> list[tuple[int, int]]:
+        """Окна запросов истории. Внутридневную историю по расписанию торгов запрашиваем только за торговые дни
+
+        :param symbol: Тикер
+        :param time_frame: Временной интервал https://ru.wikipedia.org/wiki/Таймфрейм
+        :param seconds_from: Дата и время начала истории в секундах с 01.01.1970 UTC
+        :param seconds_to: Дата и время окончания истории в секундах с 01.01.1970 UTC
+        :param window_seconds: Максимальный период одного запроса к провайдеру в секундах
+        :return: Окна (начало, окончание) в секундах с 01.01.1970 UTC по порядку
+        """
+        from FinLabPy.Schedule.MOEX import board_schedule  # Расписание торгов по режиму торгов. Импортируем здесь, т.к. расписание нужно не всем
+        schedule = board_schedule(symbol.board)  # Расписание торгов тикера
+        if schedule is None or not schedule.parse_tf(time_frame)[2]:  # Если расписание неизвестно или интервал не внутридневной
+            return [(window_from, window_from + window_seconds) for window_from in range(seconds_from, seconds_to + 1, window_seconds)]  # то запрашиваем окна подряд
+        windows = schedule.trade_windows(schedule.timestamp_to_msk_datetime(seconds_from), schedule.timestamp_to_msk_datetime(seconds_to), time_frame, timedelta(seconds=window_seconds), self.history_max_bars)  # Окна по торговым дням на бирже
+        return [(schedule.msk_datetime_to_timestamp(dt_begin), schedule.msk_datetime_to_timestamp(dt_end)) for dt_begin, dt_end in windows]
+
+    def _download_history(self, windows: list[tuple[int, int]], fetch: Callable[[int, int], list[tuple]]) -> list[tuple]:
+        """Строки бар за период. Окна запрашиваются у провайдера одновременно
+
+        :param windows: Окна (начало, окончание) в секундах с 01.01.1970 UTC по порядку
+        :param fetch: Запрос строк бар окна (дата и время, open, high, low, close, volume) с ... по ...
+        :return: Строки бар всех окон по порядку
+        """
+        if len(windows) <= 1:  # Если окон не больше одного
+            results = [fetch(window_from, window_to) for window_from, window_to in windows]  # то запрашиваем его в текущем потоке
+        else:  # Если окон несколько
+            executor = self._history_executor()  # Пул потоков провайдера ограничивает кол-во одновременных запросов от всех брокеров
+            results = list(executor.map(lambda window: fetch(*window), windows))  # Запрашиваем окна одновременно. Результаты получаем по порядку окон
+        rows = []  # Строки полученных бар
+        for window_rows in results:  # Пробегаемся по всем окнам по порядку
+            if len(window_rows) > 0:  # Если за период получены бары
+                while len(rows) > 0 and rows[-1][0] >= window_rows[0][0]:  # Пока последние бары не раньше первого полученного бара за период
+                    del rows[-1]  # удаляем их. Они перепишутся полученными барами
+                rows.extend(window_rows)  # Добавляем бары окна
+        return rows
+
+    def _rate_limiter(self) -> RateLimiter:
+        """Ограничение частоты запросов провайдера. Бюджеты задает первый брокер провайдера"""
+        with self.rate_limiters_lock:  # Ограничение создаем один раз на провайдера
+            rate_limiter = self.rate_limiters.get(id(self.provider))  # Ограничение провайдера
+            if rate_limiter is None:  # Если ограничения еще нет
+                rate_limiter = self.rate_limiters[id(self.provider)] = RateLimiter(self.rate_limits)  # то создаем его
+            return rate_limiter
+
+    def _limit(self, endpoint: str) -> float:
+        """Ожидание разрешения на запрос к провайдеру. Возвращает ожидание в секундах"""
+        return self.rate_limiter.acquire(endpoint)  # Ждем, если бюджет класса запросов исчерпан
+
+    def _history_executor(self) -> ThreadPoolExecutor:
+        """Пул потоков запросов истории провайдера"""
+        with self.history_executors_lock:  # Пул создаем один раз на провайдера
+            executor = self.history_executors.get(id(self.provider))  # Пул потоков провайдера
+            if executor is None:  # Если пула еще нет
+                executor = self.history_executors[id(self.provider)] = ThreadPoolExecutor(self.history_workers, thread_name_prefix=f'History{self.__class__.__name__}')  # то создаем его
+            return executor
+
 
 class Storage(ABC):
     """Хранилище бар и спецификации тикеров брокера"""
+    symbols_ttl: timedelta | None = timedelta(days=7)  # Время жизни спецификации тикера. После него спецификация запрашивается у брокера заново. None - без ограничения
+    symbols_save_delay = 1.0  # Задержка сохранения спецификаций тикеров в файл в секундах. Спецификации, полученные за это время, сохраняются одной записью
+
     def __init__(self, source: str):
         self.source = source  # Источник хранилища
         self.symbols: dict[str, Symbol] = {}  # Словать тикеров
+        self.symbols_updated: dict[str, datetime] = {}  # Дата и время получения спецификаций тикеров от брокера
+        self.symbol_indexes: dict[str, tuple[Callable[[Symbol], Any], dict[Any, Symbol]]] = {}  # Дополнительные индексы тикеров. Ключ - название индекса, значение - (функция ключа по тикеру, словарь тикеров по ключу)
+        self.symbols_filename: str | None = None  # Файл спецификаций тикеров. None - спецификации в файл не сохраняются
+        self.symbols_lock = Lock()  # Блокировка спецификаций тикеров. Тикеры добавляются из разных потоков
+        self.symbols_timer: Timer | None = None  # Отложенное сохранение спецификаций тикеров в файл. None - несохраненных спецификаций нет
+        self.empty_days: dict[tuple[str, str], set[date]] = {}  # Дни без бар у провайдера. Ключ - (название тикера, временной интервал)
+        self.empty_days_filename: str | None = None  # Файл дней без бар. None - дни в файл не сохраняются
+        self.empty_days_lock = Lock()  # Блокировка дней без бар. Дни добавляются из разных потоков
 
     def get_symbol(self, dataname: str) -> Symbol | None:
-        """Получение тикера"""
+        """Получение тикера. Если спецификация устарела, то тикера нет"""
+        if not self.is_symbol_fresh(dataname):  # Если спецификации нет, или она устарела
+            return None  # то выходим, дальше не продолжаем
         return self.symbols.get(dataname)  # Пробуем получить тикер по названию из словаря
 
     def set_symbol(self, symbol: Symbol) -> None:
-        """Сохранение тикера"""
-        self.symbols[symbol.dataname] = symbol  # Добавляем/изменяем тикер в словаре
+        """Сохранение тикера. В файл спецификации сохраняются через symbols_save_delay секунд одной записью
+
+        :raises TypeError: Информацию брокера нельзя сохранить в JSON
+        """
+        json.dumps(symbol.broker_info)  # Информация брокера должна читаться из файла такой же, как сохранена. Иначе, ошибка до добавления тикера
+        with self.symbols_lock:  # Тикеры меняем по одному потоку
+            self._add_symbol(symbol, datetime.now())  # Добавляем/изменяем тикер. Спецификация получена сейчас
+            if self.symbols_filename is not None and self.symbols_timer is None:  # Если спецификации сохраняются в файл, и сохранение еще не запланировано
+                self.symbols_timer = Timer(self.symbols_save_delay, self.save_symbols)  # то сохраняем их с задержкой. Поток не фоновый, поэтому при выходе из программы сохранение выполнится
+                self.symbols_timer.start()
+
+    def save_symbols(self) -> None:
+        """Сохранение несохраненных спецификаций тикеров в файл сейчас"""
+        with self.symbols_lock:  # Спецификации не меняются, пока сохраняем
+            if self.symbols_timer is None:  # Если несохраненных спецификаций нет
+                return  # то выходим, дальше не продолжаем
+            self.symbols_timer.cancel()  # Отменяем отложенное сохранение, если вызвали не из него
+            self.symbols_timer = None
+            self._save_symbols()  # Сохраняем спецификации
+
+    def get_empty_days(self, dataname: str, time_frame: str) -> set[date]:
+        """Торговые дни, за которые провайдер не вернул бар (праздники, дни без сделок). Повторно у провайдера не запрашиваются"""
+        with self.empty_days_lock:
+            return set(self.empty_days.get((dataname, time_frame), ()))
+
+    def add_empty_days(self, dataname: str, time_frame: str, days: list[date]) -> None:
+        """Сохранение торговых дней без бар. Вызывается только после успешного запроса этих дней у провайдера"""
+        with self.empty_days_lock:
+            stored = self.empty_days.setdefault((dataname, time_frame), set())  # Уже сохраненные дни
+            count = len(stored)
+            stored.update(days)
+            if len(stored) > count and self.empty_days_filename is not None:  # Если добавились новые дни, и дни сохраняются в файл
+                self._save_empty_days()  # то сохраняем их. Дни без бар появляются редко, поэтому сохраняем сразу
+
+    def is_symbol_fresh(self, dataname: str) -> bool:
+        """Есть ли неустаревшая спецификация тикера"""
+        updated = self.symbols_updated.get(dataname)  # Дата и время получения спецификации
+        return updated is not None and (self.symbols_ttl is None or datetime.now() - updated < self.symbols_ttl)
+
+    def add_symbol_index(self, name: str, key_func: Callable[[Symbol], Any]) -> None:
+        """Добавление индекса тикеров по ключу брокера. Индекс строится по уже известным тикерам и поддерживается при сохранении тикеров
+
+        :param str name: Название индекса
+        :param key_func: Функция, возвращающая ключ индекса по тикеру. Тикеры, для которых ключ не получен (KeyError, TypeError), в индекс не попадают
+        """
+        with self.symbols_lock:  # Тикеры меняем по одному потоку
+            index = {}  # Словарь тикеров по ключу
+            self.symbol_indexes[name] = (key_func, index)
+            for symbol in self.symbols.values():  # Пробегаемся по всем известным тикерам
+                self._index_symbol(key_func, index, symbol)  # Добавляем тикер в индекс
+
+    def get_symbol_by_index(self, name: str, key) -> Symbol | None:
+        """Получение тикера по ключу индекса. Если спецификация устарела, то тикера нет"""
+        symbol = self.symbol_indexes[name][1].get(key)  # Пробуем получить тикер по ключу из индекса
+        if symbol is None or not self.is_symbol_fresh(symbol.dataname):  # Если тикера нет, или его спецификация устарела
+            return None  # то выходим, дальше не продолжаем
+        return symbol
 
     @abstractmethod
-    def get_bars(self, symbol: Symbol, time_frame: str, dt_from: datetime = None, dt_to: datetime = None) -> list[Bar] | None:
+    def get_bars(self, symbol: Symbol, time_frame: str, dt_from: datetime = None, dt_to: datetime = None) -> BarSeries | None:
         """Получение бар"""
         raise NotImplementedError
 
     @abstractmethod
-    def set_bars(self, bars: list[Bar]) -> None:
-        """Сохранение бар"""
+    def set_bars(self, bars: BarSeries) -> None:
+        """Сохранение бар. Новые бары объединяются с уже сохраненными, дубликаты заменяются новыми барами"""
         raise NotImplementedError
 
+    # Внутренние функции
+
+    def _bars_symbol(self, bars: BarSeries) -> Symbol:
+        """Тикер бар для чтения из хранилища. Спецификация из словаря тикеров. Если ее нет, то тикер по кодам из бар"""
+        symbol = self.symbols.get(bars.dataname)  # Спецификация тикера
+        if symbol is None:  # Если спецификации нет
+            symbol = Symbol(bars.board, bars.symbol, bars.dataname, bars.dataname, 0, 0, 0)  # то для чтения бар достаточно кода режима торгов, тикера и названия тикера
+        return symbol
+
+    def _add_symbol(self, symbol: Symbol, updated: datetime) -> None:
+        """Добавление/изменение тикера в словаре и индексах. Вызывается под блокировкой"""
+        self.symbols[symbol.dataname] = symbol  # Добавляем/изменяем тикер в словаре
+        self.symbols_updated[symbol.dataname] = updated  # Дата и время получения спецификации
+        for key_func, index in self.symbol_indexes.values():  # Пробегаемся по всем индексам
+            self._index_symbol(key_func, index, symbol)  # Добавляем тикер в индекс
+
+    @staticmethod
+    def _index_symbol(key_func: Callable[[Symbol], Any], index: dict[Any, Symbol], symbol: Symbol) -> None:
+        """Добавление тикера в индекс"""
+        try:  # Пытаемся получить ключ индекса
+            index[key_func(symbol)] = symbol  # Добавляем тикер в индекс по ключу
+        except (KeyError, TypeError):  # Если в информации брокера нет ключа
+            pass  # то тикер в индекс не попадает
+
+    def _load_symbols(self, filename: str) -> None:
+        """Загрузка всех неустаревших спецификаций тикеров из файла. Дальше спецификации сохраняются в этот файл"""
+        self.symbols_filename = filename  # Запоминаем файл спецификаций тикеров
+        if not path.isfile(filename):  # Если файла спецификаций нет
+            return  # то выходим, дальше не продолжаем
+        try:  # Пытаемся прочитать файл
+            with open(filename, encoding='utf-8') as file:  # Открываем файл на чтение
+                items = json.load(file)  # Спецификации тикеров
+        except (ValueError, OSError):  # Если файл поврежден
+            return  # то спецификации получим от брокера
+        for item in items:  # Пробегаемся по всем спецификациям
+            updated = datetime.fromisoformat(item.pop('updated'))  # Дата и время получения спецификации
+            if self.symbols_ttl is not None and datetime.now() - updated >= self.symbols_ttl:  # Если спецификация устарела
+                continue  # то пропускаем ее
+            self._add_symbol(Symbol(**item), updated)  # Добавляем тикер в словарь
+
+    def _load_empty_days(self, filename: str) -> None:
+        """Загрузка дней без бар из файла. Дальше дни сохраняются в этот файл"""
+        self.empty_days_filename = filename  # Запоминаем файл дней без бар
+        if not path.isfile(filename):  # Если файла нет
+            return  # то выходим, дальше не продолжаем
+        try:  # Пытаемся прочитать файл
+            with open(filename, encoding='utf-8') as file:  # Открываем файл на чтение
+                items = json.load(file)  # Дни без бар по тикерам и временнЫм интервалам
+        except (ValueError, OSError):  # Если файл поврежден
+            return  # то дни запросим у провайдера еще раз
+        for key, days in items.items():  # Пробегаемся по всем тикерам и временнЫм интервалам
+            dataname, time_frame = key.rsplit('|', 1)  # Ключ - название тикера|временной интервал
+            self.empty_days[(dataname, time_frame)] = {date.fromisoformat(d) for d in days}
+
+    def _save_empty_days(self) -> None:
+        """Сохранение всех дней без бар в файл. Вызывается под блокировкой. Сначала пишем во временный файл, затем подменяем им файл дней"""
+        items = {f'{dataname}|{time_frame}': sorted(d.isoformat() for d in days) for (dataname, time_frame), days in self.empty_days.items()}  # Дни в ISO формате
+        with open(f'{self.empty_days_filename}.tmp', 'w', encoding='utf-8') as file:  # Открываем временный файл на запись
+            json.dump(items, file)  # Записываем дни
+        replace(f'{self.empty_days_filename}.tmp', self.empty_days_filename)  # Подменяем файл дней
+
+    def _save_symbols(self) -> None:
+        """Сохранение всех спецификаций тикеров в файл. Сначала пишем во временный файл, затем подменяем им файл спецификаций"""
+        items = [dict({slot: getattr(symbol, slot) for slot in Symbol.__slots__}, updated=self.symbols_updated[dataname].isoformat()) for dataname, symbol in self.symbols.items()]  # Спецификации тикеров с датой и временем получения
+        with open(f'{self.symbols_filename}.tmp', 'w', encoding='utf-8') as file:  # Открываем временный файл на запись
+            json.dump(items, file, ensure_ascii=False)  # Записываем спецификации
+        replace(f'{self.symbols_filename}.tmp', self.symbols_filename)  # Подменяем файл спецификаций
+
+
+class CachedBars:
+    """Бары тикера в кэше. Колонки с запасом, чтобы новые бары дописывались на место"""
+    __slots__ = ('board', 'symbol', 'dataname', 'time_frame', 'dt_from', 'columns', 'count', 'owned')  # Атрибуты бар в кэше
+
+    def __init__(self, bars: BarSeries, dt_from: datetime | None):
+        self.board = bars.board  # Код режима торгов
+        self.symbol = bars.symbol  # Тикер
+        self.dataname = bars.dataname  # Название тикера
+        self.time_frame = bars.time_frame  # Временной интервал
+        self.dt_from = dt_from  # Дата и время, с которых загружены все бары хранилища. None - с начала истории
+        self.columns = [bars.datetime, bars.open, bars.high, bars.low, bars.close, bars.volume]  # Колонки. Могут быть длиннее кол-ва бар
+        for column in self.columns:  # Колонки из хранилища отдаются вызвавшему без копирования
+            column.setflags(write=False)  # Запрещаем их менять, чтобы не испортить бары в кэше для всех остальных
+        self.count = len(bars)  # Кол-во бар
+        self.owned = False  # Колонки пришли из хранилища. Пока их не скопировали, менять их нельзя
+
+    @property
+    def bars(self) -> BarSeries:
+        """Бары без копирования колонок только для чтения"""
+        columns = [column[:self.count] for column in self.columns]  # Колонки без запаса
+        for column in columns:  # Колонки кэша отдаются без копирования
+            column.setflags(write=False)  # Менять их может только кэш
+        return BarSeries(self.board, self.symbol, self.dataname, self.time_frame, *columns)
+
+    @property
+    def nbytes(self) -> int:
+        """Размер колонок в байтах"""
+        return sum(column.nbytes for column in self.columns)
+
+    def covers(self, dt_from: datetime | None) -> bool:
+        """Есть ли в кэше все бары хранилища с даты/времени"""
+        return self.dt_from is None or dt_from is not None and dt_from >= self.dt_from
+
+    def append(self, bars: BarSeries) -> None:
+        """Добавление новых бар. Бары по возрастанию даты/времени, начиная с последнего бара, дописываются на место"""
+        if self.count > 0 and (bars.datetime[0] < self.columns[0][self.count - 1] or np.any(bars.datetime[1:] <= bars.datetime[:-1])):  # Если новые бары пересекаются с барами в кэше
+            merged = self.bars.append(bars)  # то объединяем бары в новых колонках
+            self.columns = [merged.datetime, merged.open, merged.high, merged.low, merged.close, merged.volume]
+            self.count = len(merged)
+            self.owned = True  # Колонки созданы объединением
+            return
+        start = self.count - 1 if self.count > 0 and bars.datetime[0] == self.columns[0][self.count - 1] else self.count  # Последний бар в кэше переписываем
+        count = start + len(bars)  # Кол-во бар после добавления
+        if not self.owned or count > len(self.columns[0]):  # Если колонки из хранилища, или в них нет места
+            capacity = max(count, 2 * len(self.columns[0]))  # то выделяем колонки с запасом
+            self.columns = [np.concatenate((column[:start], np.empty(capacity - start, dtype=column.dtype))) for column in self.columns]  # Копируем бары до переписываемого
+            self.owned = True
+        for column, new_column in zip(self.columns, (bars.datetime, bars.open, bars.high, bars.low, bars.close, bars.volume)):  # Пробегаемся по всем колонкам
+            column[start:count] = new_column  # Дописываем новые бары
+        self.count = count
+
+
+class BarCache:
+    """Кэш бар в памяти перед хранилищем. При превышении размера вытесняются давно не запрашиваемые бары"""
+    def __init__(self, max_bytes: int = 512 * 2 ** 20):
+        self.max_bytes = max_bytes  # Максимальный размер бар в кэше в байтах
+        self.entries: OrderedDict[tuple[str, str, str], CachedBars] = OrderedDict()  # Бары в кэше. Ключ - (источник хранилища, название тикера, временной интервал). В конце - последние запрошенные
+        self.nbytes = 0  # Размер бар в кэше в байтах
+        self.hits = 0  # Кол-во попаданий в кэш
+        self.misses = 0  # Кол-во промахов
+        self.lock = Lock()  # Блокировка. Бары запрашиваются из разных потоков
+
+    def get_bars(self, storage: Storage, symbol: Symbol, time_frame: str, dt_from: datetime = None, dt_to: datetime = None) -> BarSeries | None:
+        """Получение бар из кэша. При промахе бары с даты/времени начала до конца истории загружаются из хранилища"""
+        key = (storage.source, symbol.dataname, time_frame)  # Ключ бар
+        with self.lock:  # Кэш меняем по одному потоку
+            entry = self.entries.get(key)  # Бары в кэше
+            if entry is not None and entry.covers(dt_from):  # Если в кэше есть все запрошенные бары
+                self.hits += 1
+                self.entries.move_to_end(key)  # Бары запрошены последними
+                bars = entry.bars.between(dt_from, dt_to)  # Отбираем бары с ... по ... без копирования колонок
+                return bars if len(bars) > 0 else None
+            self.misses += 1
+        bars = storage.get_bars(symbol, time_frame, dt_from)  # Загружаем бары из хранилища без блокировки кэша
+        if bars is None:  # Если бары в хранилище не найдены
+            return None  # то выходим, дальше не продолжаем
+        with self.lock:  # Кэш меняем по одному потоку
+            entry = self.entries.get(key)  # Бары могли загрузить в другом потоке
+            if entry is None or not entry.covers(dt_from):  # Если загрузили больше бар, чем есть в кэше
+                self._put(key, CachedBars(bars, dt_from))  # то заменяем бары в кэше
+        bars = bars.between(None, dt_to)  # Отбираем бары по ...
+        return bars if len(bars) > 0 else None
+
+    def set_bars(self, storage: Storage, bars: BarSeries) -> None:
+        """Сохранение бар в хранилище и добавление их в кэш"""
+        if len(bars) == 0:  # Если бар нет
+            return  # то выходим, дальше не продолжаем
+        if not isinstance(bars, BarSeries):  # Если пришел список бар
+            bars = BarSeries.from_bars(bars)  # то переводим его в колонки
+        key = (storage.source, bars.dataname, bars.time_frame)  # Ключ бар
+        with self.lock:  # Кэш меняем по одному потоку
+            entry = self.entries.get(key)  # Бары в кэше
+            if entry is not None:  # Если бары есть в кэше
+                self.nbytes -= entry.nbytes
+                entry.append(bars)  # Добавляем новые бары до записи в хранилище. Колонки, отображенные на файлы хранилища, при этом копируются, и перезапись файлов их не изменит
+                self.nbytes += entry.nbytes
+                self._evict()  # Кэш мог вырасти
+        storage.set_bars(bars)  # Сохраняем бары в хранилище
+
+    def clear(self) -> None:
+        """Очистка кэша"""
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def __repr__(self):
+        requests = self.hits + self.misses  # Кол-во запросов
+        return f'Кэш бар: {len(self.entries)} шт., {self.nbytes / 2 ** 20:.1f} из {self.max_bytes / 2 ** 20:.0f} МБ, попаданий {self.hits}, промахов {self.misses}' + (f' ({self.hits / requests:.0%})' if requests else '')
+
+    # Внутренние функции
+
+    def _put(self, key: tuple[str, str, str], entry: CachedBars) -> None:
+        """Добавление/замена бар в кэше. Вызывается под блокировкой"""
+        old_entry = self.entries.pop(key, None)  # Удаляем старые бары
+        if old_entry is not None:  # Если старые бары были
+            self.nbytes -= old_entry.nbytes  # то освобождаем их место
+        self.entries[key] = entry  # Новые бары запрошены последними
+        self.nbytes += entry.nbytes
+        self._evict()
+
+    def _evict(self) -> None:
+        """Вытеснение давно не запрашиваемых бар при превышении размера. Последние запрошенные бары остаются всегда. Вызывается под блокировкой"""
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:  # Пока размер превышен
+            _, entry = self.entries.popitem(last=False)  # Вытесняем давно не запрашиваемые бары
+            self.nbytes -= entry.nbytes
+
+
+bar_cache = BarCache()  # Кэш бар процесса. Общий для всех брокеров
+
 
 class Event:
     """Событие с подпиской / отменой подписки"""
@@ -283,8 +1044,13 @@ class Event:
 
 # Функции конвертации
 
-def bars_to_df(bars: list[Bar]) -> pd.DataFrame:
-    """Перевод списка бар в pandas DataFrame с индексом по дате/времени бара"""
-    pd_bars = pd.DataFrame.from_records([bar.to_dict() for bar in bars], index='datetime')  # Переводим в pandas DataFrame
-    pd_bars['volume'] = pd_bars['volume'].astype(int)  # Объемы могут быть только целыми
-    return pd_bars
+def bars_to_df(bars: BarSeries | list[Bar]) -> pd.DataFrame:
+    """Перевод бар в pandas DataFrame с индексом по дате/времени бара. DataFrame можно менять, бары в кэше при этом не изменятся"""
+    if not isinstance(bars, BarSeries):  # Если пришел список бар
+        return BarSeries.from_bars(bars).to_df()  # то переводим его в колонки. Колонки новые, их не копируем
+    return bars.to_df(copy=True)  # Колонки бар могут быть в кэше. Копируем их
+
+
+def df_to_bars(pd_bars: pd.DataFrame, symbol: Symbol, time_frame: str) -> BarSeries:
+    """Перевод pandas DataFrame с индексом по дате/времени бара в бары тикера"""
+    return BarSeries.from_df(pd_bars, symbol.board, symbol.symbol, symbol.dataname, time_frame)
@@ -0,0 +1,136 @@
+import logging
+from datetime import datetime, timedelta, time
+
+import numpy as np
+import pandas as pd
+
+from FinLabPy.Core import Bar, BarSeries  # Бар, бары в колонках
+from FinLabPy.Schedule.MarketSchedule import Schedule  # Расписание торгов биржи
+
+
+class BarValidator:
+    """Проверка бар на соответствие условиям выборки. Новые бары проверяются по одному, история - вся сразу"""
+    logger = logging.getLogger('BarValidator')  # Будем вести лог
+    dt_format = '%d.%m.%Y %H:%M'  # Формат представления даты и времени в логе
+    session_end_max = time(23, 59, 59, 999990)  # Время окончания сессии, если оно не задано (как в BackTrader)
+
+    def __init__(self, schedule: Schedule, time_frame: str, dt_from: datetime = None, dt_to: datetime = None,
+                 session_start: time = time.min, session_end: time = session_end_max, four_price_doji: bool = False, delta: timedelta = timedelta(seconds=3)):
+        """
+        :param schedule: Расписание торгов биржи
+        :param time_frame: Временной интервал https://ru.wikipedia.org/wiki/Таймфрейм
+        :param dt_from: Дата и время открытия первого бара. None - без ограничения
+        :param dt_to: Дата и время открытия последнего бара. None - без ограничения
+        :param session_start: Время начала сессии. Бары, открытые раньше, пропускаются
+        :param session_end: Время окончания сессии. Бары, закрытые позже, пропускаются
+        :param four_price_doji: False - пропускать дожи 4-х цен ("пустые" бары), True - не пропускать
+        :param delta: Корректировка при проверке времени окончания бара
+        """
+        self.schedule = schedule  # Расписание торгов биржи
+        self.time_frame = time_frame  # Временной интервал
+        self.tf_timeframe, self.tf_compression, _ = schedule.parse_tf(time_frame)  # Разбираем временной интервал один раз
+        self.dt_from = dt_from  # Дата и время открытия первого бара
+        self.dt_to = dt_to  # Дата и время открытия последнего бара
+        self.session_start = session_start  # Время начала сессии
+        self.session_end = session_end  # Время окончания сессии
+        self.four_price_doji = four_price_doji  # Не пропускать дожи 4-х цен
+        self.delta = delta  # Корректировка при проверке времени окончания бара
+        self.dt_last_open = datetime.min  # Дата и время открытия последнего закрытого бара
+
+    def is_bar_valid(self, bar: Bar) -> bool:
+        """Проверка бара на соответствие условиям выборки"""
+        dt_open = bar.datetime  # Дата и время открытия бара МСК
+        if dt_open <= self.dt_last_open:  # Если пришел бар из прошлого (дата открытия меньше последней даты открытия)
+            self.logger.debug(f'Дата/время открытия бара {dt_open} <= последней даты/времени открытия {self.dt_last_open}')
+            return False  # то бар не соответствует условиям выборки
+        dt_market_now = self.schedule.market_datetime_now  # Текущая дата и время на бирже по часам локального компьютера
+        dt_market_now_corrected = dt_market_now + self.delta  # Текущая дата и время на бирже с корректировкой
+        dt_close = self.schedule.trade_bar_close_datetime(dt_open, self.time_frame)  # Дата и время закрытия бара
+        if dt_close > dt_market_now_corrected and dt_market_now_corrected.time() < self.session_end:  # Если время закрытия бара еще не наступило на бирже, и сессия еще не закончилась
+            self.logger.debug(f'Дата/время {dt_close:{self.dt_format}} закрытия бара на {dt_open:{self.dt_format}} еще не наступило. Текущее время {dt_market_now:%d.%m.%Y %H:%M:%S}')
+            return False  # то бар не соответствует условиям выборки
+        self.dt_last_open = dt_open  # Запоминаем дату/время открытия пришедшего бара для будущих сравнений
+        if self.dt_from and dt_open < self.dt_from or self.dt_to and dt_open > self.dt_to:  # Если задан диапазон, а бар за его границами
+            self.logger.debug(f'Дата/время открытия бара {dt_open} за границами диапазона {self.dt_from} - {self.dt_to}')
+            return False  # то бар не соответствует условиям выборки
+        if self.session_start != time.min and dt_open.time() < self.session_start:  # Если задано время начала сессии и открытие бара до этого времени
+            self.logger.debug(f'Дата/время открытия бара {dt_open} до начала торговой сессии {self.session_start}')
+            return False  # то бар не соответствует условиям выборки
+        if self.session_end != self.session_end_max and dt_close.time() > self.session_end:  # Если задано время окончания сессии и закрытие бара после этого времени
+            self.logger.debug(f'Дата/время открытия бара {dt_open} после окончания торговой сессии {self.session_end}')
+            return False  # то бар не соответствует условиям выборки
+        if not self.four_price_doji and bar.high == bar.low:  # Если не пропускаем дожи 4-х цен, но такой бар пришел
+            self.logger.debug(f'Бар {dt_open} - дожи 4-х цен')
+            return False  # то бар не соответствует условиям выборки
+        return True  # В остальных случаях бар соответствует условиям выборки
+
+    def mask(self, bars: BarSeries | pd.DataFrame) -> np.ndarray:
+        """Проверка всех бар сразу по тем же правилам, что и в is_bar_valid. Время закрытия бара считается от времени его открытия
+
+        :param bars: Бары в колонках или pandas DataFrame с индексом или колонкой datetime и колонками high, low
+        :return: Маска бар, соответствующих условиям выборки
+        """
+        dt_open, high, low = self._columns(bars)  # Даты и время открытия, максимальные и минимальные цены
+        mask = np.ones(len(dt_open), dtype=bool)  # Маска бар, соответствующих условиям выборки
+        if len(dt_open) == 0:  # Если бар нет
+            return mask  # то проверять нечего
+        mask[1:] = dt_open[1:] > np.maximum.accumulate(dt_open[:-1])  # Убираем бары из прошлого (дата открытия не больше последней даты открытия)
+        if self.dt_last_open != datetime.min:  # Если бары уже приходили
+            mask &= dt_open > np.datetime64(self.dt_last_open, 'ns')  # то убираем бары не позже последнего из них
+        dt_close = self.close_datetimes(dt_open)  # Даты и время закрытия бар
+        dt_market_now_corrected = self.schedule.market_datetime_now + self.delta  # Текущая дата и время на бирже с корректировкой
+        if dt_market_now_corrected.time() < self.session_end:  # Если сессия еще не закончилась
+            mask &= dt_close <= np.datetime64(dt_market_now_corrected, 'ns')  # то убираем бары, время закрытия которых еще не наступило
+        if mask.any():  # Если есть закрытые бары
+            self.dt_last_open = dt_open[mask][-1].astype('datetime64[us]').item()  # то запоминаем дату/время открытия последнего из них для будущих сравнений
+        if self.dt_from:  # Если задана дата/время начала диапазона
+            mask &= dt_open >= np.datetime64(self.dt_from, 'ns')  # то убираем бары до него
+        if self.dt_to:  # Если задана дата/время окончания диапазона
+            mask &= dt_open <= np.datetime64(self.dt_to, 'ns')  # то убираем бары после него
+        if self.session_start != time.min:  # Если задано время начала сессии
+            mask &= dt_open - dt_open.astype('datetime64[D]') >= self._time_to_timedelta64(self.session_start)  # то убираем бары, открытые до этого времени
+        if self.session_end != self.session_end_max:  # Если задано время окончания сессии
+            mask &= dt_close - dt_close.astype('datetime64[D]') <= self._time_to_timedelta64(self.session_end)  # то убираем бары, закрытые после этого времени
+        if not self.four_price_doji:  # Если не пропускаем дожи 4-х цен
+            mask &= high != low  # то убираем их
+        self.logger.debug(f'Бары, соответствующие условиям выборки: {int(mask.sum())} из {len(mask)}')
+        return mask
+
+    def validate(self, bars: BarSeries | pd.DataFrame) -> BarSeries | pd.DataFrame:
+        """Бары, соответствующие условиям выборки. Тип бар сохраняется"""
+        mask = self.mask(bars)  # Маска бар, соответствующих условиям выборки
+        return bars[mask] if isinstance(bars, BarSeries) else bars.loc[mask]
+
+    def close_datetimes(self, dt_open: np.ndarray) -> np.ndarray:
+        """Даты и время закрытия бар по датам и времени открытия
+
+        :param dt_open: Даты и время открытия бар datetime64[ns]
+        :return: Даты и время закрытия бар datetime64[ns]
+        """
+        if self.tf_timeframe == 'M':  # Минутный временной интервал
+            return dt_open + np.timedelta64(self.tf_compression, 'm')  # Через минуты интервала
+        if self.tf_timeframe == 'D':  # Дневной временной интервал
+            return (dt_open.astype('datetime64[D]') + np.timedelta64(1, 'D')).astype('datetime64[ns]')  # Завтрашняя дата
+        if self.tf_timeframe == 'W':  # Недельный временной интервал
+            days = dt_open.astype('datetime64[D]')  # Даты без времени
+            return (days - (days.view(np.int64) + 3) % 7 + np.timedelta64(7, 'D')).astype('datetime64[ns]')  # 01.01.1970 - четверг. Вычитаем кол-во дней, прошедших с пн. Следующий понедельник
+        if self.tf_timeframe == 'MN':  # Месячный временной интервал
+            return (dt_open.astype('datetime64[M]') + np.timedelta64(1, 'M')).astype('datetime64[ns]')  # 1 число следующего месяца
+        if self.tf_timeframe == 'Y':  # Годовой временной интервал
+            return (dt_open.astype('datetime64[Y]') + np.timedelta64(1, 'Y')).astype('datetime64[ns]')  # 1 января следующего года
+        raise NotImplementedError  # С часовым графиком H не работаем. Заменяем минутным. Пример: H1 = M60
+
+    # Внутренние функции
+
+    @staticmethod
+    def _columns(bars: BarSeries | pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Даты и время открытия, максимальные и минимальные цены бар без копирования"""
+        if isinstance(bars, BarSeries):  # Если бары в колонках
+            return bars.datetime, bars.high, bars.low
+        date_time = bars.index if isinstance(bars.index, pd.DatetimeIndex) else bars['datetime']  # Дата и время в индексе или в колонке
+        return date_time.to_numpy(dtype='datetime64[ns]'), bars['high'].to_numpy(), bars['low'].to_numpy()
+
+    @staticmethod
+    def _time_to_timedelta64(t: time) -> np.timedelta64:
+        """Время дня как смещение от начала суток"""
+        return np.timedelta64(((t.hour * 60 + t.minute) * 60 + t.second) * 1_000_000 + t.microsecond, 'us')
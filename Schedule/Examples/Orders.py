@@ -1,11 +1,11 @@
 from datetime import datetime, timedelta  # Работа с датой и временем
 
 from FinLabPy.Config import brokers, default_broker  # Все брокеры и брокер по умолчанию
-from FinLabPy.Core import Bar, Order
+from FinLabPy.Core import BarSeries, Order
 from FinLabPy.Schedule.MOEX import Stocks  # Расписание торгов акций
 
 
-def exec_order(bars: list[Bar], order: Order, market_dt: datetime) -> None:
+def exec_order(bars: BarSeries, order: Order, market_dt: datetime) -> None:
     print(f'{order} - {market_dt}')
     if schedule.trade_session(market_dt) is None:  # Если биржа не работает
         print('Биржа не работает')
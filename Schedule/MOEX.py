@@ -1,15 +1,20 @@
-from datetime import time
+from datetime import date, time
 
 from FinLabPy.Schedule.MarketSchedule import Schedule, Session
 
 
 class Stocks(Schedule):
     """Расписание торгов Московской Биржи: Фондовый рынок - Акции https://www.moex.com/s1167"""
-    def __init__(self):
+    def __init__(self, weekend=False):
+        """
+        :param bool weekend: Учитывать дополнительные сессии выходного дня (с 01.03.2025, не по всем акциям). По умолчанию в субботу и воскресенье торгов нет
+        """
         super(Stocks, self).__init__([
             Session(time(7, 0, 0), time(9, 49, 59)),  # Утренняя сессия
             Session(time(9, 50, 0), time(18, 39, 59)),  # Основная сессия
-            Session(time(19, 5, 0), time(23, 49, 59))])  # Вечерняя сессия
+            Session(time(19, 5, 0), time(23, 49, 59))],  # Вечерняя сессия
+            weekend_sessions=[Session(time(10, 0, 0), time(18, 59, 59))] if weekend else (),  # Дополнительная сессия выходного дня
+            weekend_from=date(2025, 3, 1))  # Сессии выходного дня проводятся с 01.03.2025
 
 
 class Bonds(Schedule):
@@ -29,3 +34,19 @@ class Futures(Schedule):
             Session(time(10, 0, 0), time(13, 59, 59)),  # Основная торговая сессия (Дневной расчетный период)
             Session(time(14, 5, 0), time(18, 49, 59)),  # Основная торговая сессия (Вечерний расчетный период)
             Session(time(19, 5, 0), time(23, 49, 59))])  # Вечерняя дополнительная торговая сессия
+
+
+stocks, bonds, futures = Stocks(), Bonds(), Futures()  # Расписания рынков Московской Биржи. Общие для всех брокеров
+bonds_boards = ('TQCB', 'TQOB', 'TQIR', 'TQOD', 'TQOE', 'TQRD', 'TQUD', 'EQOB')  # Режимы торгов облигациями
+futures_boards = ('SPBFUT', 'SPBOPT')  # Режимы торгов срочного рынка
+
+
+def board_schedule(board: str) -> Schedule | None:
+    """Расписание торгов по коду режима торгов. None, если расписание режима торгов неизвестно"""
+    if board in futures_boards:  # Фьючерсы и опционы
+        return futures
+    if board in bonds_boards:  # Облигации
+        return bonds
+    if board.startswith('TQ') or board in ('SMAL', 'SPEQ'):  # Акции и фонды
+        return stocks
+    return None  # Для валютного рынка и других бирж расписание неизвестно
@@ -1,5 +1,5 @@
-from typing import Tuple, Union  # Кортеж, объединение типов
-from datetime import datetime, timedelta, timezone, time
+from typing import Tuple, Union, Iterable  # Кортеж, объединение типов, перечисление
+from datetime import datetime, date, timedelta, timezone, time
 from zoneinfo import ZoneInfo  # ВременнАя зона
 
 
@@ -19,15 +19,70 @@ class Schedule:
     market_timezone = ZoneInfo('Europe/Moscow')  # ВременнАя зона работы биржи
     dt_format = '%d.%m.%Y %H:%M:%S'  # Российский формат отображения даты и времени
 
-    def __init__(self, trade_sessions, delta=timedelta(seconds=3)):
+    def __init__(self, trade_sessions, delta=timedelta(seconds=3), weekend_days=(5, 6), holidays=(), weekend_sessions=(), weekend_from=None):
         """
         :param list[Session] trade_sessions: Список торговых сессий
         :param timedelta delta: Допустимая разница рассинхронизации локальных и брокерских/биржевых часов в секундах
+        :param tuple[int] weekend_days: Дни недели без торгов (0 - понедельник, 6 - воскресенье). По умолчанию суббота и воскресенье
+        :param Iterable[date] holidays: Даты без торгов (праздники). Торговый календарь можно дополнять через add_holidays
+        :param list[Session] weekend_sessions: Торговые сессии выходного дня. По умолчанию в выходные дни торгов нет
+        :param date weekend_from: Дата начала торгов в выходные дни. None - с начала истории
         """
         self.trade_sessions = sorted(trade_sessions, key=lambda session: session.time_begin)  # Список торговых сессий сортируем по возрастанию времени начала сессии
         self.market_time_begin = self.trade_sessions[0].time_begin  # Время открытия биржи = время начала первой торговой сессии
         self.market_time_end = self.trade_sessions[-1].time_end  # Время закрытия биржи = время окончания последней торговой сессии
         self.delta = delta  # Допустимая разница рассинхронизации локальных и брокерских/биржевых часов в секундах
+        self.weekend_days = tuple(weekend_days)  # Дни недели без торгов
+        self.holidays: set[date] = set(holidays)  # Даты без торгов
+        self.weekend_sessions = sorted(weekend_sessions, key=lambda session: session.time_begin)  # Список торговых сессий выходного дня
+        self.weekend_from = weekend_from  # Дата начала торгов в выходные дни
+
+    def add_holidays(self, holidays: Iterable[date]) -> None:
+        """Добавление дат без торгов в торговый календарь
+
+        :param holidays: Даты без торгов
+        """
+        self.holidays.update(holidays)
+
+    def is_trade_date(self, d_market) -> bool:
+        """Идут ли торги в дату на бирже по торговому календарю
+
+        :param date d_market: Дата на бирже
+        """
+        return len(self.day_sessions(d_market)) > 0
+
+    def day_sessions(self, d_market) -> list[Session]:
+        """Торговые сессии в дату на бирже по торговому календарю. Пустой список, если торгов нет
+
+        :param date d_market: Дата на бирже
+        """
+        if d_market in self.holidays:  # Если праздник
+            return []  # то торгов нет
+        if d_market.weekday() not in self.weekend_days:  # Если будний день
+            return self.trade_sessions  # то торги по расписанию
+        if self.weekend_from is not None and d_market < self.weekend_from:  # Если выходной день до начала торгов в выходные дни
+            return []  # то торгов нет
+        return self.weekend_sessions  # Сессии выходного дня, если есть
+
+    def prev_trade_date(self, d_market) -> date:
+        """Предыдущий торговый день до даты на бирже
+
+        :param date d_market: Дата на бирже
+        """
+        d_market -= timedelta(days=1)
+        while not self.is_trade_date(d_market):  # Пока торгов нет
+            d_market -= timedelta(days=1)  # смещаемся на день назад
+        return d_market
+
+    def next_trade_date(self, d_market) -> date:
+        """Следующий торговый день после даты на бирже
+
+        :param date d_market: Дата на бирже
+        """
+        d_market += timedelta(days=1)
+        while not self.is_trade_date(d_market):  # Пока торгов нет
+            d_market += timedelta(days=1)  # смещаемся на день вперед
+        return d_market
 
     def trade_session(self, dt_market) -> Union[Session, None]:
         """Торговая сессия по дате и времени на бирже. None, если торги не идут
@@ -35,9 +90,7 @@ class Schedule:
         :param datetime dt_market: Дата и время на бирже
         :return: Торговая сессия на бирже. None, если торги не идут
         """
-        if dt_market.weekday() in (5, 6):  # Если выходной день (суббота или воскресенье)
-            return None  # То торги не идут, торговой сессии нет
-        return next((session for session in self.trade_sessions if session.time_begin <= dt_market.time() <= session.time_end), None)  # Возвращаем торговую сессию, если время внутри сессии
+        return next((session for session in self.day_sessions(dt_market.date()) if session.time_begin <= dt_market.time() <= session.time_end), None)  # Возвращаем торговую сессию, если по торговому календарю торги идут и время внутри сессии
 
     def last_session_time_end(self, dt_market) -> datetime:
         """Дата и время окончания текущей/предыдущей торговой сессии по дате и времени на бирже
@@ -45,19 +98,17 @@ class Schedule:
         :param datetime dt_market: Дата и время на бирже
         :return: Дата и время окончания текущей/предыдущей торговой сессии
         """
-        if dt_market.weekday() in (5, 6):  # Если выходной день (суббота или воскресенье)
-            return datetime.combine((dt_market - timedelta(days=dt_market.weekday()-4)).date(), self.market_time_end)  # то окончание последней сессии пятницы
+        sessions = self.day_sessions(dt_market.date())  # Торговые сессии сегодня. Пустой список, если по торговому календарю торгов нет (выходной или праздник)
         t_market = dt_market.time()  # Время на бирже
-        if dt_market.weekday() == 0 and t_market < self.market_time_begin:  # Если утро понедельника до начала торгов
-            return datetime.combine((dt_market - timedelta(days=3)).date(), self.market_time_end)  # то окончание последней сессии пятницы
         i = -1  # Номер сессии, до которой не дошло время на бирже
-        for session in self.trade_sessions:  # Пробегаемся по всем торговым сессиям
+        for session in sessions:  # Пробегаемся по всем торговым сессиям
             if t_market < session.time_end:  # Если время на бирже не дошло до времени окончания сессии
                 break  # то сессия найдена, выходим, больше не ищем
             i += 1  # До этой сессии время на бирже дошло, переходим к следующей сессии
-        if i == -1:  # Если последняя торговая сессия была вчера
-            return datetime.combine((dt_market - timedelta(days=1)).date(), self.market_time_end)  # то окончание последней сессии вчера
-        return datetime.combine(dt_market.date(), self.trade_sessions[i].time_end)  # Окончание текущей/предыдущей сессии сегодня
+        if i == -1:  # Если последняя торговая сессия была в предыдущий торговый день (в т.ч. утро после выходных или сегодня торгов нет)
+            d_prev = self.prev_trade_date(dt_market.date())  # Предыдущий торговый день
+            return datetime.combine(d_prev, self.day_sessions(d_prev)[-1].time_end)  # Окончание его последней сессии
+        return datetime.combine(dt_market.date(), sessions[i].time_end)  # Окончание текущей/предыдущей сессии сегодня
 
     def time_until_trade(self, dt_market) -> timedelta:
         """Время, через которое можно будет торговать
@@ -68,13 +119,10 @@ class Schedule:
         if self.trade_session(dt_market):  # Если сейчас идет торговая сессия
             return timedelta()  # то ждать не нужно, торговать можно прямо сейчас
         d_market = dt_market.date()  # Дата на бирже
-        next_session = next((session for session in self.trade_sessions if session.time_begin > dt_market.time()), None)  # Следующая сессия
-        if not next_session:  # Сессия не найдена, если время на бирже позже окончания последней сессии
-            next_session = self.trade_sessions[0]  # Будет первая торговая сессия
-            d_market += timedelta(1)  # Следующего дня
-        w_market = d_market.weekday()  # День недели
-        if w_market in (5, 6):  # Если выходной день (суббота или воскресенье)
-            d_market += timedelta(7 - w_market)  # то будем ждать первой торговой сессии понедельника
+        next_session = next((session for session in self.day_sessions(d_market) if session.time_begin > dt_market.time()), None)  # Следующая сессия сегодня, если сегодня торги идут
+        if not next_session:  # Сессия не найдена, если время на бирже позже окончания последней сессии или сегодня торгов нет
+            d_market = self.next_trade_date(d_market)  # Следующий торговый день
+            next_session = self.day_sessions(d_market)[0]  # Его первая торговая сессия
         dt_begin_next_session = datetime(d_market.year, d_market.month, d_market.day, next_session.time_begin.hour, next_session.time_begin.minute, next_session.time_begin.second)  # Дата и время начала следующей сессии
         return dt_begin_next_session - dt_market  # Время от текущего до начала следующей сессии
 
@@ -110,9 +158,8 @@ class Schedule:
                 market_date = market_date.replace(minute=0)  # То считаем его с начала часа
         else:  # С часовым графиком H не работаем. Заменяем минутным. Пример: H1 = M60
             raise NotImplementedError
-        w_market = market_date.weekday()  # День недели даты на бирже
-        if w_market in (5, 6):  # Если задан выходной день
-            market_date += timedelta(w_market - 4)  # то смещаемся на предыдущую пятницу
+        if not self.is_trade_date(market_date.date()):  # Если по торговому календарю торгов нет
+            market_date = datetime.combine(self.prev_trade_date(market_date.date()), market_date.time())  # то смещаемся на предыдущий торговый день
         return market_date
 
     def trade_bar_close_datetime(self, dt_market, tf) -> datetime:
@@ -149,6 +196,54 @@ class Schedule:
         dt_close = self.trade_bar_close_datetime(dt_market, tf)  # Получаем дату и время закрытия бара на бирже
         return dt_close + timedelta(seconds=self.time_until_trade(dt_close).total_seconds()) + self.delta  # Если дата и время закрытия попадает в перерыв, то добавляем время до начала следующей сессии. Добавляем задержку
 
+    def trade_dates(self, d_from, d_to) -> list[date]:
+        """Торговые дни по торговому календарю с даты по дату включительно
+
+        :param date d_from: Дата начала
+        :param date d_to: Дата окончания
+        :return: Торговые дни по возрастанию
+        """
+        days = (d_to - d_from).days + 1  # Кол-во дней
+        return [d for d in (d_from + timedelta(days=i) for i in range(max(days, 0))) if self.is_trade_date(d)]
+
+    def trade_windows(self, dt_from, dt_to, tf, max_period, max_bars=None) -> list[Tuple[datetime, datetime]]:
+        """Окна запросов внутридневной истории по торговым дням. Дни без торгов по торговому календарю и ночи между торговыми днями пропускаются
+
+        :param datetime dt_from: Дата и время на бирже начала истории
+        :param datetime dt_to: Дата и время на бирже окончания истории
+        :param str tf: Внутридневной временной интервал https://ru.wikipedia.org/wiki/Таймфрейм
+        :param timedelta max_period: Максимальный период одного запроса к провайдеру
+        :param int max_bars: Максимальное кол-во бар в ответе провайдера. None, если не ограничено
+        :return: Окна (дата и время начала, дата и время окончания) на бирже по возрастанию
+        """
+        _, tf_compression, _ = self.parse_tf(tf)  # Размер внутридневного интервала в минутах
+        bar_period = timedelta(minutes=tf_compression)  # Длительность бара
+        max_piece = max_period if max_bars is None else min(max_period, bar_period * max_bars)  # Максимальный кусок торгового дня в одном окне
+        windows = []  # Окна запросов
+        window_begin = window_end = None  # Начало и окончание текущего окна
+        window_bars = 0  # Ожидаемое кол-во бар в текущем окне
+        day = dt_from.date()  # Дата первого торгового дня
+        while day <= dt_to.date():  # Пробегаемся по всем дням истории
+            sessions = self.day_sessions(day)  # Торговые сессии дня
+            if sessions:  # Если по торговому календарю торги идут
+                begin = max(datetime.combine(day, sessions[0].time_begin), dt_from)  # Начало торгов в этот день
+                end = min(datetime.combine(day, sessions[-1].time_end), dt_to)  # Окончание торгов в этот день
+                while begin <= end:  # Торговый день, который не помещается в окно целиком, разбиваем на куски
+                    piece_end = min(end, begin + max_piece - timedelta(seconds=1))  # Окончание куска торгового дня
+                    bars = (piece_end - begin) // bar_period + 1  # Ожидаемое кол-во бар в куске с запасом. Перерывы между сессиями не вычитаем
+                    if window_begin is not None and (piece_end - window_begin > max_period or max_bars is not None and window_bars + bars > max_bars):  # Если кусок не помещается в текущее окно
+                        windows.append((window_begin, window_end))  # то закрываем окно
+                        window_begin = None
+                    if window_begin is None:  # Если окно не начато
+                        window_begin, window_bars = begin, 0  # то начинаем его с куска торгового дня
+                    window_end = piece_end  # Окно заканчивается куском торгового дня
+                    window_bars += bars
+                    begin = piece_end + timedelta(seconds=1)  # Следующий кусок торгового дня
+            day += timedelta(days=1)  # Следующий день
+        if window_begin is not None:  # Если последнее окно не закрыто
+            windows.append((window_begin, window_end))  # то закрываем его
+        return windows
+
     @staticmethod
     def parse_tf(tf) -> Tuple[str, int, bool]:
         """Разбор временнОго интервала на период, размер, является ли внутридневным интервалом
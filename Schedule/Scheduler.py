@@ -0,0 +1,153 @@
+import logging
+from datetime import datetime
+from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from collections import defaultdict
+import heapq
+
+from FinLabPy.Core import Broker, Symbol, Bar  # Брокер, тикер, бар
+from FinLabPy.Schedule.MarketSchedule import Schedule  # Расписание торгов биржи
+
+
+class BarsRequest:
+    """Запрос нового бара по расписанию. Один на брокера, тикер и временной интервал, сколько бы подписчиков его ни ждали"""
+    __slots__ = ('broker', 'symbol', 'time_frame', 'schedule', 'callbacks', 'dt_request', 'dt_open')
+
+    def __init__(self, broker: Broker, symbol: Symbol, time_frame: str, schedule: Schedule):
+        self.broker = broker  # Брокер
+        self.symbol = symbol  # Тикер
+        self.time_frame = time_frame  # Временной интервал
+        self.schedule = schedule  # Расписание торгов
+        self.callbacks: dict[int, callable] = {}  # Подписчики на новый бар. Ключ - номер подписки
+        self.dt_request: datetime | None = None  # Дата и время запроса бара на бирже
+        self.dt_open: datetime | None = None  # Дата и время открытия запрашиваемого бара
+
+
+class BarsScheduler:
+    """Запросы новых бар по расписанию для всех подписок. Один поток ждет ближайший запрос в куче. Запросы, наступившие одновременно, выполняются пулом потоков"""
+    logger = logging.getLogger('BarsScheduler')  # Будем вести лог
+
+    def __init__(self, max_workers: int = 8):
+        """
+        :param max_workers: Максимальное кол-во одновременных запросов истории
+        """
+        self.max_workers = max_workers  # Максимальное кол-во одновременных запросов истории
+        self.requests: dict[tuple[str, str, str], BarsRequest] = {}  # Запросы. Ключ - (код брокера, название тикера, временной интервал)
+        self.subscriptions: dict[int, tuple[str, str, str]] = {}  # Ключи запросов по номеру подписки
+        self.heap: list[tuple[datetime, int, tuple[str, str, str]]] = []  # Куча (дата и время запроса, порядковый номер, ключ запроса)
+        self.condition = Condition()  # Условие изменения кучи. Будит поток расписания
+        self.ids = count(1)  # Номера подписок и записей в куче
+        self.thread: Thread | None = None  # Поток расписания. Запускается при первой подписке
+        self.executor: ThreadPoolExecutor | None = None  # Пул потоков для запросов истории
+
+    def subscribe(self, broker: Broker, symbol: Symbol, time_frame: str, schedule: Schedule, callback) -> int:
+        """Подписка на новые бары по расписанию
+
+        :param broker: Брокер
+        :param symbol: Тикер
+        :param time_frame: Временной интервал https://ru.wikipedia.org/wiki/Таймфрейм
+        :param schedule: Расписание торгов
+        :param callback: Функция, получающая новый бар
+        :return: Номер подписки для отмены
+        """
+        key = (broker.code, symbol.dataname, time_frame)  # Ключ запроса
+        subscription_id = next(self.ids)  # Номер подписки
+        with self.condition:
+            request = self.requests.get(key)  # Запрос по брокеру, тикеру и временному интервалу
+            if request is None:  # Если такой запрос еще не выполняется
+                request = self.requests[key] = BarsRequest(broker, symbol, time_frame, schedule)  # то создаем его
+                self._push(key, request)  # Ставим запрос в расписание
+            request.callbacks[subscription_id] = callback  # Добавляем подписчика. Новый бар будет получен одним запросом для всех подписчиков
+            self.subscriptions[subscription_id] = key
+            if self.thread is None:  # Если поток расписания еще не запущен
+                self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='BarsScheduler')  # Пул потоков для запросов истории
+                self.thread = Thread(target=self._schedule_thread, name='BarsScheduler', daemon=True)  # Поток расписания
+                self.thread.start()
+            self.condition.notify()  # Новый запрос может быть раньше всех остальных
+        self.logger.debug(f'Подписка {subscription_id} на новые бары {symbol.dataname} {time_frame} по расписанию')
+        return subscription_id
+
+    def unsubscribe(self, subscription_id: int) -> None:
+        """Отмена подписки на новые бары по расписанию"""
+        with self.condition:
+            key = self.subscriptions.pop(subscription_id, None)  # Ключ запроса подписки
+            if key is None:  # Если подписки нет
+                return  # то выходим, дальше не продолжаем
+            request = self.requests[key]
+            del request.callbacks[subscription_id]  # Удаляем подписчика
+            if len(request.callbacks) == 0:  # Если подписчиков у запроса не осталось
+                del self.requests[key]  # то удаляем запрос. Его запись в куче будет пропущена
+        self.logger.debug(f'Отмена подписки {subscription_id} на новые бары {key[1]} {key[2]} по расписанию')
+
+    def close(self) -> None:
+        """Отмена всех подписок и остановка потока расписания"""
+        with self.condition:
+            self.requests.clear()
+            self.subscriptions.clear()
+            self.heap.clear()
+            thread, self.thread = self.thread, None
+            executor, self.executor = self.executor, None
+            self.condition.notify()  # Будим поток расписания для выхода
+        if thread is not None:  # Если поток расписания был запущен
+            thread.join()  # то ждем его окончания
+            executor.shutdown(wait=True)  # и окончания запросов истории
+
+    # Внутренние функции
+
+    def _push(self, key: tuple[str, str, str], request: BarsRequest) -> None:
+        """Постановка запроса в кучу на ближайшую дату и время запроса бара"""
+        dt_market_now = request.schedule.market_datetime_now  # Текущая дата и время на бирже
+        request.dt_open = request.schedule.trade_bar_open_datetime(dt_market_now, request.time_frame)  # Дата и время открытия бара, который будем получать
+        request.dt_request = request.schedule.trade_bar_request_datetime(dt_market_now, request.time_frame)  # Дата и время запроса бара
+        heapq.heappush(self.heap, (request.dt_request, next(self.ids), key))
+
+    def _schedule_thread(self) -> None:
+        """Поток расписания. Ждет ближайший запрос, забирает все наступившие запросы и раздает их пулу потоков"""
+        thread, executor = self.thread, self.executor  # Поток расписания, для которого работаем, и его пул потоков
+        while True:
+            with self.condition:
+                while True:  # Ждем, пока не наступит время ближайшего запроса
+                    if self.thread is not thread:  # Если расписание остановлено
+                        return  # то выходим из потока, дальше не продолжаем
+                    if len(self.heap) == 0:  # Если запросов нет
+                        self.condition.wait()  # то ждем подписки
+                        continue
+                    dt_request, _, key = self.heap[0]  # Ближайший запрос
+                    request = self.requests.get(key)  # Запрос может быть отменен
+                    if request is None or request.dt_request != dt_request:  # Если запрос отменен или перенесен
+                        heapq.heappop(self.heap)  # то удаляем его запись из кучи
+                        continue
+                    wait_seconds = (dt_request - request.schedule.market_datetime_now).total_seconds()  # Кол-во секунд до запроса
+                    if wait_seconds <= 0:  # Если время запроса наступило
+                        break  # то выполняем запросы
+                    self.condition.wait(wait_seconds)  # Ждем времени запроса или изменения подписок
+                due = defaultdict(list)  # Наступившие запросы по брокерам
+                while len(self.heap) > 0 and self.heap[0][0] <= dt_request:  # Пробегаемся по всем запросам на эту дату и время
+                    dt, _, key = heapq.heappop(self.heap)
+                    request = self.requests.get(key)
+                    if request is None or request.dt_request != dt:  # Если запрос отменен или перенесен
+                        continue  # то пропускаем его
+                    due[request.broker.code].append((request, request.dt_open))  # Бар запрашиваем на дату и время открытия, рассчитанную при постановке в расписание
+                    self._push(key, request)  # Сразу ставим запрос на следующий бар
+            for code, requests in due.items():  # Пробегаемся по всем брокерам с наступившими запросами
+                self.logger.debug(f'Запросы новых бар у брокера {code}: {len(requests)}')
+                for request, dt_open in requests:  # Запросы брокеру выполняем одновременно в пределах пула потоков
+                    executor.submit(self._request_bar, request, dt_open)
+
+    def _request_bar(self, request: BarsRequest, dt_open: datetime) -> None:
+        """Запрос нового бара и передача его всем подписчикам"""
+        try:
+            bars = request.broker.get_history(request.symbol, request.time_frame, dt_open)  # Получаем бар на дату и время открытия
+        except Exception as ex:  # Ошибку одного запроса не передаем в пул потоков, иначе она потеряется
+            self.logger.error(f'Ошибка запроса бара {request.symbol.dataname} {request.time_frame} на {dt_open}: {ex}')
+            return
+        if bars is None or len(bars) == 0:  # Если бар не получен
+            self.logger.warning(f'Бар {request.symbol.dataname} {request.time_frame} по расписанию на {dt_open} не получен')
+            return
+        bar: Bar = bars[0]  # Первый (завершенный) бар
+        for callback in list(request.callbacks.values()):  # Пробегаемся по всем подписчикам. Подписки могут меняться во время рассылки
+            callback(bar)  # Отправляем им новый бар
+
+
+bars_scheduler = BarsScheduler()  # Запросы новых бар по расписанию процесса. Общие для всех брокеров
@@ -0,0 +1,139 @@
+import logging
+from os import path, makedirs, listdir, remove, replace
+
+import numpy as np
+
+from FinLabPy.Core import Storage, BarSeries  # Хранилище, бары в колонках
+
+
+class BinaryStorage(Storage):
+    """Хранилище в двоичных файлах. Каждая колонка бар хранится в отдельном файле и читается через numpy.memmap без копирования.
+    Записанные бары в отображенных на память файлах не переписываются, новые бары только дописываются в конец файлов.
+    Объединенные бары и обновленный последний бар пишутся в файлы нового поколения, на которое затем переключается хранилище"""
+    logger = logging.getLogger('BinaryStorage')  # Будем вести лог
+    columns = {'datetime': 'datetime64[ns]', 'open': np.float64, 'high': np.float64, 'low': np.float64, 'close': np.float64, 'volume': np.int64}  # Колонки и их типы. Все значения по 8 байт
+
+    def __init__(self, source):
+        super().__init__(source)
+        self.datapath = path.join(path.dirname(path.realpath(__file__)), '..', '..', 'Data', source, 'Binary', '')  # Путь сохранения файлов
+        if not path.exists(self.datapath):  # Если папки для сохранения файлов не существует
+            makedirs(self.datapath)  # то создаем ее
+        self._load_symbols(path.join(self.datapath, '..', 'symbols.json'))  # Загружаем неустаревшие спецификации тикеров. Файл общий с файловым хранилищем
+        self._load_empty_days(path.join(self.datapath, '..', 'empty_days.json'))  # Загружаем дни без бар у провайдера. Файл общий с файловым хранилищем
+
+    def get_bars(self, symbol, time_frame, dt_from=None, dt_to=None):
+        bars_path = self._bars_path(symbol.dataname, time_frame)  # Папка с колонками бар
+        for _ in range(2):  # Поколение файлов могут сменить и удалить, пока мы их открываем. Тогда пробуем еще раз с новым поколением
+            generation = self._generation(bars_path)  # Поколение файлов колонок
+            count = self._count(bars_path, generation)  # Кол-во бар
+            if count == 0:  # Если бар нет
+                self.logger.warning(f'Бары {symbol.dataname} ({time_frame}) не найдены')
+                return None  # то выходим, дальше не продолжаем
+            try:  # Пытаемся отобразить колонки на память
+                columns = [np.memmap(self._column_filename(bars_path, name, generation), dtype=dtype, mode='r', shape=(count,)) for name, dtype in self.columns.items()]  # Отображаем колонки на память без чтения файлов
+                break
+            except FileNotFoundError:  # Если файлы поколения уже удалены
+                continue  # то берем новое поколение
+        else:  # Если поколение сменилось оба раза
+            return None  # то бар не получили
+        bars = BarSeries(symbol.board, symbol.symbol, symbol.dataname, time_frame, *columns).between(dt_from, dt_to)  # Отбираем бары с ... по ... без копирования колонок
+        if len(bars) == 0:  # Если бары не получены
+            self.logger.debug('Бары отсутствуют')
+            return None  # то выходим, дальше не продолжаем
+        self.logger.debug(f'Первый бар    : {bars[0]}')
+        self.logger.debug(f'Последний бар : {bars[-1]}')
+        self.logger.debug(f'Кол-во бар    : {len(bars)}')
+        return bars
+
+    def set_bars(self, bars):
+        if len(bars) == 0:  # Если бар нет
+            return  # то выходим, дальше не продолжаем
+        if not isinstance(bars, BarSeries):  # Если пришел список бар
+            bars = BarSeries.from_bars(bars)  # то переводим его в колонки
+        bars_path = self._bars_path(bars.dataname, bars.time_frame)  # Папка с колонками бар
+        if not path.exists(bars_path):  # Если папки с колонками бар не существует
+            makedirs(bars_path)  # то создаем ее
+        generation = self._generation(bars_path)  # Поколение файлов колонок
+        count = self._count(bars_path, generation)  # Кол-во бар в файлах
+        if count > 0:  # Если в файлах есть бары
+            last = {name: np.fromfile(self._column_filename(bars_path, name, generation), dtype=dtype, count=1, offset=(count - 1) * 8)[0] for name, dtype in self.columns.items()}  # Читаем только последний бар
+            ascending = np.all(bars.datetime[1:] > bars.datetime[:-1])  # Новые бары идут по возрастанию даты/времени
+            if ascending and bars.datetime[0] == last['datetime'] and all(getattr(bars, name)[0] == value for name, value in last.items()):  # Если новые бары начинаются с последнего бара без изменений
+                bars = bars[1:]  # то его не пишем
+                if len(bars) == 0:  # Если новых бар нет
+                    return  # то выходим, дальше не продолжаем
+            if not ascending or bars.datetime[0] <= last['datetime']:  # Если новые бары пересекаются с сохраненными или обновляют последний бар
+                file_bars = self.get_bars(self._bars_symbol(bars), bars.time_frame)  # то получаем все бары из файлов
+                bars = file_bars.append(bars)  # Объединяем бары в новых колонках. Дубликаты заменяются новыми барами
+                self._write_generation(bars_path, bars, generation + 1)  # Пишем их в файлы нового поколения. Бары, полученные из файлов раньше, не меняются
+                self.logger.debug(f'Сохранение бар {bars_path} в поколение {generation + 1}')
+                self.logger.debug(f'Кол-во бар    : {len(bars)}')
+                return  # Выходим, дальше не продолжаем
+        for name in reversed(self.columns):  # Пробегаемся по всем колонкам. Дату/время пишем последней, чтобы по ней читались только записанные бары
+            with open(self._column_filename(bars_path, name, generation), 'r+b' if count > 0 else 'wb') as file:  # Файлы не обрезаем, т.к. они могут быть отображены на память
+                file.seek(count * 8)  # Новые бары пишем после записанных
+                np.ascontiguousarray(getattr(bars, name)).tofile(file)  # Записываем колонку как есть
+        self.logger.debug(f'Сохранение бар {bars_path} с бара {count}')
+        self.logger.debug(f'Первый бар    : {bars[0]}')
+        self.logger.debug(f'Последний бар : {bars[-1]}')
+        self.logger.debug(f'Кол-во бар    : {len(bars)}')
+
+    def import_file_storage(self) -> None:
+        """Перевод файлов истории Data/<Источник>/*.txt файлового хранилища в двоичные файлы"""
+        from FinLabPy.Storage.FileStorage import FileStorage  # Файловое хранилище
+        file_storage = FileStorage(self.source)  # Файловое хранилище того же источника
+        for filename in sorted(listdir(file_storage.datapath)):  # Пробегаемся по всем файлам хранилища
+            if not filename.endswith('.txt'):  # Если это не файл истории
+                continue  # то переходим к следующему файлу, дальше не продолжаем
+            dataname, time_frame = filename[:-4].rsplit('_', 1)  # Название тикера и временной интервал из имени файла
+            board, symbol = dataname.split('.', 1) if '.' in dataname else ('', dataname)  # Код режима торгов и тикер из названия тикера
+            pd_bars = file_storage._read_bars(f'{file_storage.datapath}{filename}')  # Бары из файла истории
+            self.logger.info(f'Перевод {filename}: {len(pd_bars)} бар')
+            self.set_bars(BarSeries.from_df(pd_bars, board, symbol, dataname, time_frame))  # Сохраняем бары в двоичные файлы
+
+    # Внутренние функции
+
+    def _bars_path(self, dataname: str, time_frame: str) -> str:
+        """Папка с колонками бар"""
+        return f'{self.datapath}{dataname}_{time_frame}{path.sep}'
+
+    def _generation(self, bars_path: str) -> int:
+        """Поколение файлов колонок. 0 - файлы без номера поколения"""
+        try:  # Пытаемся прочитать поколение
+            with open(f'{bars_path}generation') as file:  # Открываем файл поколения на чтение
+                return int(file.read())
+        except (ValueError, OSError):  # Если файла поколения нет
+            return 0  # то колонки в файлах без номера поколения
+
+    def _column_filename(self, bars_path: str, name: str, generation: int) -> str:
+        """Полное имя файла колонки поколения"""
+        return f'{bars_path}{name}.bin' if generation == 0 else f'{bars_path}{name}.{generation}.bin'
+
+    def _count(self, bars_path: str, generation: int) -> int:
+        """Кол-во полностью записанных бар. Колонки могут дописываться в этот момент"""
+        if not path.isfile(self._column_filename(bars_path, 'datetime', generation)):  # Если файлов колонок нет
+            return 0  # то бар нет
+        return min(path.getsize(self._column_filename(bars_path, name, generation)) for name in self.columns) // 8  # Кол-во бар по самой короткой колонке
+
+    def _write_generation(self, bars_path: str, bars: BarSeries, generation: int) -> None:
+        """Запись бар в файлы нового поколения и переключение на него. Файлы старых поколений удаляются, если они не отображены на память"""
+        for name in self.columns:  # Пробегаемся по всем колонкам
+            with open(self._column_filename(bars_path, name, generation), 'wb') as file:  # Файлы нового поколения никто не читает
+                np.ascontiguousarray(getattr(bars, name)).tofile(file)  # Записываем колонку как есть
+        with open(f'{bars_path}generation.tmp', 'w') as file:  # Файл поколения пишем во временный файл
+            file.write(str(generation))
+        replace(f'{bars_path}generation.tmp', f'{bars_path}generation')  # Переключаемся на новое поколение одной подменой файла
+        for filename in listdir(bars_path):  # Пробегаемся по всем файлам колонок
+            parts = filename.split('.')  # Колонка, поколение, расширение
+            if parts[-1] == 'bin' and parts[0] in self.columns and (int(parts[1]) if len(parts) == 3 else 0) != generation:  # Если файл колонки старого поколения
+                try:  # Пытаемся удалить файл
+                    remove(f'{bars_path}{filename}')  # Отображения на память в других местах остаются рабочими
+                except OSError:  # Если в Windows файл отображен на память
+                    pass  # то удалим его при следующей смене поколения
+
+if __name__ == '__main__':  # Точка входа при запуске этого скрипта
+    logging.basicConfig(format='%(asctime)s - %(message)s', datefmt='%d.%m.%Y %H:%M:%S', level=logging.INFO)
+    data_path = path.join(path.dirname(path.realpath(__file__)), '..', '..', 'Data')  # Папка с данными всех источников
+    for source in sorted(listdir(data_path)):  # Пробегаемся по всем источникам
+        if path.isdir(path.join(data_path, source)):  # Если это папка источника
+            BinaryStorage(source).import_file_storage()  # то переводим его файлы истории в двоичные файлы
@@ -1,9 +1,13 @@
 import logging
-from os import path, makedirs
+from os import path, makedirs, remove, replace, SEEK_END
+from io import BytesIO
+from datetime import datetime
+from threading import Lock
 
+import numpy as np
 import pandas as pd
 
-from FinLabPy.Core import Storage, Bar, bars_to_df  # Хранилище, бар, перевод бар в pandas DataFrame
+from FinLabPy.Core import Storage, BarSeries, df_to_bars  # Хранилище, бары в колонках, перевод pandas DataFrame в бары
 
 
 class FileStorage(Storage):
@@ -11,38 +15,41 @@ class FileStorage(Storage):
     logger = logging.getLogger('FileStorage')  # Будем вести лог
     delimiter = '\t'  # Разделитель значений в файле истории. По умолчанию табуляция
     dt_format = '%d.%m.%Y %H:%M'  # Формат представления даты и времени в файле истории. По умолчанию русский формат
+    columns = ['datetime', 'open', 'high', 'low', 'close', 'volume']  # Колонки файла истории
 
     def __init__(self, source):
         super().__init__(source)
         self.datapath = path.join(path.dirname(path.realpath(__file__)), '..', '..', 'Data', source, '')  # Путь сохранения файлов
         if not path.exists(self.datapath):  # Если папки для сохранения файла не существует
             makedirs(self.datapath)  # то создаем ее
+        self._load_symbols(f'{self.datapath}symbols.json')  # Загружаем неустаревшие спецификации тикеров
+        self._load_empty_days(f'{self.datapath}empty_days.json')  # Загружаем дни без бар у провайдера
+        self.indexes = {}  # Индексы файлов истории по дням. Полное имя файла: (размер файла, дни YYYYmmdd, смещения первых строк дней)
+        self.indexes_lock = Lock()  # Блокировка индексов. Файлы истории читаются из разных потоков
 
     def get_bars(self, symbol, time_frame, dt_from=None, dt_to=None):
         filename = f'{self.datapath}{symbol.dataname}_{time_frame}.txt'  # Полное имя файла
         if not path.isfile(filename):  # Если файл не существует
             self.logger.warning(f'Файл {filename} не найден')
             return None  # то выходим, дальше не продолжаем
-        self.logger.debug(f'Получение файла {filename}')
-        file_bars = pd.read_csv(  # Импортируем бары из CSV файла в pandas DataFrame
-            filename,  # Имя файла
-            sep=self.delimiter,  # Разделитель значений
-            usecols=['datetime', 'open', 'high', 'low', 'close', 'volume'],  # Для ускорения обработки задаем названия колонок
-            parse_dates=['datetime'],  # Колонку datetime разбираем как дату/время
-            dayfirst=True,  # В дате/времени сначала идет день, затем месяц и год
-            index_col='datetime')  # Индексом будет колонка datetime
-        self.logger.debug(f'Первый бар    : {file_bars.index[0]:{self.dt_format}}')
-        self.logger.debug(f'Последний бар : {file_bars.index[-1]:{self.dt_format}}')
-        self.logger.debug(f'Кол-во бар    : {len(file_bars)}')
-        bars: list[Bar] = []
-        for index, row in file_bars.iterrows():  # Пробегаемся по всем полученным барам
-            if dt_from is not None and index < dt_from:  # Если задана дата/время начала выборки, и она больше даты/времени текущего бара
-                continue  # то переходим к следующему бару, дальше не продолжаем
-            if dt_to is not None and index > dt_to:  # Если задана дата/время окончания выборки, и она меньше даты/времени текущего бара
-                continue  # то переходим к следующему бару, дальше не продолжаем
-            bars.append(Bar(symbol.board, symbol.symbol, symbol.dataname, time_frame, index, row['open'], row['high'], row['low'], row['close'], row['volume']))
+        if dt_from is None and dt_to is None:  # Если нужны все бары
+            self.logger.debug(f'Получение файла {filename}')
+            file_bars = self._read_bars(filename)  # то читаем файл целиком
+        else:  # Если нужны бары с ... по ...
+            file_size, days, offsets = self._get_index(filename)  # Индекс файла по дням
+            i_from = 0 if dt_from is None else max(int(np.searchsorted(days, self._day_key(dt_from), side='right')) - 1, 0)  # День, в котором может быть первый бар
+            i_to = len(days) if dt_to is None else int(np.searchsorted(days, self._day_key(dt_to), side='right'))  # День после последнего бара
+            if i_from >= i_to:  # Если в файле нет дней из диапазона
+                self.logger.debug('Бары отсутствуют')
+                return None  # то выходим, дальше не продолжаем
+            self.logger.debug(f'Получение файла {filename} по индексу')
+            file_bars = self._read_bars(filename, offsets[i_from], offsets[i_to] if i_to < len(offsets) else file_size)  # Читаем только строки нужных дней
+        if len(file_bars) == 0:  # Если в файле нет бар
+            self.logger.debug('Бары отсутствуют')
+            return None  # то выходим, дальше не продолжаем
+        bars = df_to_bars(file_bars, symbol, time_frame).between(dt_from, dt_to)  # Переводим в бары без обхода строк. Отбираем бары с ... по ...
         if len(bars) == 0:  # Если бары не получены
-            self.logger.debug(f'Бары отстутствуют')
+            self.logger.debug('Бары отсутствуют')
             return None  # то выходим, дальше не продолжаем
         if dt_from is not None or dt_to is not None:  # Если задан фильтр с ... по ...
             str_filter = f'с {dt_from:{self.dt_format}}' if dt_from is not None else f'по {dt_to:{self.dt_format}}' if dt_to is not None else f'с {dt_from:{self.dt_format}} по {dt_to:{self.dt_format}}'
@@ -55,19 +62,185 @@ class FileStorage(Storage):
     def set_bars(self, bars):
         if len(bars) == 0:  # Если бар нет
             return  # то выходим, дальше не продолжаем
-        pd_bars = bars_to_df(bars)  # Переводим бары в pandas DataFrame
-        symbol = self.get_symbol(bars[0].dataname)  # Спецификация тикера по первому бару
-        time_frame = bars[0].time_frame  # Временной интервал по первому бару
-        file_bars = self.get_bars(symbol, time_frame)  # Все бары из файла
+        if not isinstance(bars, BarSeries):  # Если пришел список бар
+            bars = BarSeries.from_bars(bars)  # то переводим его в колонки
+        time_frame = bars.time_frame  # Временной интервал
+        filename = f'{self.datapath}{bars.dataname}_{time_frame}.txt'  # Полное имя файла
+        last_line = self._get_last_line(filename)  # Начало и дата/время последней строки файла
+        if last_line is not None and np.all(bars.datetime[1:] > bars.datetime[:-1]):  # Если в файле есть бары, и новые бары идут по возрастанию даты/времени
+            last_line_offset, dt_last = last_line  # Начало и дата/время последнего бара в файле
+            if bars.datetime[0] >= np.datetime64(dt_last, 'ns'):  # Если новые бары начинаются не раньше последнего бара в файле
+                self._append_bars(filename, bars, last_line_offset if bars.datetime[0] == np.datetime64(dt_last, 'ns') else None)  # то дописываем только новые бары. Последний бар в файле переписываем
+                return  # Файл целиком не перезаписываем. Выходим, дальше не продолжаем
+        file_bars = self.get_bars(self._bars_symbol(bars), time_frame)  # Все бары из файла
         if file_bars is not None:  # Если в файле есть бары
-            pd_file_bars = bars_to_df(file_bars)  # Переводим бары в pandas DataFrame
-            pd_bars = pd.concat([pd_file_bars, pd_bars])  # Объединяем бары
-            pd_bars = pd_bars[~pd_bars.index.duplicated(keep='last')]  # Убираем дубликаты самым быстрым методом
-            pd_bars.sort_index(inplace=True)  # Сортируем по индексу заново
-        pd_bars = pd_bars[['open', 'high', 'low', 'close', 'volume']]  # Отбираем нужные колонки. Дата и время будут экспортированы как индекс
-        filename = f'{self.datapath}{symbol.dataname}_{time_frame}.txt'  # Полное имя файла
+            bars = file_bars.append(bars)  # то объединяем бары. Дубликаты заменяются новыми барами
+        pd_bars = bars.to_df()  # Переводим бары в pandas DataFrame. Дата и время будут экспортированы как индекс
         self.logger.debug(f'Сохранение файла {filename}')
         pd_bars.to_csv(filename, sep=self.delimiter, date_format=self.dt_format)  # Экспортируем бары из pandas DataFrame в CSV файл
+        self._remove_index(filename)  # Файл переписан целиком. Индекс построим заново при чтении
         self.logger.debug(f'Первый бар    : {pd_bars.index[0]:{self.dt_format}}')
         self.logger.debug(f'Последний бар : {pd_bars.index[-1]:{self.dt_format}}')
         self.logger.debug(f'Кол-во бар    : {len(pd_bars)}')
+
+    # Внутренние функции
+
+    def _read_bars(self, filename: str, offset_from: int = 0, offset_to: int = None) -> pd.DataFrame:
+        """Бары из файла истории в pandas DataFrame
+
+        :param str filename: Полное имя файла
+        :param int offset_from: Начало первой строки. 0 - с заголовка файла
+        :param int offset_to: Конец последней строки. None - до конца файла
+        """
+        if offset_from == 0 and offset_to is None:  # Если нужен весь файл
+            source = filename  # то pandas читает его сам
+        else:  # Если нужна часть файла
+            with open(filename, 'rb') as file:  # Открываем файл на чтение в двоичном режиме
+                file.seek(offset_from)  # Переходим на первую строку
+                source = BytesIO(file.read() if offset_to is None else file.read(offset_to - offset_from))  # Читаем только нужные строки
+        return pd.read_csv(  # Импортируем бары из CSV файла в pandas DataFrame
+            source,  # Имя файла или прочитанные строки
+            sep=self.delimiter,  # Разделитель значений
+            header=0 if offset_from == 0 else None,  # Заголовок есть только в начале файла
+            names=self.columns,  # Для ускорения обработки задаем названия колонок
+            parse_dates=['datetime'],  # Колонку datetime разбираем как дату/время
+            date_format=self.dt_format,  # в формате файла истории
+            index_col='datetime')  # Индексом будет колонка datetime
+
+    def _day_key(self, dt: datetime) -> int:
+        """Ключ дня в индексе файла истории YYYYmmdd"""
+        return dt.year * 10000 + dt.month * 100 + dt.day
+
+    def _get_index(self, filename: str) -> tuple[int, np.ndarray, np.ndarray]:
+        """Индекс файла истории по дням: размер файла, дни YYYYmmdd, смещения первых строк дней. Строится заново, если файл изменился"""
+        file_size = path.getsize(filename)  # Размер файла
+        with self.indexes_lock:  # Индексы меняем по одному потоку
+            index = self.indexes.get(filename)  # Индекс из памяти
+            if index is None:  # Если индекса в памяти нет
+                index = self._load_index(filename)  # то загружаем его из файла индекса
+            if index is None or index[0] != file_size:  # Если индекса нет, или файл истории изменился
+                days, offsets = self._scan_days(filename, 0)  # то строим индекс по всему файлу
+                index = self._save_index(filename, file_size, days, offsets)  # Сохраняем индекс
+            self.indexes[filename] = index  # Запоминаем индекс в памяти
+        return index
+
+    def _scan_days(self, filename: str, offset_from: int) -> tuple[np.ndarray, np.ndarray]:
+        """Дни YYYYmmdd и смещения их первых строк в файле истории, начиная с заданного смещения. Индекс строим по дням.
+        Бары в файле идут по возрастанию даты/времени, поэтому начало следующего дня ищем двоичным поиском по строкам, не просматривая все строки"""
+        with open(filename, 'rb') as file:  # Открываем файл на чтение в двоичном режиме
+            file.seek(offset_from)  # Переходим на начало просмотра
+            data = file.read()  # Байты файла
+        date_format = self.dt_format.split(' ')[0]  # Формат даты без времени
+        width = len(datetime(2000, 12, 31).strftime(date_format))  # Ширина даты в строке
+        start = 0 if offset_from > 0 else data.find(b'\n') + 1  # Первая строка бара. Если просматриваем файл с начала, то пропускаем заголовок
+        if offset_from == 0 and start == 0:  # Если в файле нет даже заголовка целиком
+            start = len(data)  # то бар нет
+        days, offsets = [], []  # Дни и смещения их первых строк
+        step = 4096  # Шаг поиска конца дня в байтах. Дальше - размер предыдущего дня
+        while start + width <= len(data):  # Пока в строке помещается дата
+            date = data[start:start + width]  # Дата первой строки дня без разбора
+            days.append(self._day_key(datetime.strptime(date.decode('utf-8'), date_format)))  # Разбираем только по одной дате на день
+            offsets.append(start + offset_from)
+            day_from, day_to = start, len(data)  # Строка этого дня и строка следующего дня (или конец файла)
+            probe = start + step  # Пробуем найти строку следующего дня через размер предыдущего дня. Шаг удваиваем, пока не выйдем за день
+            while probe < day_to:
+                line = data.find(b'\n', probe, day_to) + 1  # Первая строка после пробы
+                if line == 0 or line >= day_to:  # Если строк после пробы нет
+                    break  # то следующий день ищем до конца файла
+                if data[line:line + width] != date:  # Если строка следующего дня
+                    day_to = line  # то ищем начало следующего дня до нее
+                    break
+                day_from, probe, step = line, line + step, step * 2  # Строка этого дня. Пробуем дальше
+            while True:  # Двоичный поиск первой строки следующего дня между строкой этого дня и строкой следующего дня
+                line = data.find(b'\n', (day_from + day_to) // 2, day_to) + 1  # Строка во второй половине
+                if line == 0 or line >= day_to:  # Если во второй половине строк нет
+                    line = data.find(b'\n', day_from, day_to) + 1  # то берем строку после строки этого дня
+                    if line == 0 or line >= day_to:  # Если и ее нет
+                        break  # то следующий день начинается с day_to
+                if data[line:line + width] == date:  # Если строка этого дня
+                    day_from = line  # то следующий день начинается после нее
+                else:  # Если строка следующего дня
+                    day_to = line  # то следующий день начинается не позже нее
+            step = max(day_to - start, 1)  # Размер дня. Следующий день обычно такого же размера
+            start = day_to  # Первая строка следующего дня
+        return np.array(days, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+    def _index_filename(self, filename: str) -> str:
+        """Полное имя файла индекса для файла истории"""
+        return f'{path.splitext(filename)[0]}.idx'
+
+    def _load_index(self, filename: str) -> tuple[int, np.ndarray, np.ndarray] | None:
+        """Загрузка индекса файла истории. None, если индекса нет"""
+        index_filename = self._index_filename(filename)  # Имя файла индекса
+        if not path.isfile(index_filename):  # Если файла индекса нет
+            return None  # то выходим, дальше не продолжаем
+        try:  # Пытаемся разобрать индекс
+            with open(index_filename) as file:  # Открываем файл индекса на чтение
+                file_size = int(file.readline())  # В первой строке размер файла истории на момент построения индекса
+                index = np.loadtxt(file, dtype=np.int64, delimiter=self.delimiter, ndmin=2)  # Остальные строки: день и смещение его первой строки
+        except (ValueError, OSError):  # Если индекс поврежден
+            return None  # то построим его заново
+        return file_size, index[:, 0], index[:, 1]
+
+    def _save_index(self, filename: str, file_size: int, days: np.ndarray, offsets: np.ndarray) -> tuple[int, np.ndarray, np.ndarray]:
+        """Сохранение индекса файла истории. Сначала пишем во временный файл, затем подменяем им файл индекса"""
+        index_filename = self._index_filename(filename)  # Имя файла индекса
+        with open(f'{index_filename}.tmp', 'w') as file:  # Открываем временный файл на запись
+            file.write(f'{file_size}\n')  # Размер файла истории
+            np.savetxt(file, np.column_stack((days, offsets)), fmt='%d', delimiter=self.delimiter)  # День и смещение его первой строки
+        replace(f'{index_filename}.tmp', index_filename)  # Подменяем файл индекса
+        return file_size, days, offsets
+
+    def _remove_index(self, filename: str) -> None:
+        """Удаление индекса файла истории"""
+        with self.indexes_lock:  # Индексы меняем по одному потоку
+            self.indexes.pop(filename, None)  # Удаляем индекс из памяти
+            index_filename = self._index_filename(filename)  # Имя файла индекса
+            if path.isfile(index_filename):  # Если есть файл индекса
+                remove(index_filename)  # то удаляем его
+
+    def _get_last_line(self, filename: str) -> tuple[int, datetime] | None:
+        """Начало последней строки файла истории и дата/время ее бара. Читаем только хвост файла"""
+        if not path.isfile(filename):  # Если файл не существует
+            return None  # то выходим, дальше не продолжаем
+        with open(filename, 'rb') as file:  # Открываем файл на чтение в двоичном режиме
+            file_size = file.seek(0, SEEK_END)  # Размер файла
+            tail_size = 256  # Размер хвоста файла. Строка бара существенно меньше
+            while True:  # Пока не найдем начало последней строки
+                tail_offset = max(file_size - tail_size, 0)  # Начало хвоста файла
+                file.seek(tail_offset)  # Переходим на начало хвоста
+                tail = file.read().rstrip(b'\r\n')  # Читаем хвост без перевода последней строки
+                line_start = tail.rfind(b'\n') + 1  # Начало последней строки в хвосте
+                if line_start > 0 or tail_offset == 0:  # Если нашли начало последней строки, или дошли до начала файла
+                    break  # то выходим, дальше не ищем
+                tail_size *= 2  # Увеличиваем хвост файла
+        last_line = tail[line_start:].decode('utf-8')  # Последняя строка
+        try:  # Пытаемся разобрать дату/время бара
+            dt_last = datetime.strptime(last_line.split(self.delimiter)[0], self.dt_format)  # Дата/время последнего бара
+        except ValueError:  # Если в файле только заголовок
+            return None  # то баров нет, выходим, дальше не продолжаем
+        return tail_offset + line_start, dt_last
+
+    def _append_bars(self, filename: str, bars: BarSeries, truncate_offset: int | None) -> None:
+        """Добавление бар в конец файла истории
+
+        :param str filename: Полное имя файла
+        :param BarSeries bars: Новые бары, начиная с последнего бара в файле или после него
+        :param int truncate_offset: Начало последней строки, если ее нужно переписать. None, если строку не переписываем
+        """
+        with self.indexes_lock:  # Индексы меняем по одному потоку
+            index = self.indexes.get(filename) or self._load_index(filename)  # Индекс файла до добавления бар
+            if index is not None and index[0] != path.getsize(filename):  # Если индекс построен не по текущему файлу
+                index = None  # то дополнять его нельзя
+            if truncate_offset is not None:  # Если последний бар в файле нужно переписать
+                with open(filename, 'r+b') as file:  # Открываем файл на чтение/запись в двоичном режиме
+                    file.truncate(truncate_offset)  # Удаляем последнюю строку
+            self.logger.debug(f'Добавление в файл {filename}')
+            bars.to_df().to_csv(filename, mode='a', header=False, sep=self.delimiter, date_format=self.dt_format)  # Дописываем новые бары в конец файла
+            if index is not None and len(index[1]) > 0:  # Если индекс был актуален
+                _, days, offsets = index  # Дни и смещения их первых строк
+                new_days, new_offsets = self._scan_days(filename, int(offsets[-1]))  # то просматриваем файл только с первой строки последнего дня. Она не изменилась
+                self.indexes[filename] = self._save_index(filename, path.getsize(filename), np.concatenate((days[:-1], new_days)), np.concatenate((offsets[:-1], new_offsets)))  # Дополняем индекс
+        self.logger.debug(f'Первый бар    : {bars[0]}')
+        self.logger.debug(f'Последний бар : {bars[-1]}')
+        self.logger.debug(f'Кол-во бар    : {len(bars)}')
@@ -0,0 +1,114 @@
+import logging
+from os import path, makedirs
+from threading import local, Lock
+from datetime import datetime, date
+from itertools import repeat
+import sqlite3
+import json
+
+import numpy as np
+
+from FinLabPy.Core import Storage, Symbol, BarSeries  # Хранилище, тикер, бары в колонках
+
+
+class SQLiteStorage(Storage):
+    """Хранилище в базе данных SQLite. Журнал WAL позволяет читать бары из разных потоков и процессов, пока один из них пишет"""
+    logger = logging.getLogger('SQLiteStorage')  # Будем вести лог
+
+    def __init__(self, source):
+        super().__init__(source)
+        datapath = path.join(path.dirname(path.realpath(__file__)), '..', '..', 'Data', source, '')  # Путь сохранения базы данных
+        if not path.exists(datapath):  # Если папки для сохранения базы данных не существует
+            makedirs(datapath)  # то создаем ее
+        self.filename = f'{datapath}{source}.db'  # Полное имя файла базы данных
+        self.connections = local()  # Подключения к базе данных. Для каждого потока свое подключение
+        self.write_lock = Lock()  # Блокировка записи. Пишет один поток, читают все
+        with self.write_lock, self._connection() as connection:  # Создаем таблицы, если их нет
+            connection.execute('CREATE TABLE IF NOT EXISTS symbols ('
+                               'dataname TEXT PRIMARY KEY, board TEXT, symbol TEXT, description TEXT, decimals INTEGER, min_step REAL, lot_size INTEGER, broker_info TEXT, updated TEXT)')  # Спецификации тикеров. Информацию брокера храним в JSON. Дата и время получения в ISO формате
+            connection.execute('CREATE TABLE IF NOT EXISTS bars ('
+                               'dataname TEXT, time_frame TEXT, datetime INTEGER, open REAL, high REAL, low REAL, close REAL, volume INTEGER, '
+                               'PRIMARY KEY (dataname, time_frame, datetime)) WITHOUT ROWID')  # Бары. Дата и время в наносекундах. Бары лежат в порядке первичного ключа
+            connection.execute('CREATE TABLE IF NOT EXISTS empty_days ('
+                               'dataname TEXT, time_frame TEXT, date TEXT, PRIMARY KEY (dataname, time_frame, date)) WITHOUT ROWID')  # Дни без бар у провайдера. Дата в ISO формате
+        for symbol, updated in self._select_symbols():  # Пробегаемся по всем неустаревшим спецификациям тикеров
+            self._add_symbol(symbol, updated)  # Добавляем тикер в словарь
+
+    def get_symbol(self, dataname):
+        symbol = super().get_symbol(dataname)  # Пробуем получить неустаревший тикер из словаря
+        if symbol is not None:  # Если тикер есть в словаре
+            return symbol  # то возвращаем его, дальше не продолжаем
+        symbols = self._select_symbols(dataname)  # Тикер мог сохранить другой процесс. Пробуем получить его из базы данных
+        if len(symbols) == 0:  # Если неустаревшего тикера нет в базе данных
+            return None  # то выходим, дальше не продолжаем
+        symbol, updated = symbols[0]  # Спецификация тикера и дата/время ее получения
+        with self.symbols_lock:  # Тикеры меняем по одному потоку
+            self._add_symbol(symbol, updated)  # Запоминаем тикер в словаре и индексах
+        return symbol
+
+    def set_symbol(self, symbol):
+        super().set_symbol(symbol)  # Добавляем/изменяем тикер в словаре
+        with self.write_lock, self._connection() as connection:  # Пишем в транзакции
+            connection.execute('INSERT OR REPLACE INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               (symbol.dataname, symbol.board, symbol.symbol, symbol.description, symbol.decimals, symbol.min_step, symbol.lot_size,
+                                json.dumps(symbol.broker_info), self.symbols_updated[symbol.dataname].isoformat()))
+
+    def get_empty_days(self, dataname, time_frame):
+        rows = self._connection().execute('SELECT date FROM empty_days WHERE dataname = ? AND time_frame = ?', (dataname, time_frame)).fetchall()  # Дни могли сохранить и другие процессы
+        return {date.fromisoformat(row[0]) for row in rows}
+
+    def add_empty_days(self, dataname, time_frame, days):
+        with self.write_lock, self._connection() as connection:  # Пишем в транзакции
+            connection.executemany('INSERT OR IGNORE INTO empty_days VALUES (?, ?, ?)', ((dataname, time_frame, d.isoformat()) for d in days))
+
+    def get_bars(self, symbol, time_frame, dt_from=None, dt_to=None):
+        rows = self._connection().execute(
+            'SELECT datetime, open, high, low, close, volume FROM bars WHERE dataname = ? AND time_frame = ? AND datetime BETWEEN ? AND ? ORDER BY datetime',
+            (symbol.dataname, time_frame,
+             -2 ** 63 if dt_from is None else int(np.datetime64(dt_from, 'ns').astype(np.int64)),
+             2 ** 63 - 1 if dt_to is None else int(np.datetime64(dt_to, 'ns').astype(np.int64)))).fetchall()  # Бары с ... по ... получаем по первичному ключу
+        if len(rows) == 0:  # Если бары не получены
+            self.logger.debug(f'Бары {symbol.dataname} ({time_frame}) отсутствуют')
+            return None  # то выходим, дальше не продолжаем
+        date_time, open_, high, low, close, volume = zip(*rows)  # Разбиваем строки на колонки
+        bars = BarSeries(symbol.board, symbol.symbol, symbol.dataname, time_frame, np.array(date_time, dtype=np.int64).view('datetime64[ns]'), open_, high, low, close, volume)
+        self.logger.debug(f'Первый бар    : {bars[0]}')
+        self.logger.debug(f'Последний бар : {bars[-1]}')
+        self.logger.debug(f'Кол-во бар    : {len(bars)}')
+        return bars
+
+    def set_bars(self, bars):
+        if len(bars) == 0:  # Если бар нет
+            return  # то выходим, дальше не продолжаем
+        if not isinstance(bars, BarSeries):  # Если пришел список бар
+            bars = BarSeries.from_bars(bars)  # то переводим его в колонки
+        rows = zip(repeat(bars.dataname), repeat(bars.time_frame), bars.datetime.view(np.int64).tolist(),
+                   bars.open.tolist(), bars.high.tolist(), bars.low.tolist(), bars.close.tolist(), bars.volume.tolist())  # Строки бар из колонок без создания бар
+        with self.write_lock, self._connection() as connection:  # Все бары пишем в одной транзакции
+            connection.executemany('INSERT INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                                   'ON CONFLICT (dataname, time_frame, datetime) DO UPDATE SET '
+                                   'open = excluded.open, high = excluded.high, low = excluded.low, close = excluded.close, volume = excluded.volume', rows)  # Дубликаты заменяются новыми барами
+        self.logger.debug(f'Сохранение бар {bars.dataname} ({bars.time_frame})')
+        self.logger.debug(f'Первый бар    : {bars[0]}')
+        self.logger.debug(f'Последний бар : {bars[-1]}')
+        self.logger.debug(f'Кол-во бар    : {len(bars)}')
+
+    # Внутренние функции
+
+    def _select_symbols(self, dataname: str = None) -> list[tuple[Symbol, datetime]]:
+        """Неустаревшие спецификации тикеров из базы данных с датой и временем их получения. Все или по названию тикера"""
+        updated_from = '' if self.symbols_ttl is None else (datetime.now() - self.symbols_ttl).isoformat()  # Дата и время получения самой старой неустаревшей спецификации. Даты в ISO формате сравниваются как строки
+        rows = self._connection().execute(
+            'SELECT board, symbol, dataname, description, decimals, min_step, lot_size, broker_info, updated FROM symbols WHERE updated > ?' + ('' if dataname is None else ' AND dataname = ?'),
+            (updated_from,) if dataname is None else (updated_from, dataname)).fetchall()
+        return [(Symbol(*row[:-2], json.loads(row[-2])), datetime.fromisoformat(row[-1])) for row in rows]
+
+    def _connection(self) -> sqlite3.Connection:
+        """Подключение к базе данных текущего потока"""
+        connection = getattr(self.connections, 'connection', None)  # Подключение текущего потока
+        if connection is None:  # Если поток еще не подключался
+            connection = sqlite3.connect(self.filename, timeout=30)  # то подключаемся. Ждем, пока другой процесс закончит запись
+            connection.execute('PRAGMA journal_mode = WAL')  # Журнал WAL. Читатели не блокируют писателя, писатель не блокирует читателей
+            connection.execute('PRAGMA synchronous = NORMAL')  # В режиме WAL достаточно синхронизации при контрольных точках
+            self.connections.connection = connection  # Запоминаем подключение потока
+        return connection
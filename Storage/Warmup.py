@@ -0,0 +1,165 @@
+import logging
+import json  # Файл состояния прогрева
+from hashlib import sha1  # Отпечаток списка заданий в файле состояния
+from os import path, replace, remove, makedirs  # Файл состояния прогрева
+from datetime import datetime, timedelta  # Работа с датой и временем
+from time import perf_counter  # Замер скорости прогрева
+from threading import Lock  # Блокировка состояния и статистики
+from concurrent.futures import ThreadPoolExecutor, wait  # Пулы потоков провайдеров
+
+from FinLabPy.Core import Broker, RateLimiter, Event, bar_cache  # Брокер, ограничение частоты запросов, событие, кэш бар
+
+
+class WarmupStats:
+    """Статистика прогрева истории"""
+    __slots__ = ('tasks', 'done', 'skipped', 'failed', 'bars', 'requests', 'seconds')
+
+    def __init__(self, tasks: int = 0):
+        self.tasks = tasks  # Кол-во заданий (брокер, тикер, временной интервал)
+        self.done = 0  # Кол-во выполненных заданий
+        self.skipped = 0  # Кол-во заданий, выполненных до прерывания
+        self.failed = 0  # Кол-во заданий с ошибкой
+        self.bars = 0  # Кол-во полученных бар
+        self.requests = 0  # Кол-во запросов к провайдерам
+        self.seconds = 0.0  # Время прогрева в секундах
+
+    @property
+    def bars_per_second(self) -> float:
+        """Скорость получения бар"""
+        return self.bars / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def requests_per_second(self) -> float:
+        """Скорость запросов к провайдерам"""
+        return self.requests / self.seconds if self.seconds > 0 else 0.0
+
+    def __repr__(self):
+        return (f'{self.done + self.skipped + self.failed}/{self.tasks} заданий (пропущено {self.skipped}, ошибок {self.failed}), '
+                f'{self.bars} бар, {self.requests} запросов за {self.seconds:.1f} с, {self.bars_per_second:.0f} бар/с, {self.requests_per_second:.1f} запросов/с')
+
+
+class HistoryWarmup:
+    """Прогрев истории списка тикеров по временным интервалам у нескольких брокеров.
+    Каждый провайдер получает свой пул потоков, поэтому брокеры работают одновременно, не мешая друг другу.
+    Выполненные задания записываются в файл состояния. После прерывания прогрев с теми же заданиями и датой начала истории продолжается с невыполненных заданий"""
+    logger = logging.getLogger('HistoryWarmup')  # Будем вести лог
+    state_ttl = timedelta(days=1)  # Время жизни файла состояния от начала прерванного прогрева. Позже история у провайдера уже ушла вперед, и прогрев начинается заново
+
+    def __init__(self, brokers: list[Broker], workers: int = 4, state_filename: str = None):
+        """
+        :param brokers: Брокеры, историю которых прогреваем
+        :param workers: Кол-во тикеров, одновременно прогреваемых у одного провайдера. Окна истории тикера дополнительно запрашиваются пулом провайдера
+        :param state_filename: Файл состояния прогрева. По умолчанию - Warmup.json в папке Data
+        """
+        self.brokers = brokers  # Брокеры
+        self.workers = workers  # Кол-во одновременно прогреваемых тикеров у провайдера
+        self.state_filename = state_filename or path.join(path.dirname(path.realpath(__file__)), '..', '..', 'Data', 'Warmup.json')  # Файл состояния прогрева
+        self.lock = Lock()  # Блокировка состояния и статистики
+        self.state: dict[str, int] = {}  # Выполненные задания. Ключ - код брокера|название тикера|временной интервал, значение - кол-во полученных бар
+        self.state_run: dict[str, str | None] = {}  # Прогрев, к которому относятся выполненные задания: дата начала истории, отпечаток заданий, дата и время начала прогрева
+        self.stats = WarmupStats()  # Статистика последнего прогрева
+        self.on_progress = Event()  # Выполнение задания. Получает (брокер, название тикера, временной интервал, кол-во полученных бар или None при ошибке, статистика)
+
+    def run(self, datanames: list[str], time_frames: list[str], dt_from: datetime = None) -> WarmupStats:
+        """Прогрев истории. Возвращает статистику прогрева
+
+        :param datanames: Названия тикеров
+        :param time_frames: Временные интервалы https://ru.wikipedia.org/wiki/Таймфрейм
+        :param dt_from: Дата и время начала истории. None - с первого бара в хранилище или с начала истории у провайдера
+        """
+        tasks = [(broker, dataname, time_frame) for broker in self.brokers for dataname in datanames for time_frame in time_frames]  # Все задания
+        self._load_state(tasks, dt_from)  # Задания, выполненные до прерывания этого же прогрева
+        self.stats = WarmupStats(len(tasks))
+        limiters = {id(broker.rate_limiter): broker.rate_limiter for broker in self.brokers}.values()  # Ограничения частоты запросов провайдеров. Считают все запросы, даже без бюджета
+        requests_start = self._requests(limiters)  # Кол-во запросов к провайдерам до прогрева
+        executors: dict[int, ThreadPoolExecutor] = {}  # Пулы потоков. Ключ - идентификатор провайдера
+        futures = []  # Запущенные задания
+        dt_start = perf_counter()
+        try:
+            for broker, dataname, time_frame in tasks:  # Пробегаемся по всем заданиям
+                if self._key(broker, dataname, time_frame) in self.state:  # Если задание выполнено до прерывания
+                    self.stats.skipped += 1  # то пропускаем его
+                    continue
+                executor = executors.get(id(broker.provider))  # Пул потоков провайдера
+                if executor is None:  # Если пула еще нет
+                    executor = executors[id(broker.provider)] = ThreadPoolExecutor(self.workers, thread_name_prefix=f'Warmup{broker.__class__.__name__}')  # то создаем его
+                futures.append(executor.submit(self._warmup, broker, dataname, time_frame, dt_from, limiters, requests_start, dt_start))
+            wait(futures)  # Ждем выполнения всех заданий
+        finally:  # При прерывании невыполненные задания отменяем. Выполненные уже записаны в файл состояния
+            for executor in executors.values():
+                executor.shutdown(cancel_futures=True)
+        self.stats.requests = self._requests(limiters) - requests_start
+        self.stats.seconds = perf_counter() - dt_start
+        if self.stats.failed == 0 and path.isfile(self.state_filename):  # Если все задания выполнены
+            remove(self.state_filename)  # то следующий прогрев начнем заново
+        self.logger.info(f'Прогрев завершен: {self.stats}')
+        return self.stats
+
+    # Внутренние функции
+
+    def _warmup(self, broker: Broker, dataname: str, time_frame: str, dt_from: datetime | None, limiters, requests_start: int, dt_start: float) -> None:
+        """Прогрев истории тикера по временному интервалу у брокера"""
+        try:
+            symbol = broker.get_symbol_by_dataname(dataname)  # Тикер по названию
+            if symbol is None:  # Если тикер не найден
+                raise ValueError(f'Тикер {dataname} не найден')
+            stored = bar_cache.get_bars(broker.storage, symbol, time_frame, dt_from)  # Бары в хранилище до прогрева. Остаются в кэше для синхронизации
+            bars = broker.get_history(symbol, time_frame, dt_from)  # Синхронизируем историю с провайдером
+            count = max(0, (0 if bars is None else len(bars)) - (0 if stored is None else len(stored)))  # Кол-во полученных бар
+        except Exception as ex:  # Ошибка одного задания не должна останавливать прогрев
+            self.logger.error(f'[{broker.code}] {dataname} {time_frame}: ошибка прогрева {ex}')
+            count = None
+        with self.lock:  # Состояние и статистику меняем по одному потоку
+            if count is None:
+                self.stats.failed += 1
+            else:
+                self.stats.done += 1
+                self.stats.bars += count
+                self.state[self._key(broker, dataname, time_frame)] = count
+                self._save_state()  # Сразу записываем выполненное задание, чтобы продолжить с него после прерывания
+            self.stats.requests = self._requests(limiters) - requests_start
+            self.stats.seconds = perf_counter() - dt_start
+            self.logger.info(f'[{broker.code}] {dataname} {time_frame}: {"ошибка" if count is None else f"+{count} бар"}. {self.stats}')
+        self.on_progress.trigger(broker, dataname, time_frame, count, self.stats)
+
+    @staticmethod
+    def _key(broker: Broker, dataname: str, time_frame: str) -> str:
+        """Ключ задания в файле состояния"""
+        return f'{broker.code}|{dataname}|{time_frame}'
+
+    @staticmethod
+    def _requests(limiters) -> int:
+        """Кол-во запросов рыночных данных ко всем провайдерам"""
+        return sum(limiter.stats().get(RateLimiter.MarketData, {}).get('requests', 0) for limiter in limiters)
+
+    def _load_state(self, tasks: list[tuple[Broker, str, str]], dt_from: datetime | None) -> None:
+        """Загрузка заданий, выполненных до прерывания. Состояние другого прогрева (другие задания или дата начала истории) или устаревшее состояние не используется"""
+        self.state = {}
+        self.state_run = {'dt_from': None if dt_from is None else dt_from.isoformat(),  # Дата начала истории
+                          'tasks': sha1('\n'.join(sorted(self._key(*task) for task in tasks)).encode('utf-8')).hexdigest(),  # Отпечаток списка заданий
+                          'started': datetime.now().isoformat()}  # Дата и время начала прогрева
+        if not path.isfile(self.state_filename):  # Если файла состояния нет
+            return  # то прогрев начинаем заново
+        try:  # Пытаемся прочитать файл
+            with open(self.state_filename, encoding='utf-8') as file:  # Открываем файл на чтение
+                saved = json.load(file)  # Прогрев и выполненные задания
+            run, done = saved['run'], dict(saved['done'])
+            started = datetime.fromisoformat(run['started'])  # Дата и время начала прерванного прогрева
+        except (ValueError, OSError, KeyError, TypeError):  # Если файл поврежден или в старом формате
+            return  # то прогрев начинаем заново
+        if (run.get('dt_from'), run.get('tasks')) != (self.state_run['dt_from'], self.state_run['tasks']):  # Если прерван другой прогрев
+            self.logger.info('Файл состояния от другого прогрева. Прогрев начинаем заново')
+            return
+        if datetime.now() - started >= self.state_ttl:  # Если состояние устарело
+            self.logger.info(f'Файл состояния от {started:%d.%m.%Y %H:%M} устарел. Прогрев начинаем заново')
+            return
+        self.state = done  # Выполненные задания
+        self.state_run['started'] = run['started']  # Время жизни состояния считаем от начала прерванного прогрева
+        self.logger.info(f'Продолжаем прогрев. Выполнено заданий: {len(self.state)}')
+
+    def _save_state(self) -> None:
+        """Сохранение выполненных заданий. Сначала пишем во временный файл, затем подменяем им файл состояния"""
+        makedirs(path.dirname(self.state_filename) or '.', exist_ok=True)  # Папка файла состояния
+        with open(f'{self.state_filename}.tmp', 'w', encoding='utf-8') as file:  # Открываем временный файл на запись
+            json.dump({'run': self.state_run, 'done': self.state}, file, ensure_ascii=False)  # Записываем прогрев и выполненные задания
+        replace(f'{self.state_filename}.tmp', self.state_filename)  # Подменяем файл состояния
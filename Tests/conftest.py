@@ -0,0 +1,27 @@
+import sys  # Модули процесса
+from types import ModuleType  # Пакет
+from importlib.util import find_spec  # Поиск пакета
+from os import path, rmdir  # Папка репозитория, удаление пустой папки с данными
+from shutil import rmtree  # Удаление хранилища теста
+from uuid import uuid4  # Уникальный источник хранилища
+
+import pytest
+
+root = path.dirname(path.dirname(path.realpath(__file__)))  # Папка репозитория
+if find_spec('FinLabPy') is None:  # Если репозиторий не установлен как пакет FinLabPy
+    package = ModuleType('FinLabPy')  # то регистрируем его папку пакетом FinLabPy, т.к. модули импортируют друг друга через него
+    package.__path__ = [root]
+    sys.modules['FinLabPy'] = package
+
+
+@pytest.fixture
+def source():
+    """Уникальный источник хранилища. Папка Data/<Источник> удаляется после теста"""
+    source = f'Tests{uuid4().hex}'  # Источник хранилища
+    yield source
+    data_path = path.normpath(path.join(root, '..', 'Data'))  # Папка с данными всех источников
+    rmtree(path.join(data_path, source), ignore_errors=True)  # Удаляем хранилище теста
+    try:  # Пытаемся удалить папку с данными, если в ней больше ничего нет
+        rmdir(data_path)
+    except OSError:  # Если в папке есть данные других источников
+        pass  # то оставляем ее
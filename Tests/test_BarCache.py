@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+
+import pytest
+
+from FinLabPy.Core import BarCache, BarSeries, Symbol, bars_to_df  # Кэш бар, бары в колонках, тикер, перевод в pandas DataFrame
+from FinLabPy.Storage.FileStorage import FileStorage  # Файловое хранилище
+
+symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)  # Тикер для всех тестов
+
+
+def make_bars(dt_from, count, price=100.0):
+    """Минутные бары тикера подряд"""
+    return BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, 'M1', [(dt_from + timedelta(minutes=i), price + i, price + i + 1, price + i - 1, price + i, i) for i in range(count)])
+
+
+@pytest.fixture
+def storage(source):
+    storage = FileStorage(source)
+    storage.set_bars(make_bars(datetime(2025, 1, 6, 10), 5))
+    return storage
+
+
+def test_hit_after_miss(storage):
+    """Повторный запрос берется из кэша"""
+    cache = BarCache()
+    assert cache.get_bars(storage, symbol, 'M1').close.tolist() == [100.0, 101.0, 102.0, 103.0, 104.0]
+    assert cache.get_bars(storage, symbol, 'M1', datetime(2025, 1, 6, 10, 3)).close.tolist() == [103.0, 104.0]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_set_bars_appends(storage):
+    """Новые бары попадают и в кэш, и в хранилище"""
+    cache = BarCache()
+    cache.get_bars(storage, symbol, 'M1')
+    cache.set_bars(storage, make_bars(datetime(2025, 1, 6, 10, 4), 3, 200.0))
+    assert cache.get_bars(storage, symbol, 'M1').close.tolist() == [100.0, 101.0, 102.0, 103.0, 200.0, 201.0, 202.0]
+    assert storage.get_bars(symbol, 'M1').close.tolist() == [100.0, 101.0, 102.0, 103.0, 200.0, 201.0, 202.0]
+
+
+def test_cached_columns_read_only(storage):
+    """Колонки бар из кэша менять нельзя. При промахе и при попадании"""
+    cache = BarCache()
+    for _ in range(2):  # Промах, затем попадание
+        bars = cache.get_bars(storage, symbol, 'M1')
+        with pytest.raises(ValueError):
+            bars.close[0] = 0.0
+    cache.set_bars(storage, make_bars(datetime(2025, 1, 6, 10, 5), 1, 200.0))  # Колонки кэша копируются и дописываются
+    with pytest.raises(ValueError):
+        cache.get_bars(storage, symbol, 'M1').close[0] = 0.0
+
+
+def test_bars_to_df_is_a_copy(storage):
+    """DataFrame можно менять, бары в кэше при этом не меняются"""
+    cache = BarCache()
+    pd_bars = bars_to_df(cache.get_bars(storage, symbol, 'M1'))
+    pd_bars.loc[pd_bars.index[0], 'close'] = 0.0
+    pd_bars['volume'] = 0
+    assert cache.get_bars(storage, symbol, 'M1').close.tolist() == [100.0, 101.0, 102.0, 103.0, 104.0]
+    assert cache.get_bars(storage, symbol, 'M1').volume.tolist() == [0, 1, 2, 3, 4]
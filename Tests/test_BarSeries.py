@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+
+import numpy as np
+
+from FinLabPy.Core import Bar, BarSeries, bars_to_df, df_to_bars, Symbol  # Бар, бары в колонках, конвертация
+
+
+def make_bars(count, dt_from=datetime(2025, 1, 6, 10), price=100.0):
+    """Минутные бары подряд"""
+    return BarSeries.from_rows('TQBR', 'SBER', 'TQBR.SBER', 'M1', [(dt_from + timedelta(minutes=i), price + i, price + i + 1, price + i - 1, price + i, 10 * i) for i in range(count)])
+
+
+def test_from_rows_columns():
+    """Колонки с типами NumPy"""
+    bars = make_bars(3)
+    assert len(bars) == 3
+    assert bars.datetime.dtype == np.dtype('datetime64[ns]')
+    assert bars.open.dtype == np.float64 and bars.volume.dtype == np.int64
+    assert bars.close.tolist() == [100.0, 101.0, 102.0]
+
+
+def test_empty():
+    """Пустые бары"""
+    bars = BarSeries.from_rows('TQBR', 'SBER', 'TQBR.SBER', 'M1', [])
+    assert len(bars) == 0
+    assert list(bars) == []
+
+
+def test_getitem_bar():
+    """Один бар по номеру"""
+    bar = make_bars(3)[-1]
+    assert isinstance(bar, Bar)
+    assert bar.datetime == datetime(2025, 1, 6, 10, 2)
+    assert (bar.open, bar.high, bar.low, bar.close, bar.volume) == (102.0, 103.0, 101.0, 102.0, 20)
+    assert isinstance(bar.close, float) and isinstance(bar.volume, int)
+
+
+def test_from_bars_round_trip():
+    """Бары из списка бар совпадают с исходными"""
+    bars = make_bars(5)
+    restored = BarSeries.from_bars(list(bars))
+    assert np.array_equal(restored.datetime, bars.datetime)
+    assert np.array_equal(restored.close, bars.close)
+    assert (restored.dataname, restored.time_frame) == ('TQBR.SBER', 'M1')
+
+
+def test_between():
+    """Бары с ... по ... включительно"""
+    bars = make_bars(10)
+    selected = bars.between(datetime(2025, 1, 6, 10, 2), datetime(2025, 1, 6, 10, 5))
+    assert len(selected) == 4
+    assert selected[0].datetime == datetime(2025, 1, 6, 10, 2)
+    assert selected[-1].datetime == datetime(2025, 1, 6, 10, 5)
+    assert len(bars.between(datetime(2025, 1, 7))) == 0
+
+
+def test_append_after():
+    """Новые бары после текущих. Последний бар переписывается"""
+    bars = make_bars(3).append(make_bars(3, datetime(2025, 1, 6, 10, 2), 200.0))
+    assert len(bars) == 5
+    assert bars.close.tolist() == [100.0, 101.0, 200.0, 201.0, 202.0]
+
+
+def test_append_overlap():
+    """Новые бары внутри текущих заменяют их"""
+    bars = make_bars(5).append(make_bars(2, datetime(2025, 1, 6, 10, 1), 200.0))
+    assert len(bars) == 5
+    assert bars.close.tolist() == [100.0, 200.0, 201.0, 103.0, 104.0]
+    assert np.all(bars.datetime[1:] > bars.datetime[:-1])
+
+
+def test_df_round_trip():
+    """Перевод в pandas DataFrame и обратно"""
+    bars = make_bars(4)
+    pd_bars = bars_to_df(bars)
+    assert list(pd_bars.columns) == ['open', 'high', 'low', 'close', 'volume']
+    assert pd_bars.index.name == 'datetime'
+    symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)
+    restored = df_to_bars(pd_bars, symbol, 'M1')
+    assert np.array_equal(restored.datetime, bars.datetime)
+    assert np.array_equal(restored.volume, bars.volume)
+    assert bars_to_df(list(bars)).equals(pd_bars)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, time  # Работа с датой и временем
+
+import numpy as np
+import pytest
+
+from FinLabPy.Core import BarSeries  # Бары в колонках
+from FinLabPy.Schedule.MarketSchedule import Schedule, Session  # Расписание торгов биржи
+from FinLabPy.Schedule.BarValidator import BarValidator  # Проверка бар на соответствие условиям выборки
+
+schedule = Schedule([Session(time(0, 0, 0), time(23, 59, 59))], weekend_days=())  # Круглосуточное расписание без выходных, как у данных BackTrader по умолчанию
+
+
+def make_bars(seed=0):
+    """Минутные бары рабочих дней с дожи 4-х цен и барами из прошлого"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    dt = datetime(2025, 1, 6, 8)  # Понедельник
+    for _ in range(3000):
+        dt += timedelta(minutes=int(rng.integers(1, 4)))
+        if dt.weekday() >= 5:  # Выходные пропускаем
+            dt = datetime.combine(dt.date() + timedelta(days=7 - dt.weekday()), time(8))
+        bar_dt = dt - timedelta(minutes=30) if rng.random() < 0.02 else dt  # Иногда бар из прошлого
+        price = 100.0 + rng.normal()
+        high = price if rng.random() < 0.1 else price + 1  # Иногда дожи 4-х цен
+        rows.append((bar_dt, price, high, price - 1 if high != price else price, price, 1))
+    return BarSeries.from_rows('TQBR', 'SBER', 'TQBR.SBER', 'M1', rows)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},  # Параметры по умолчанию
+    {'session_start': time(10), 'session_end': time(18, 45)},  # Сессия
+    {'dt_from': datetime(2025, 1, 7, 12), 'dt_to': datetime(2025, 1, 8, 15), 'four_price_doji': True},  # Диапазон с дожи 4-х цен
+])
+def test_mask_matches_is_bar_valid(kwargs):
+    """Проверка всех бар сразу совпадает с проверкой по одному бару"""
+    bars = make_bars()
+    validator = BarValidator(schedule, 'M1', **kwargs)
+    expected = np.array([validator.is_bar_valid(bar) for bar in bars])
+    mask = BarValidator(schedule, 'M1', **kwargs).mask(bars)
+    assert 0 < mask.sum() < len(bars)
+    assert np.array_equal(mask, expected)
+
+
+def test_validate_keeps_type():
+    """Бары в колонках и pandas DataFrame проверяются одинаково"""
+    bars = make_bars(1)
+    validated = BarValidator(schedule, 'M1', session_start=time(10)).validate(bars)
+    pd_validated = BarValidator(schedule, 'M1', session_start=time(10)).validate(bars.to_df())
+    assert isinstance(validated, BarSeries)
+    assert np.array_equal(validated.datetime, pd_validated.index.to_numpy())
+
+
+def test_mask_continues_after_last_bar():
+    """Следующая проверка отбрасывает бары не позже последнего закрытого бара"""
+    bars = make_bars(2)
+    validator = BarValidator(schedule, 'M1')
+    validator.mask(bars[:100])
+    assert not validator.mask(bars[50:100]).any()
+    assert validator.dt_last_open == bars[:100].datetime.max().astype('datetime64[us]').item()
+
+
+def test_future_bar_not_closed():
+    """Бар, время закрытия которого еще не наступило, не проходит проверку"""
+    dt_open = datetime(2100, 1, 4, 10)  # Понедельник в будущем
+    bars = BarSeries.from_rows('TQBR', 'SBER', 'TQBR.SBER', 'M1', [(dt_open, 100.0, 101.0, 99.0, 100.0, 1)])
+    assert not BarValidator(schedule, 'M1').mask(bars).any()
+    assert not BarValidator(schedule, 'M1').is_bar_valid(bars[0])
@@ -0,0 +1,76 @@
+from datetime import date, datetime, timedelta  # Работа с датой и временем
+
+import backtrader as bt
+import pytest
+
+from FinLabPy.Core import Bar, BarSeries, Event, Symbol  # Бар, бары в колонках, событие, тикер
+from FinLabPy.BackTrader import Store, Data  # Хранилище и данные BackTrader
+
+symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)  # Тикер для всех тестов
+
+
+class FakeBroker:
+    """Брокер без подключения. История - 5 минутных бар, новые бары - по подписке"""
+    code = 'Fake'
+
+    def __init__(self):
+        self.on_new_bar = Event()  # Новый бар
+        rows = [(datetime(2025, 1, 6, 10) + timedelta(minutes=i), 100.0 + i, 101.0 + i, 99.0 + i, 100.0 + i, 1) for i in range(5)]
+        self.history = BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, 'M1', rows)
+
+    def get_symbol_by_dataname(self, dataname): return symbol
+
+    def get_history(self, _, time_frame, dt_from=None, dt_to=None): return self.history.between(dt_from, dt_to)
+
+    def subscribe_history(self, _, time_frame):
+        for i in range(5, 7):  # Два новых бара сразу после подписки
+            dt = datetime(2025, 1, 6, 10) + timedelta(minutes=i)
+            self.on_new_bar.trigger(Bar(symbol.board, symbol.symbol, symbol.dataname, time_frame, dt, 100.0 + i, 101.0 + i, 99.0 + i, 100.0 + i, 1))
+
+    def unsubscribe_history(self, _, time_frame): pass
+
+    def close(self): pass
+
+
+class CloseCollector(bt.Strategy):
+    """Собирает цены закрытия. Останавливается после заданного кол-ва бар"""
+    params = (('stop_after', None),)
+
+    def __init__(self):
+        self.closes = []
+
+    def next(self):
+        self.closes.append(self.data.close[0])
+        if self.p.stop_after is not None and len(self.closes) >= self.p.stop_after:
+            self.env.runstop()
+
+
+@pytest.fixture(autouse=True)
+def new_store():
+    Store._singleton = None  # Хранилище BackTrader - один экземпляр на процесс. Для каждого теста создаем новое
+    yield
+    Store._singleton = None
+
+
+def run(**kwargs):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(Data(dataname=symbol.dataname, timeframe=bt.TimeFrame.Minutes, compression=1, broker=FakeBroker(), **kwargs))
+    cerebro.addstrategy(CloseCollector, stop_after=kwargs.get('live_bars') and 7 or None)
+    return cerebro.run()[0].closes
+
+
+def test_default_params():
+    """Данные с параметрами по умолчанию (без сессии и диапазона) отдают всю историю"""
+    assert run() == [100.0, 101.0, 102.0, 103.0, 104.0]
+
+
+def test_session_and_date_range():
+    """Дата диапазона без времени и время сессии берутся из параметров, заполненных BackTrader"""
+    assert run(fromdate=date(2025, 1, 6), sessionend=datetime(2025, 1, 6, 10, 4).time()) == [100.0, 101.0, 102.0, 103.0]
+    Store._singleton = None
+    assert run(fromdate=datetime(2025, 1, 6, 10, 2), todate=date(2025, 1, 6)) == [102.0, 103.0, 104.0]
+
+
+def test_live_bars():
+    """Новые бары проверяются по одному после истории"""
+    assert run(live_bars=True, qcheck=0.1) == [100.0, 101.0, 102.0, 103.0, 104.0, 105.0, 106.0]
@@ -0,0 +1,59 @@
+from datetime import date, datetime, timedelta, time  # Работа с датой и временем
+
+from FinLabPy.Schedule.MarketSchedule import Schedule, Session  # Расписание торгов биржи
+from FinLabPy.Schedule.MOEX import Stocks  # Расписание торгов акций Московской Биржи
+
+sessions = [Session(time(10, 0, 0), time(13, 59, 59)), Session(time(14, 5, 0), time(18, 49, 59))]  # Две сессии с перерывом
+
+
+def test_weekends_by_default():
+    """По умолчанию суббота и воскресенье без торгов"""
+    schedule = Schedule(sessions)
+    assert schedule.trade_dates(date(2025, 1, 10), date(2025, 1, 13)) == [date(2025, 1, 10), date(2025, 1, 13)]  # Пятница и понедельник
+    assert schedule.trade_session(datetime(2025, 1, 11, 12)) is None
+    assert schedule.last_session_time_end(datetime(2025, 1, 13, 9)) == datetime(2025, 1, 10, 18, 49, 59)  # Утро понедельника - окончание пятницы
+    assert schedule.time_until_trade(datetime(2025, 1, 11, 12)) == datetime(2025, 1, 13, 10) - datetime(2025, 1, 11, 12)  # Суббота днем - до первой сессии понедельника
+
+
+def test_weekend_sessions():
+    """Расписание с торгами выходного дня"""
+    schedule = Schedule(sessions, weekend_days=())
+    assert schedule.trade_dates(date(2025, 1, 10), date(2025, 1, 13)) == [date(2025, 1, 10), date(2025, 1, 11), date(2025, 1, 12), date(2025, 1, 13)]
+    assert schedule.trade_session(datetime(2025, 1, 11, 12)) is sessions[0]
+    assert schedule.last_session_time_end(datetime(2025, 1, 13, 9)) == datetime(2025, 1, 12, 18, 49, 59)
+    assert schedule.trade_bar_open_datetime(datetime(2025, 1, 11, 12, 0, 30), 'M1') == datetime(2025, 1, 11, 12)
+    windows = schedule.trade_windows(datetime(2025, 1, 10), datetime(2025, 1, 13, 23, 59), 'M1', timedelta(days=1))
+    assert [dt_begin.date() for dt_begin, _ in windows] == [date(2025, 1, 10), date(2025, 1, 11), date(2025, 1, 12), date(2025, 1, 13)]
+
+
+def test_holidays():
+    """Праздники пропускаются так же, как выходные"""
+    schedule = Schedule(sessions, holidays=[date(2025, 1, 13)])
+    schedule.add_holidays([date(2025, 1, 14)])
+    assert schedule.trade_dates(date(2025, 1, 10), date(2025, 1, 15)) == [date(2025, 1, 10), date(2025, 1, 15)]
+    assert schedule.trade_session(datetime(2025, 1, 14, 12)) is None
+    assert schedule.last_session_time_end(datetime(2025, 1, 15, 9)) == datetime(2025, 1, 10, 18, 49, 59)
+    assert schedule.time_until_trade(datetime(2025, 1, 10, 19)) == datetime(2025, 1, 15, 10) - datetime(2025, 1, 10, 19)
+    assert schedule.trade_bar_open_datetime(datetime(2025, 1, 14, 12), 'D1') == datetime(2025, 1, 10)
+    windows = schedule.trade_windows(datetime(2025, 1, 10), datetime(2025, 1, 15, 23, 59), 'M1', timedelta(days=1))
+    assert [dt_begin.date() for dt_begin, _ in windows] == [date(2025, 1, 10), date(2025, 1, 15)]
+
+
+def test_weekend_sessions_from_date():
+    """Сессии выходного дня со своим временем начинаются с заданной даты"""
+    weekend_session = Session(time(10, 0, 0), time(18, 59, 59))
+    schedule = Schedule(sessions, weekend_sessions=[weekend_session], weekend_from=date(2025, 3, 1))
+    assert schedule.trade_dates(date(2025, 2, 21), date(2025, 3, 3)) == [date(2025, 2, 21), date(2025, 2, 24), date(2025, 2, 25), date(2025, 2, 26), date(2025, 2, 27), date(2025, 2, 28), date(2025, 3, 1), date(2025, 3, 2), date(2025, 3, 3)]
+    assert schedule.trade_session(datetime(2025, 3, 1, 18, 55)) is weekend_session
+    assert schedule.trade_session(datetime(2025, 3, 1, 9, 0)) is None
+    assert schedule.last_session_time_end(datetime(2025, 3, 3, 9)) == datetime(2025, 3, 2, 18, 59, 59)  # Утро понедельника - окончание сессии воскресенья
+    assert schedule.time_until_trade(datetime(2025, 2, 28, 19)) == datetime(2025, 3, 1, 10) - datetime(2025, 2, 28, 19)
+    windows = schedule.trade_windows(datetime(2025, 3, 1), datetime(2025, 3, 1, 23, 59), 'M1', timedelta(days=1))
+    assert windows == [(datetime(2025, 3, 1, 10), datetime(2025, 3, 1, 18, 59, 59))]
+
+
+def test_moex_stocks_weekends():
+    """Акции Московской Биржи по умолчанию не торгуются в выходные. Сессии выходного дня включаются явно"""
+    assert Stocks().trade_dates(date(2025, 3, 7), date(2025, 3, 10)) == [date(2025, 3, 7), date(2025, 3, 10)]
+    assert Stocks(weekend=True).trade_dates(date(2025, 3, 7), date(2025, 3, 10)) == [date(2025, 3, 7), date(2025, 3, 8), date(2025, 3, 9), date(2025, 3, 10)]
+    assert Stocks(weekend=True).trade_dates(date(2024, 3, 8), date(2024, 3, 11)) == [date(2024, 3, 8), date(2024, 3, 11)]  # До 01.03.2025 сессий выходного дня не было
@@ -0,0 +1,40 @@
+from FinLabPy.Core import Order, OrderRegistry  # Заявка, справочник заявок
+
+
+def make_order(order_id):
+    """Лимитная заявка на покупку"""
+    return Order(None, order_id, True, Order.Limit, 'TQBR.SBER', 2, 10, 300.0)
+
+
+def test_lookup_by_numbers():
+    """Заявка находится по ключу, номеру заявки на бирже и номеру транзакции. Номера сравниваются как строки"""
+    registry = OrderRegistry()
+    order = make_order('1')
+    registry.add(1, order, trans_id=1)
+    assert registry.get_by_trans_id('1') is order and registry.get_by_order_id(100) is None
+    registry.set_order_id('1', 100)
+    assert registry.get_by_order_id('100') is order
+    registry.set_trans_id(1, 2)  # Транзакция снятия
+    assert registry.get_by_trans_id(2) is order
+    assert [registry.get_key(number) for number in (1, 100, 2, 3)] == ['1', '1', '1', None]
+    assert len(registry) == 1 and 1 in registry and registry[1] is order
+
+
+def test_remove_clears_indexes():
+    """Удаление заявки удаляет все ее номера, связанные и дочерние заявки"""
+    registry = OrderRegistry()
+    parent, child = make_order('1'), make_order('2')
+    registry.add(1, parent, order_id=100, trans_id=1)
+    registry.set_trans_id(1, 3)
+    registry.add(2, child, order_id=200, trans_id=2)
+    registry.set_oco(1, 2)
+    registry.add_child(1, parent)
+    registry.add_child(1, child)
+    assert registry.get_oco(1) == '2' and registry.get_oco_refs(2) == ['1'] and registry.get_children(1) == [parent, child]
+    registry.remove(1)
+    assert 1 not in registry and registry.get_by_order_id(100) is None and registry.get_by_trans_id(1) is None and registry.get_by_trans_id(3) is None
+    assert registry.get_oco(1) is None and registry.get_oco_refs(2) == [] and registry.get_children(1) is None
+    assert registry.get_by_order_id(200) is child and registry.values() == [child]
+    assert registry.order_ids == {'200': '2'} and registry.trans_ids == {'2': '2'} and list(registry.numbers) == ['2']
+    registry.remove(1)  # Повторное удаление ничего не делает
+    assert len(registry) == 1
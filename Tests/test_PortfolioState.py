@@ -0,0 +1,70 @@
+from datetime import datetime  # Работа с датой и временем
+
+import pytest
+
+from FinLabPy.Core import Event, Trade, Position  # Событие, сделка, позиция
+from FinLabPy.BackTrader.Broker import PortfolioState  # Состояние портфеля
+
+
+class FakeBroker:
+    """Брокер без подключения. Портфель задается в тесте. Во время запроса свободных средств может прийти сделка"""
+    code = 'Б'
+
+    def __init__(self, cash, value, positions=()):
+        self.on_trade, self.on_position = Event(), Event()
+        self.cash, self.value, self.positions = cash, value, list(positions)
+        self.trade_during_request: Trade | None = None  # Сделка, которая придет по подписке во время следующего запроса
+
+    def get_cash(self):
+        if self.trade_during_request is not None:
+            trade, self.trade_during_request = self.trade_during_request, None
+            self.on_trade.trigger(trade)
+        return self.cash
+
+    def get_value(self): return self.value
+
+    def get_positions(self): return self.positions
+
+
+def make_trade(broker, dataname, quantity, price):
+    return Trade(broker, '1', dataname, dataname, 2, datetime(2025, 1, 6, 10), quantity, price)
+
+
+@pytest.fixture
+def portfolio():
+    portfolio = PortfolioState(FakeBroker(100_000.0, 100_000.0), reconcile_seconds=0)
+    portfolio.start()
+    yield portfolio
+    portfolio.stop()
+
+
+def test_stock_trade_moves_cash(portfolio):
+    """Покупка акций уменьшает свободные средства, стоимость портфеля не меняется"""
+    portfolio.broker.on_trade.trigger(make_trade(portfolio.broker, 'TQBR.SBER', 100, 300.0))
+    assert portfolio.cash == pytest.approx(70_000.0)
+    assert portfolio.value == pytest.approx(100_000.0)
+
+
+def test_futures_trade_keeps_cash(portfolio):
+    """Покупка фьючерса не списывает стоимость контрактов. Стоимость портфеля меняется только с ценой"""
+    broker = portfolio.broker
+    broker.on_trade.trigger(make_trade(broker, 'SPBFUT.SiH5', 10, 100_000.0))
+    assert portfolio.cash == pytest.approx(100_000.0)
+    assert portfolio.value == pytest.approx(100_000.0)
+    broker.on_position.trigger(Position(broker, 'SPBFUT.SiH5', 'SiH5', 0, 10, 100_000.0, 100_050.0))  # Цена выросла на 50
+    assert portfolio.value == pytest.approx(100_500.0)
+    broker.on_trade.trigger(make_trade(broker, 'SPBFUT.SiH5', -10, 100_050.0))  # Закрываем позицию
+    broker.on_position.trigger(Position(broker, 'SPBFUT.SiH5', 'SiH5', 0, 0, 0.0, 100_050.0))
+    assert portfolio.value == pytest.approx(100_500.0)
+
+
+def test_reconcile_keeps_trades_during_requests(portfolio):
+    """Сделка, пришедшая во время запросов к брокеру, не теряется. Сверка повторяется"""
+    broker = portfolio.broker
+    broker.trade_during_request = make_trade(broker, 'TQBR.SBER', 100, 300.0)  # Снимок брокера ее еще не учитывает
+    assert not portfolio.reconcile()
+    assert portfolio.cash == pytest.approx(70_000.0)
+    broker.cash = 70_000.0  # Теперь брокер учел сделку
+    broker.positions = [Position(broker, 'TQBR.SBER', 'SBER', 2, 100, 300.0, 300.0)]
+    assert portfolio.reconcile()
+    assert (portfolio.cash, portfolio.value, portfolio.drift) == (pytest.approx(70_000.0), pytest.approx(100_000.0), pytest.approx(0.0))
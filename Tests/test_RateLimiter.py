@@ -0,0 +1,51 @@
+from time import perf_counter  # Замер ожидания
+from threading import Thread  # Одновременные запросы
+
+import pytest
+
+from FinLabPy.Core import RateLimiter  # Ограничение частоты запросов
+
+
+def test_burst_without_wait():
+    """Пачка запросов в пределах корзины проходит без ожидания, следующий запрос ждет маркер"""
+    limiter = RateLimiter({RateLimiter.MarketData: (20, 3)})
+    assert [limiter.acquire(RateLimiter.MarketData) for _ in range(3)] == [0.0, 0.0, 0.0]
+    dt_start = perf_counter()
+    wait = limiter.acquire(RateLimiter.MarketData)
+    assert wait == pytest.approx(0.05, abs=0.01)
+    assert perf_counter() - dt_start >= 0.04
+
+
+def test_endpoints_independent():
+    """Классы запросов не делят бюджет. Класс без бюджета не ограничивается"""
+    limiter = RateLimiter({RateLimiter.MarketData: (1, 1), RateLimiter.Orders: (1, 1)})
+    assert limiter.acquire(RateLimiter.MarketData) == 0.0
+    assert limiter.acquire(RateLimiter.Orders) == 0.0
+    assert all(limiter.acquire(RateLimiter.Portfolio) == 0.0 for _ in range(100))
+
+
+def test_concurrent_requests_queue():
+    """Одновременные запросы встают в очередь и не превышают бюджет"""
+    limiter = RateLimiter({RateLimiter.MarketData: (50, 5)})
+    threads = [Thread(target=limiter.acquire, args=(RateLimiter.MarketData,)) for _ in range(25)]
+    dt_start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert perf_counter() - dt_start >= (25 - 5) / 50 * 0.9  # 5 запросов пачкой, остальные 20 по 50 в секунду
+    stats = limiter.stats()[RateLimiter.MarketData]
+    assert stats['requests'] == 25
+    assert stats['waits'] >= 15  # Потоки стартуют не одновременно, часть маркеров успевает поступить
+    assert stats['wait_max'] == pytest.approx(20 / 50, abs=0.1)
+
+
+def test_bucket_refills():
+    """Корзина пополняется со временем, но не больше своего размера"""
+    limiter = RateLimiter()
+    limiter.set_budget(RateLimiter.Orders, 1000, 2)
+    limiter.acquire(RateLimiter.Orders, 2)
+    limiter.acquire(RateLimiter.Orders)  # Ждем маркер
+    limiter.buckets[RateLimiter.Orders][3] -= 10  # Прошло 10 секунд
+    assert [limiter.acquire(RateLimiter.Orders) for _ in range(2)] == [0.0, 0.0]
+    assert limiter.acquire(RateLimiter.Orders) > 0
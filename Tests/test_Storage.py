@@ -0,0 +1,213 @@
+from datetime import date, datetime, timedelta  # Работа с датой и временем
+from os import listdir  # Файлы колонок
+
+import numpy as np
+import pytest
+
+from FinLabPy.Core import BarSeries, Symbol  # Бары в колонках, тикер
+from FinLabPy.Storage.FileStorage import FileStorage  # Файловое хранилище
+from FinLabPy.Storage.BinaryStorage import BinaryStorage  # Хранилище в двоичных файлах
+from FinLabPy.Storage.SQLiteStorage import SQLiteStorage  # Хранилище в базе данных SQLite
+
+symbol = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)  # Тикер для всех тестов
+
+
+def make_bars(dt_from, count, price=100.0, minutes=1):
+    """Бары тикера подряд с интервалом в минутах"""
+    return BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, 'M1', [(dt_from + timedelta(minutes=minutes * i), price + i, price + i + 1, price + i - 1, price + i, i) for i in range(count)])
+
+
+def assert_bars_equal(bars, expected):
+    """Бары совпадают по всем колонкам"""
+    assert bars is not None and len(bars) == len(expected)
+    for name in ('datetime', 'open', 'high', 'low', 'close', 'volume'):
+        assert np.array_equal(getattr(bars, name), getattr(expected, name)), name
+
+
+@pytest.fixture
+def file_storage(source):
+    return FileStorage(source)
+
+
+@pytest.fixture
+def binary_storage(source):
+    return BinaryStorage(source)
+
+
+@pytest.fixture
+def sqlite_storage(source):
+    storage = SQLiteStorage(source)
+    yield storage
+    storage._connection().close()  # Закрываем подключение, чтобы удалить файл базы данных
+
+
+def test_file_round_trip(file_storage):
+    """Сохраненные бары читаются без изменений"""
+    bars = make_bars(datetime(2025, 1, 6, 10), 5)
+    file_storage.set_bars(bars)
+    assert_bars_equal(file_storage.get_bars(symbol, 'M1'), bars)
+
+
+def test_file_append(file_storage):
+    """Новые бары дописываются в конец файла, последний бар переписывается"""
+    file_storage.set_bars(make_bars(datetime(2025, 1, 6, 10), 5))
+    file_storage.set_bars(make_bars(datetime(2025, 1, 6, 10, 4), 3, 200.0))
+    bars = file_storage.get_bars(symbol, 'M1')
+    assert len(bars) == 7
+    assert bars.close.tolist() == [100.0, 101.0, 102.0, 103.0, 200.0, 201.0, 202.0]
+
+
+def test_file_overlap(file_storage):
+    """Бары внутри файла заменяют сохраненные. Файл переписывается целиком"""
+    file_storage.set_bars(make_bars(datetime(2025, 1, 6, 10), 5))
+    file_storage.set_bars(make_bars(datetime(2025, 1, 6, 10, 1), 2, 200.0))
+    bars = file_storage.get_bars(symbol, 'M1')
+    assert bars.close.tolist() == [100.0, 200.0, 201.0, 103.0, 104.0]
+    assert (bars.board, bars.symbol, bars.dataname) == (symbol.board, symbol.symbol, symbol.dataname)
+
+
+def test_file_day_index(file_storage):
+    """Индекс по дням совпадает с первыми строками дней, бары с ... по ... - с отбором из всего файла"""
+    rows = []  # Строки бар разных дней разной длины
+    for day in range(12):  # 12 дней подряд вместе с выходными
+        dt_day = datetime(2025, 1, 1 + day, 10)
+        rows.extend((dt_day + timedelta(minutes=i), 100.0, 101.0, 99.0, 100.0, i) for i in range(1 + day * day * 7 % 50))
+    bars = BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, 'M1', rows)
+    file_storage.set_bars(bars)
+    filename = f'{file_storage.datapath}{symbol.dataname}_M1.txt'
+    _, days, offsets = file_storage._get_index(filename)
+    with open(filename, 'rb') as file:
+        lines = file.read().split(b'\n')[1:-1]  # Строки бар без заголовка
+    expected_days, expected_offsets, offset = [], [], len(b'datetime\topen\thigh\tlow\tclose\tvolume\n')  # Первые строки дней перебором
+    for line in lines:
+        day = datetime.strptime(line[:10].decode(), '%d.%m.%Y')
+        if len(expected_days) == 0 or expected_days[-1] != file_storage._day_key(day):
+            expected_days.append(file_storage._day_key(day))
+            expected_offsets.append(offset)
+        offset += len(line) + 1
+    assert days.tolist() == expected_days
+    assert offsets.tolist() == expected_offsets
+    for dt_from, dt_to in ((datetime(2025, 1, 3, 10, 5), datetime(2025, 1, 7, 10, 2)), (None, datetime(2025, 1, 1, 10)), (datetime(2025, 1, 12), None)):
+        assert_bars_equal(file_storage.get_bars(symbol, 'M1', dt_from, dt_to), bars.between(dt_from, dt_to))
+    file_storage.set_bars(make_bars(datetime(2025, 1, 12, 10, 20), 30))  # Дописываем бары. Индекс дополняется с последнего дня
+    _, days, _ = file_storage._get_index(filename)
+    assert days.tolist() == expected_days
+    assert_bars_equal(file_storage.get_bars(symbol, 'M1', datetime(2025, 1, 12)), file_storage.get_bars(symbol, 'M1').between(datetime(2025, 1, 12)))
+
+
+def test_binary_round_trip(binary_storage):
+    """Сохраненные бары читаются без изменений, с ... по ... - с отбором"""
+    bars = make_bars(datetime(2025, 1, 6, 10), 10)
+    binary_storage.set_bars(bars)
+    assert_bars_equal(binary_storage.get_bars(symbol, 'M1'), bars)
+    assert_bars_equal(binary_storage.get_bars(symbol, 'M1', datetime(2025, 1, 6, 10, 3), datetime(2025, 1, 6, 10, 5)), bars[3:6])
+
+
+def test_binary_append(binary_storage):
+    """Новые бары дописываются в конец файлов. Обновленный последний бар пишется в новое поколение, не меняя полученные раньше бары"""
+    binary_storage.set_bars(make_bars(datetime(2025, 1, 6, 10), 5))
+    bars_path = binary_storage._bars_path(symbol.dataname, 'M1')
+    binary_storage.set_bars(make_bars(datetime(2025, 1, 6, 10), 7)[4:])  # Последний бар без изменений и 2 новых бара
+    assert binary_storage._generation(bars_path) == 0  # Только дописали
+    old_bars = binary_storage.get_bars(symbol, 'M1')  # Колонки, отображенные на файлы
+    binary_storage.set_bars(make_bars(datetime(2025, 1, 6, 10, 6), 3, 200.0))  # Обновленный последний бар и новые бары
+    assert binary_storage._generation(bars_path) == 1
+    assert old_bars.close.tolist() == [100.0, 101.0, 102.0, 103.0, 104.0, 105.0, 106.0]
+    bars = binary_storage.get_bars(symbol, 'M1')
+    assert bars.close.tolist() == [100.0, 101.0, 102.0, 103.0, 104.0, 105.0, 200.0, 201.0, 202.0]
+
+
+def test_binary_overlap_keeps_mapped_bars(binary_storage):
+    """Объединение пересекающихся бар не меняет бары, полученные раньше"""
+    binary_storage.set_bars(make_bars(datetime(2025, 1, 6, 10), 5))
+    old_bars = binary_storage.get_bars(symbol, 'M1')  # Колонки, отображенные на файлы
+    binary_storage.set_bars(make_bars(datetime(2025, 1, 6, 9, 58), 4, 200.0))  # Бары до и внутри сохраненных
+    assert old_bars.close.tolist() == [100.0, 101.0, 102.0, 103.0, 104.0]
+    assert old_bars.datetime[0] == np.datetime64(datetime(2025, 1, 6, 10), 'ns')
+    bars = binary_storage.get_bars(symbol, 'M1')
+    assert bars.close.tolist() == [200.0, 201.0, 202.0, 203.0, 102.0, 103.0, 104.0]
+    binary_storage.set_bars(make_bars(datetime(2025, 1, 6, 10, 5), 2, 300.0))  # Дописываем в новое поколение
+    binary_storage.set_bars(make_bars(datetime(2025, 1, 6, 9, 50), 1, 400.0))  # Еще одна смена поколения
+    bars = binary_storage.get_bars(symbol, 'M1')
+    assert bars.close.tolist() == [400.0, 200.0, 201.0, 202.0, 203.0, 102.0, 103.0, 104.0, 300.0, 301.0]
+    bars_path = binary_storage._bars_path(symbol.dataname, 'M1')
+    assert sorted(filename for filename in listdir(bars_path) if filename.endswith('.bin')) == sorted(f'{name}.2.bin' for name in BinaryStorage.columns)  # Старые поколения удалены
+
+
+def test_sqlite_round_trip(sqlite_storage):
+    """Сохраненные бары читаются без изменений, с ... по ... - с отбором"""
+    bars = make_bars(datetime(2025, 1, 6, 10), 10)
+    sqlite_storage.set_bars(bars)
+    assert_bars_equal(sqlite_storage.get_bars(symbol, 'M1'), bars)
+    assert_bars_equal(sqlite_storage.get_bars(symbol, 'M1', datetime(2025, 1, 6, 10, 3), datetime(2025, 1, 6, 10, 5)), bars[3:6])
+    assert sqlite_storage.get_bars(symbol, 'D1') is None
+
+
+def test_sqlite_upsert(sqlite_storage):
+    """Бары на ту же дату и время заменяются новыми"""
+    sqlite_storage.set_bars(make_bars(datetime(2025, 1, 6, 10), 5))
+    sqlite_storage.set_bars(make_bars(datetime(2025, 1, 6, 10, 1), 2, 200.0))
+    bars = sqlite_storage.get_bars(symbol, 'M1')
+    assert bars.close.tolist() == [100.0, 200.0, 201.0, 103.0, 104.0]
+
+
+def test_sqlite_symbols(source):
+    """Спецификации тикеров сохраняются в базе данных"""
+    storage = SQLiteStorage(source)
+    storage.set_symbol(Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10, {'figi': 'BBG004730N88'}))
+    storage._connection().close()
+    storage = SQLiteStorage(source)  # Новое подключение читает спецификации из базы данных
+    loaded = storage.get_symbol('TQBR.SBER')
+    storage._connection().close()
+    assert (loaded.board, loaded.symbol, loaded.decimals, loaded.min_step, loaded.lot_size, loaded.broker_info) == ('TQBR', 'SBER', 2, 0.01, 10, {'figi': 'BBG004730N88'})
+
+
+@pytest.mark.parametrize('storage_cls', [FileStorage, BinaryStorage, SQLiteStorage])
+def test_empty_days_persist(source, storage_cls):
+    """Дни без бар у провайдера читаются новым экземпляром хранилища"""
+    storage = storage_cls(source)
+    storage.add_empty_days(symbol.dataname, 'M1', [date(2025, 1, 8), date(2025, 1, 1)])
+    storage.add_empty_days(symbol.dataname, 'M1', [date(2025, 1, 8)])  # Повторно день не добавляется
+    if isinstance(storage, SQLiteStorage):
+        storage._connection().close()
+    storage = storage_cls(source)  # Как в следующем запуске программы
+    assert storage.get_empty_days(symbol.dataname, 'M1') == {date(2025, 1, 1), date(2025, 1, 8)}
+    assert storage.get_empty_days(symbol.dataname, 'D1') == set()
+    if isinstance(storage, SQLiteStorage):
+        storage._connection().close()
+
+
+def test_symbols_saved_in_one_write(source, monkeypatch):
+    """Спецификации, полученные подряд, сохраняются в файл одной записью и загружаются новым хранилищем"""
+    storage = FileStorage(source)
+    writes = []  # Записи файла спецификаций
+    save_symbols = storage._save_symbols
+    monkeypatch.setattr(storage, '_save_symbols', lambda: (writes.append(len(storage.symbols)), save_symbols()))
+    for i in range(100):  # Загружаем 100 тикеров с нуля
+        storage.set_symbol(Symbol('TQBR', f'T{i}', f'TQBR.T{i}', f'Тикер {i}', 2, 0.01, 1, {'figi': f'F{i}'}))
+    assert writes == []  # Сохранение отложено
+    storage.save_symbols()
+    assert writes == [100]
+    storage.save_symbols()  # Несохраненных спецификаций нет
+    assert writes == [100]
+    loaded = FileStorage(source).get_symbol('TQBR.T42')
+    assert (loaded.description, loaded.broker_info) == ('Тикер 42', {'figi': 'F42'})
+
+
+def test_symbols_saved_after_delay(source, monkeypatch):
+    """Отложенное сохранение выполняется само"""
+    monkeypatch.setattr(FileStorage, 'symbols_save_delay', 0.01)
+    storage = FileStorage(source)
+    storage.set_symbol(symbol)
+    storage.symbols_timer.join()  # Ждем отложенного сохранения
+    assert storage.symbols_timer is None
+    assert FileStorage(source).get_symbol(symbol.dataname) is not None
+
+
+def test_symbol_broker_info_not_json(source):
+    """Информация брокера, которую нельзя сохранить в JSON, не подменяется строкой"""
+    storage = FileStorage(source)
+    with pytest.raises(TypeError):
+        storage.set_symbol(Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10, {'first_day': datetime(2020, 1, 1)}))
+    assert storage.get_symbol('TQBR.SBER') is None
+    assert storage.symbols_timer is None
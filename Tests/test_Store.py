@@ -0,0 +1,70 @@
+from datetime import datetime  # Работа с датой и временем
+from time import perf_counter  # Замер ожидания
+from threading import Timer  # Бар из другого потока
+from types import SimpleNamespace  # Брокер без подключения
+
+import pytest
+
+from FinLabPy.Core import Bar, Event  # Бар, событие
+from FinLabPy.BackTrader import Store  # Хранилище BackTrader
+
+
+def make_bar(dataname, minute=0):
+    board, symbol = dataname.split('.')
+    return Bar(board, symbol, dataname, 'M1', datetime(2025, 1, 6, 10, minute), 100.0, 101.0, 99.0, 100.0, 1)
+
+
+@pytest.fixture
+def store():
+    Store._singleton = None  # Хранилище BackTrader - один экземпляр на процесс. Для каждого теста создаем новое
+    store = Store(broker=SimpleNamespace(on_new_bar=Event()))
+    yield store
+    Store._singleton = None
+
+
+def test_get_bar_in_order(store):
+    """Бары тикера забираются по порядку"""
+    store.add_consumer('TQBR.SBER', 'M1')
+    for minute in range(3):
+        store.put_bar(make_bar('TQBR.SBER', minute))
+    assert store.has_bars('TQBR.SBER', 'M1')
+    assert [store.get_bar('TQBR.SBER', 'M1').datetime.minute for _ in range(3)] == [0, 1, 2]
+    assert store.get_bar('TQBR.SBER', 'M1') is None
+    assert store.new_bars_count == 0
+
+
+def test_bar_without_consumer_dropped(store):
+    """Бар, который не забирают данные, не попадает в очередь и не отменяет ожидание"""
+    store.add_consumer('TQBR.SBER', 'M1')
+    store.put_bar(make_bar('TQBR.GAZP'))  # Бар по другой подписке
+    assert store.new_bars_count == 0
+    dt_start = perf_counter()
+    assert store.get_bar('TQBR.SBER', 'M1', 0.2) is None
+    assert perf_counter() - dt_start >= 0.15  # Ждали, а не крутились
+
+
+def test_wait_wakes_on_new_bar(store):
+    """Ожидание прерывается новым баром"""
+    store.add_consumer('TQBR.SBER', 'M1')
+    Timer(0.05, store.put_bar, (make_bar('TQBR.SBER'),)).start()
+    dt_start = perf_counter()
+    assert store.get_bar('TQBR.SBER', 'M1', 5) is not None
+    assert perf_counter() - dt_start < 1
+
+
+def test_remove_consumer_drops_queue(store):
+    """Бары остановленных данных удаляются, ожидание других данных снова работает"""
+    store.add_consumer('TQBR.SBER', 'M1')
+    store.add_consumer('TQBR.GAZP', 'M1')
+    store.add_consumer('TQBR.GAZP', 'M1')  # Вторые данные по тому же тикеру
+    store.put_bar(make_bar('TQBR.GAZP'))
+    store.remove_consumer('TQBR.GAZP', 'M1')
+    assert store.has_bars('TQBR.GAZP', 'M1')  # Бары еще забирают вторые данные
+    store.remove_consumer('TQBR.GAZP', 'M1')
+    assert not store.has_bars('TQBR.GAZP', 'M1')
+    assert store.new_bars_count == 0
+    store.put_bar(make_bar('TQBR.GAZP', 1))
+    assert store.new_bars_count == 0
+    dt_start = perf_counter()
+    assert store.get_bar('TQBR.SBER', 'M1', 0.2) is None
+    assert perf_counter() - dt_start >= 0.15
@@ -0,0 +1,89 @@
+from datetime import date, datetime, timedelta  # Работа с датой и временем
+
+import pytest
+
+from FinLabPy.Core import Broker, BarSeries, Symbol, bar_cache  # Брокер, бары в колонках, тикер, кэш бар
+
+symbol = Symbol('TQOB', 'SU26238RMFS4', 'TQOB.SU26238RMFS4', 'ОФЗ 26238', 2, 0.001, 1)  # Облигации. Расписание торгов известно
+days = [date(2025, 1, 6), date(2025, 1, 7), date(2025, 1, 9), date(2025, 1, 10)]  # 08.01.2025 у провайдера бар нет
+dt_to = datetime(2025, 1, 10, 23)  # Окончание истории
+
+
+def make_bars(trade_days):
+    """Минутные бары с 10:00 по 10:04 в каждый день"""
+    return BarSeries.from_rows(symbol.board, symbol.symbol, symbol.dataname, 'M1', [(datetime.combine(d, datetime.min.time()) + timedelta(hours=10, minutes=i), 100.0, 101.0, 99.0, 100.0, 1) for d in trade_days for i in range(5)])
+
+
+class FakeBroker(Broker):
+    """Брокер без подключения. Запросы истории запоминаются"""
+    provider_bars = make_bars(days)  # История у провайдера
+
+    def __init__(self):
+        super().__init__('Б', 'Тест', None)
+        self.requests = []  # Запрошенные интервалы
+        self.fail = False  # Следующий запрос завершится ошибкой
+
+    def _fetch_history(self, symbol, time_frame, dt_from, dt_to):
+        if self.fail:  # Если запрос должен завершиться ошибкой
+            self.fail = False
+            raise ConnectionError('Провайдер недоступен')
+        self.requests.append((dt_from, dt_to))
+        bars = self.provider_bars.between(dt_from, dt_to)
+        return list(zip(bars.datetime.astype('datetime64[us]').tolist(), bars.open, bars.high, bars.low, bars.close, bars.volume))
+
+
+@pytest.fixture
+def broker_cls(source):
+    """Класс брокера с хранилищем в папке теста. Каждый экземпляр - как новый запуск программы"""
+    bar_cache.clear()
+    broker = type(source, (FakeBroker,), {})  # Хранилище брокера называется по имени класса
+    broker().storage.set_bars(make_bars([days[0], days[-1]]))  # В хранилище первый и последний дни
+    yield broker
+    bar_cache.clear()
+
+
+def test_missing_days_in_one_span(broker_cls):
+    """Пропущенные торговые дни подряд запрашиваются одним интервалом, после последнего бара - отдельным"""
+    broker = broker_cls()
+    bars = broker.storage.get_bars(symbol, 'M1')
+    spans = broker._missing_spans(symbol, 'M1', bars, None, dt_to)
+    assert [span_days for _, _, span_days in spans] == [[date(2025, 1, 7), date(2025, 1, 8), date(2025, 1, 9)], []]
+    assert spans[0][0] == datetime(2025, 1, 7) and spans[0][1].date() == date(2025, 1, 9)
+    assert spans[1][:2] == (bars[-1].datetime, dt_to)
+
+
+def test_empty_days_persist(broker_cls):
+    """Дни без бар у провайдера запоминаются в хранилище и не запрашиваются в следующем запуске"""
+    bars = broker_cls().sync_history(symbol, 'M1', None, dt_to)
+    assert sorted(set(bars.datetime.astype('datetime64[D]').tolist())) == days
+    bar_cache.clear()  # Новый запуск программы
+    broker = broker_cls()
+    assert broker.storage.get_empty_days(symbol.dataname, 'M1') == {date(2025, 1, 8)}
+    spans = broker._missing_spans(symbol, 'M1', broker.storage.get_bars(symbol, 'M1'), None, dt_to)
+    assert [span_days for _, _, span_days in spans] == [[]]  # Только после последнего бара
+
+
+def test_failed_fetch_not_marked(broker_cls):
+    """День без ответа провайдера не считается днем без бар"""
+    broker = broker_cls()
+    broker.fail = True
+    with pytest.raises(ConnectionError):
+        broker.sync_history(symbol, 'M1', None, dt_to)
+    assert broker.storage.get_empty_days(symbol.dataname, 'M1') == set()
+    broker.sync_history(symbol, 'M1', None, dt_to)  # Повторный запрос запрашивает те же дни
+    assert broker.requests[0][0] == datetime(2025, 1, 7)
+    assert broker.storage.get_empty_days(symbol.dataname, 'M1') == {date(2025, 1, 8)}
+
+
+def test_stocks_weekends_not_missing(source):
+    """Выходные дни акций не считаются пропусками в истории"""
+    bar_cache.clear()
+    stock = Symbol('TQBR', 'SBER', 'TQBR.SBER', 'Сбербанк', 2, 0.01, 10)
+    weekdays = [date(2025, 1, 9), date(2025, 1, 10), date(2025, 1, 13), date(2025, 1, 14)]  # Чт, Пт, Пн, Вт
+    broker = type(source, (FakeBroker,), {})()
+    broker.storage.set_bars(BarSeries.from_rows(stock.board, stock.symbol, stock.dataname, 'M1', [(datetime.combine(d, datetime.min.time()) + timedelta(hours=10, minutes=i), 100.0, 101.0, 99.0, 100.0, 1) for d in weekdays for i in range(5)]))
+    bars = broker.storage.get_bars(stock, 'M1')
+    spans = broker._missing_spans(stock, 'M1', bars, None, datetime(2025, 1, 14, 23))
+    assert all(span_days == [] for _, _, span_days in spans)  # Ни суббота, ни воскресенье не запрашиваются
+    assert all(dt_from >= bars[-1].datetime for dt_from, _, _ in spans)  # Запрашивается только история после последнего бара
+    bar_cache.clear()
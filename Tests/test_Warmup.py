@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta  # Работа с датой и временем
+import json  # Файл состояния прогрева
+from types import SimpleNamespace  # Брокер без подключения
+
+from FinLabPy.Storage.Warmup import HistoryWarmup  # Прогрев истории
+
+broker = SimpleNamespace(code='Б')  # Для ключа задания нужен только код брокера
+tasks = [(broker, dataname, 'M1') for dataname in ('TQBR.SBER', 'TQBR.GAZP')]  # Задания прогрева
+dt_from = datetime(2024, 1, 1)  # Дата начала истории
+
+
+def interrupted(state_filename):
+    """Прогрев, прерванный после первого задания"""
+    warmup = HistoryWarmup([], state_filename=state_filename)
+    warmup._load_state(tasks, dt_from)
+    warmup.state['Б|TQBR.SBER|M1'] = 10
+    warmup._save_state()
+    return warmup
+
+
+def test_same_run_resumes(tmp_path):
+    """Тот же прогрев продолжается с невыполненных заданий"""
+    state_filename = str(tmp_path / 'Warmup.json')
+    started = interrupted(state_filename).state_run['started']
+    warmup = HistoryWarmup([], state_filename=state_filename)
+    warmup._load_state(list(reversed(tasks)), dt_from)  # Порядок заданий не важен
+    assert warmup.state == {'Б|TQBR.SBER|M1': 10}
+    assert warmup.state_run['started'] == started  # Время жизни считается от начала прерванного прогрева
+
+
+def test_other_run_ignored(tmp_path):
+    """Состояние прогрева с другой датой начала истории или другими заданиями не используется"""
+    state_filename = str(tmp_path / 'Warmup.json')
+    interrupted(state_filename)
+    warmup = HistoryWarmup([], state_filename=state_filename)
+    warmup._load_state(tasks, datetime(2023, 1, 1))
+    assert warmup.state == {}
+    warmup._load_state(tasks[:1], dt_from)
+    assert warmup.state == {}
+    warmup._load_state(tasks, None)
+    assert warmup.state == {}
+
+
+def test_expired_state_ignored(tmp_path):
+    """Устаревшее состояние не используется"""
+    state_filename = str(tmp_path / 'Warmup.json')
+    interrupted(state_filename)
+    with open(state_filename, encoding='utf-8') as file:
+        saved = json.load(file)
+    saved['run']['started'] = (datetime.now() - HistoryWarmup.state_ttl - timedelta(minutes=1)).isoformat()
+    with open(state_filename, 'w', encoding='utf-8') as file:
+        json.dump(saved, file)
+    warmup = HistoryWarmup([], state_filename=state_filename)
+    warmup._load_state(tasks, dt_from)
+    assert warmup.state == {}
+
+
+def test_old_format_ignored(tmp_path):
+    """Файл состояния без описания прогрева не используется"""
+    state_filename = tmp_path / 'Warmup.json'
+    state_filename.write_text(json.dumps({'Б|TQBR.SBER|M1': 10}), encoding='utf-8')
+    warmup = HistoryWarmup([], state_filename=str(state_filename))
+    warmup._load_state(tasks, dt_from)
+    assert warmup.state == {}